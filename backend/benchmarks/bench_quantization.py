@@ -0,0 +1,109 @@
+"""Benchmark: recall@k vs memory for quantized embedding indexes with exact rescoring.
+
+Run from the repo root:
+
+    python -m backend.benchmarks.bench_quantization [--rows 20000] [--dim 1024] [--k 10]
+        [--vectors embeddings.npy]
+
+Mirrors the VECTOR_QUANTIZATION search path with brute force: rank by the compact copy
+(halfvec = float16 cosine, binary = Hamming distance over sign bits), keep
+`rescore_factor x k` candidates, re-rank them by exact float32 cosine and compare with the
+exact top k. That isolates the quantization loss from HNSW's own approximation. Without
+--vectors it uses clustered synthetic unit vectors; pass a (n, dim) .npy file of real
+embeddings for representative numbers.
+"""
+from __future__ import annotations
+
+import argparse
+from typing import Callable, Dict
+
+import numpy as np
+
+from ..services.vector_ops import l2_normalize
+
+
+def _synthetic(rows: int, dim: int, rng: np.random.Generator, clusters: int = 64) -> np.ndarray:
+    # Real embeddings cluster by topic; pure Gaussian noise would understate recall
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, rows)
+    noise = rng.standard_normal((rows, dim)).astype(np.float32)
+    return l2_normalize(centers[labels] + 0.8 * noise)
+
+
+def _top(scores: np.ndarray, n: int) -> np.ndarray:
+    # Indices of the n highest scores per row, best first
+    n = min(n, scores.shape[1])
+    part = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+    order = np.take_along_axis(scores, part, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(part, order, axis=1)
+
+
+def _rescored(
+    data: np.ndarray, queries: np.ndarray, approx_scores: np.ndarray, k: int, factor: int
+) -> np.ndarray:
+    candidates = _top(approx_scores, k * factor)
+    exact = np.einsum("qd,qcd->qc", queries, data[candidates])
+    return np.take_along_axis(candidates, _top(exact, k), axis=1)
+
+
+def _recall(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--vectors", help="optional .npy file of real embeddings (n, dim)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.vectors:
+        data = l2_normalize(np.load(args.vectors))
+    else:
+        data = _synthetic(args.rows, args.dim, rng)
+    rows, dim = data.shape
+    # Queries: perturbed copies of stored vectors, like a query phrased close to a note
+    picks = rng.integers(0, rows, args.queries)
+    queries = l2_normalize(data[picks] + 0.5 * rng.standard_normal((args.queries, dim)).astype(np.float32))
+
+    truth = _top(queries @ data.T, args.k)
+
+    half = data.astype(np.float16)
+    bits = np.packbits(data > 0, axis=1)
+    query_bits = np.packbits(queries > 0, axis=1)
+    popcount = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+    def hamming_scores() -> np.ndarray:
+        # Negated Hamming distance so larger is better, like the other scores. Chunked:
+        # the XOR intermediate is queries x rows x dim/8 bytes.
+        out = np.empty((len(queries), rows), dtype=np.int32)
+        for start in range(0, len(queries), 16):
+            xor = np.bitwise_xor(query_bits[start : start + 16, None, :], bits[None, :, :])
+            out[start : start + 16] = -popcount[xor].sum(axis=2, dtype=np.int32)
+        return out
+
+    approx: Dict[str, Callable[[], np.ndarray]] = {
+        "halfvec": lambda: (queries.astype(np.float16) @ half.T).astype(np.float32),
+        "binary": hamming_scores,
+    }
+    bytes_per_row = {"none": 4 * dim + 8, "halfvec": 2 * dim + 8, "binary": dim // 8 + 8}
+
+    print(f"rows={rows} dim={dim} queries={args.queries} k={args.k}")
+    # Vector payload per index entry plus the 8-byte tuple pointer; graph links come on top
+    # and are the same for every mode
+    print(f"{'mode':<9} {'rescore':>7} {'recall@k':>9} {'index MB':>9}")
+    mb = lambda mode: bytes_per_row[mode] * rows / 2**20  # noqa: E731
+    print(f"{'none':<9} {'-':>7} {1.0:>9.3f} {mb('none'):>9.1f}")
+    for mode, scores in approx.items():
+        approx_scores = scores()
+        for factor in (1, 2, 4, 8, 16):
+            found = _rescored(data, queries, approx_scores, args.k, factor)
+            print(f"{mode:<9} {factor:>6}x {_recall(found, truth):>9.3f} {mb(mode):>9.1f}")
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
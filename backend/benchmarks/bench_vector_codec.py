@@ -0,0 +1,91 @@
+"""Micro-benchmark: text vector literals vs the binary pgvector codec.
+
+Run from the repo root:
+
+    python -m backend.benchmarks.bench_vector_codec [--dim 1024] [--rounds 2000]
+
+The offline run times what the client does per insert/search (format or encode) and
+an approximation of what Postgres does to read it back (parse vs memcpy). Pass --db to
+round-trip through a real database using SUPABASE_DB_URL as well.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import time
+from typing import Callable
+
+import numpy as np
+
+from ..vector_codec import decode_vector, encode_vector, register_vector_codec
+
+
+def _text_literal(vec: np.ndarray) -> str:
+    # The formatting routers used before the binary codec
+    return "[" + ",".join(f"{float(x):.7f}" for x in vec) + "]"
+
+
+def _parse_literal(text: str) -> np.ndarray:
+    return np.array([float(x) for x in text[1:-1].split(",")], dtype=np.float32)
+
+
+def _bench(label: str, fn: Callable[[], object], rounds: int) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    per_call_us = (time.perf_counter() - start) / rounds * 1e6
+    print(f"{label:<32} {per_call_us:10.1f} us/op")
+    return per_call_us
+
+
+async def _bench_db(vec: np.ndarray, rounds: int) -> None:
+    import asyncpg
+
+    dsn = os.environ["SUPABASE_DB_URL"]
+    conn = await asyncpg.connect(dsn)
+    try:
+        literal = _text_literal(vec)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            await conn.fetchval("select $1::text::vector is not null", literal)
+        text_us = (time.perf_counter() - start) / rounds * 1e6
+
+        await register_vector_codec(conn)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            await conn.fetchval("select $1::vector is not null", vec)
+        binary_us = (time.perf_counter() - start) / rounds * 1e6
+    finally:
+        await conn.close()
+    print(f"{'db round-trip (text)':<32} {text_us:10.1f} us/op")
+    print(f"{'db round-trip (binary)':<32} {binary_us:10.1f} us/op")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--db", action="store_true", help="also round-trip through SUPABASE_DB_URL")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vec = rng.standard_normal(args.dim).astype(np.float32)
+    vec /= np.linalg.norm(vec)
+    literal = _text_literal(vec)
+    encoded = encode_vector(vec)
+    print(f"dim={args.dim}: text literal {len(literal)} bytes, binary {len(encoded)} bytes")
+
+    text_encode = _bench("text: format literal", lambda: _text_literal(vec), args.rounds)
+    text_decode = _bench("text: parse literal", lambda: _parse_literal(literal), args.rounds)
+    bin_encode = _bench("binary: encode", lambda: encode_vector(vec), args.rounds)
+    bin_decode = _bench("binary: decode", lambda: decode_vector(encoded), args.rounds)
+    print(f"speedup: {(text_encode + text_decode) / (bin_encode + bin_decode):.1f}x")
+
+    if args.db:
+        asyncio.run(_bench_db(vec, max(1, args.rounds // 10)))
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -10,6 +10,7 @@ from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
 import asyncpg
 
 from .settings import get_settings
+from .vector_codec import register_vector_codec
 
 try:  # Optional certifi for robust CA bundle
     import certifi  # type: ignore
@@ -17,6 +18,11 @@ except Exception:  # pragma: no cover
     certifi = None  # type: ignore
 
 
+async def _init_connection(conn: asyncpg.Connection) -> None:
+    # Embeddings travel as binary pgvector instead of ~12 KB text literals
+    await register_vector_codec(conn)
+
+
 class DatabasePool:
     """Holds a global asyncpg pool for the application lifecycle."""
 
@@ -71,6 +77,7 @@ class DatabasePool:
                 max_size=10,
                 ssl=ssl_ctx,
                 timeout=30.0,
+                init=_init_connection,
             )
             # Simple health check
             async with self._pool.acquire() as conn:
@@ -88,6 +95,7 @@ class DatabasePool:
                     max_size=10,
                     ssl=insecure_ctx,
                     timeout=30.0,
+                    init=_init_connection,
                 )
                 async with self._pool.acquire() as conn:
                     await conn.execute("select 1;")
@@ -13,6 +13,12 @@ from .routers.health import router as health_router
 from .routers.notes import router as notes_router
 from .routers.og import router as og_router
 from .routers.search import router as search_router
+from .services.chat_clients import chat_clients
+from .services.embedding_cache import close_embedding_cache
+from .services.embedding_worker import embedding_worker
+from .services.http_clients import http_clients
+from .services.local_embedder import close_local_embedder, get_local_embedder
+from .services.projection import projections
 from .settings import get_settings
 
 
@@ -43,6 +49,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["Content-Type", "Authorization"],
+    # Keyset pagination cursor for GET /api/notes; stage timings for ?debug=timings
+    expose_headers=["X-Next-Cursor", "Server-Timing"],
 )
 
 # Simple per-IP rate limiting for hot endpoints
@@ -57,11 +65,24 @@ app.add_middleware(
 @app.on_event("startup")
 async def _startup() -> None:
     await db_pool.connect()
+    # The active embedding projection (if any) is read once; restart after fitting a new one
+    async with db_pool.pool.acquire() as conn:
+        await projections.load(conn)
+    http_clients.start()
+    if (settings.embed_provider or "").strip().lower() == "local":
+        await get_local_embedder().warm_up()
+    if settings.embed_async:
+        embedding_worker.start()
 
 
 @app.on_event("shutdown")
 async def _shutdown() -> None:
+    await embedding_worker.stop()
     await db_pool.disconnect()
+    await http_clients.aclose()
+    await chat_clients.aclose()
+    close_embedding_cache()
+    close_local_embedder()
 
 
 # Routers
@@ -2,6 +2,18 @@ from __future__ import annotations
 
 from fastapi import APIRouter
 
+from ..services.chat_clients import chat_clients
+from ..services.chat_metrics import chat_metrics
+from ..services.completion_cache import get_completion_cache
+from ..services.conversation_cache import get_conversation_cache
+from ..services.embedding_cache import get_embedding_cache
+from ..services.embedding_worker import embedding_worker
+from ..services.embeddings import get_embedding_coalescer, get_provider_router
+from ..services.http_clients import http_clients
+from ..services.projection import projections
+from ..services.query_cache import get_query_cache
+from ..services.search_cache import get_search_cache
+
 router = APIRouter(prefix="/api", tags=["health"])
 
 
@@ -10,3 +22,19 @@ async def health() -> dict:
     return {"ok": True}
 
 
+@router.get("/stats")
+async def stats() -> dict:
+    return {
+        "embedding_cache": get_embedding_cache().stats(),
+        "query_embedding_cache": get_query_cache().stats(),
+        "search_result_cache": get_search_cache().stats(),
+        "conversation_cache": get_conversation_cache().stats(),
+        "completion_cache": get_completion_cache().stats(),
+        "embedding_batcher": get_embedding_coalescer().stats(),
+        "embedding_worker": embedding_worker.stats(),
+        "embedding_providers": get_provider_router().stats(),
+        "embedding_projection": projections.stats(),
+        "http_clients": http_clients.stats(),
+        "chat": chat_metrics.stats(),
+        "chat_clients": chat_clients.stats(),
+    }
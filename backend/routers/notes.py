@@ -1,34 +1,38 @@
 from __future__ import annotations
 
-import re
-from typing import Any, List, Optional, Sequence, Tuple
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
 
-from fastapi import APIRouter, HTTPException, Query
+import asyncpg
+import numpy as np
+from fastapi import APIRouter, HTTPException, Query, Response
 
 from ..db import db_pool
 from ..schemas import NoteCreate, NoteOut, NoteUpdate
-from ..services.embeddings import EmbeddingError, get_embedding
-from ..settings import get_settings
+from ..services.embedding_worker import embedding_worker
+from ..services.embeddings import (
+    DESCRIPTION_MAX_CHARS,
+    EmbeddingError,
+    clean_text,
+    embed_for_index,
+    keyless_fallback_provider,
+    note_embedding_text,
+)
 from ..services.og_scraper import fetch_og_metadata
+from ..services.projection import projections
+from ..services.retrieval import text_rank_sql, tsquery_sql
+from ..services.search_cache import notes_version
+from ..services.url_canonical import canonicalize_url
+from ..services.vector_ops import is_degenerate
+from ..settings import get_settings
 
 
 router = APIRouter(prefix="/api/notes", tags=["notes"])
 
 
-def _clean_text(value: Optional[str], *, max_len: int = 4000) -> str:
-    if not value:
-        return ""
-    text = re.sub(r"\s+", " ", value).strip()
-    if len(text) > max_len:
-        return text[:max_len]
-    return text
-
-
-def _vector_literal(vec: Sequence[float]) -> str:
-    # pgvector accepts a bracketed, comma-separated list
-    return "[" + ",".join(f"{float(x):.7f}" for x in vec) + "]"
-
-
 def _row_to_note_out(row: Any) -> NoteOut:
     return NoteOut(
         id=str(row["id"]),
@@ -41,77 +45,172 @@ def _row_to_note_out(row: Any) -> NoteOut:
     )
 
 
+NOTE_RETURNING = "returning id, url, title, description, tags, created_at, updated_at"
+
+
+def _merge_tags(current: Optional[List[str]], added: List[str]) -> List[str]:
+    return list(dict.fromkeys([*(current or []), *added]))
+
+
+def _upsert_sql(columns: List[str], values: List[str]) -> str:
+    """INSERT keyed on url_canonical; a concurrent save of the same link updates that row
+    instead, keeping the union of both tag lists."""
+    updates = [f"{c} = excluded.{c}" for c in columns if c not in ("url_canonical", "tags")]
+    updates.append(
+        "tags = array(select t from unnest(notes.tags || excluded.tags) with ordinality u(t, n) "
+        "group by t order by min(n))"
+    )
+    if "embedding" in columns and "embedding_compact_version" not in columns:
+        # The old projected vector no longer matches the new embedding
+        updates.append("embedding_compact_version = null")
+    if "embedding_status" not in columns:
+        # A fresh embedding is written: the row is done, whatever state it was in
+        updates.append("embedding_status = 'ready'")
+    # Either way a new embedding cycle starts: old failures and worker claims don't carry over
+    updates.append("embedding_attempts = 0")
+    updates.append("embedding_claimed_at = null")
+    return (
+        f"insert into public.notes ({', '.join(columns)}) values ({', '.join(values)}) "
+        f"on conflict (url_canonical) do update set {', '.join(updates)} {NOTE_RETURNING}"
+    )
+
+
+async def _retag(existing: Any, tags: List[str]) -> NoteOut:
+    # Re-shared link with the same text: nothing to scrape or embed, at most new tags
+    if tags == list(existing["tags"] or []):
+        return _row_to_note_out(existing)
+    async with db_pool.pool.acquire() as conn:
+        try:
+            row = await conn.fetchrow(
+                f"update public.notes set tags = $1::text[] where id = $2 {NOTE_RETURNING}",
+                tags,
+                existing["id"],
+            )
+        except Exception as exc:
+            raise HTTPException(status_code=500, detail=f"Failed to update note: {exc}")
+    notes_version.bump()
+    return _row_to_note_out(row if row is not None else existing)
+
+
 @router.post("", response_model=NoteOut)
 async def create_note(payload: NoteCreate) -> NoteOut:
-    settings = get_settings()
     url = str(payload.url)
+    canonical = canonicalize_url(url)
 
-    title = _clean_text(payload.title)
-    description = _clean_text(payload.description, max_len=8000)
+    title = clean_text(payload.title)
+    description = clean_text(payload.description, max_len=DESCRIPTION_MAX_CHARS)
     tags = payload.tags
 
+    # Saving a link that's already stored is one indexed lookup on url_canonical; fields
+    # left empty keep their stored values
+    async with db_pool.pool.acquire() as conn:
+        try:
+            existing = await conn.fetchrow(
+                "select id, url, title, description, tags, created_at, updated_at "
+                "from public.notes where url_canonical = $1",
+                canonical,
+            )
+        except Exception as exc:
+            raise HTTPException(status_code=500, detail=f"Failed to look up note: {exc}")
+    if existing is not None:
+        title = title or existing["title"]
+        description = description or existing["description"]
+        tags = _merge_tags(existing["tags"], tags)
+        if (title, description) == (existing["title"], existing["description"]):
+            return await _retag(existing, tags)
+
+    if get_settings().embed_async:
+        # Save now; the background worker scrapes missing metadata and embeds later
+        sql = _upsert_sql(
+            ["url", "url_canonical", "title", "description", "tags", "embedding_status"],
+            ["$1", "$2", "$3", "$4", "$5::text[]", "'pending'"],
+        )
+        async with db_pool.pool.acquire() as conn:
+            try:
+                row = await conn.fetchrow(sql, url, canonical, title or "", description or "", tags)
+            except Exception as exc:
+                raise HTTPException(status_code=500, detail=f"Failed to insert note: {exc}")
+        notes_version.bump()
+        embedding_worker.notify()
+        return _row_to_note_out(row)
+
     # Fill missing metadata via OG scraping
     if not title or not description:
         try:
             scraped = await fetch_og_metadata(url)
             if not title:
-                title = _clean_text(scraped.title)
+                title = clean_text(scraped.title)
             if not description:
-                description = _clean_text(scraped.description, max_len=8000)
+                description = clean_text(scraped.description, max_len=DESCRIPTION_MAX_CHARS)
         except Exception:
             # Non-fatal: proceed with provided fields
             pass
 
     # Ensure we have something to embed
-    base_text = _clean_text(f"{title}\n\n{description}", max_len=12000)
+    base_text = note_embedding_text(title, description)
 
     # Choose embedding strategy
-    provider = None
+    # Fallback to mock embeddings for local/dev if no provider is usable
+    provider = keyless_fallback_provider()
     api_key = None
-    if not settings.hf_api_key:
-        # Fallback to mock embeddings for local/dev if HF key is missing
-        provider = "mock"
 
     try:
-        vector = await get_embedding(base_text, provider=provider, api_key=api_key)
+        batch = await embed_for_index([base_text], provider=provider, api_key=api_key)
     except EmbeddingError as exc:
         raise HTTPException(status_code=502, detail=str(exc))
 
-    # Fit vector to DB dimension and re-normalize
-    target_dim = int(settings.embed_dimension or len(vector))
-    if len(vector) != target_dim:
-        if len(vector) > target_dim:
-            vector = vector[:target_dim]
-        else:
-            vector = list(vector) + [0.0] * (target_dim - len(vector))
-        # L2 re-normalize
-        s = sum(v * v for v in vector) or 1.0
-        inv = (1.0 / (s ** 0.5))
-        vector = [v * inv for v in vector]
-
-    vector_literal = _vector_literal(vector)
-
-    sql = (
-        "insert into public.notes (url, title, description, tags, embedding) "
-        "values ($1, $2, $3, $4::text[], $5::vector) "
-        "returning id, url, title, description, tags, created_at, updated_at"
-    )
+    # A zero/NaN vector has no cosine distance; store NULL and let keyword search find it
+    vector = batch.vectors[0]
+    embedding = None if is_degenerate(vector) else vector
+
+    params: List[Any] = [url, canonical, title or "", description or "", tags, embedding, batch.model_id]
+    columns = ["url", "url_canonical", "title", "description", "tags", "embedding", "embedding_model"]
+    values = ["$1", "$2", "$3", "$4", "$5::text[]", "$6::vector", "$7"]
+    # Keep the projected ANN column in step when a projection is active
+    compact = projections.compact(embedding, batch.model_id) if embedding is not None else None
+    if compact:
+        columns += ["embedding_compact", "embedding_compact_version"]
+        values += ["$8::vector", "$9"]
+        params.extend(compact)
     async with db_pool.pool.acquire() as conn:
         try:
-            row = await conn.fetchrow(sql, url, title or "", description or "", tags, vector_literal)
+            row = await conn.fetchrow(_upsert_sql(columns, values), *params)
         except Exception as exc:
             raise HTTPException(status_code=500, detail=f"Failed to insert note: {exc}")
 
+    # Cached search results no longer reflect the table
+    notes_version.bump()
     return _row_to_note_out(row)
 
 
+def _encode_cursor(updated_at: datetime, note_id: Any) -> str:
+    raw = json.dumps({"u": updated_at.isoformat(), "i": str(note_id)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(data["u"]), str(uuid.UUID(data["i"]))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @router.get("", response_model=List[NoteOut])
 async def list_notes(
+    response: Response,
     tags: Optional[str] = Query(default=None, description="Comma-separated list of tags (AND semantics)"),
-    q: Optional[str] = Query(default=None, description="Keyword to search via trigram similarity"),
+    q: Optional[str] = Query(default=None, description="Keywords to full-text search in title, description and URL"),
     limit: int = Query(default=50, ge=1, le=200),
     offset: int = Query(default=0, ge=0),
+    cursor: Optional[str] = Query(default=None, description="X-Next-Cursor from the previous page"),
 ) -> List[NoteOut]:
+    keyword = q.strip() if q else ""
+    if cursor and (keyword or offset):
+        # Cursors walk the (updated_at, id) order; ranked results and offsets don't have one
+        raise HTTPException(status_code=400, detail="cursor cannot be combined with q or offset")
+
     conditions: List[str] = []
     params: List[Any] = []
 
@@ -122,17 +221,22 @@ async def list_notes(
             conditions.append(f"tags @> ${len(params) + 1}::text[]")
             params.append(tag_list)
 
-    # Simple keyword search on combined title+description using ILIKE
-    order_by = "updated_at desc"
-    if q:
-        # Use ILIKE for case-insensitive search - works without extensions
-        search_term = f"%{q}%"
+    # Keyset pagination: rows strictly after the previous page's last (updated_at, id),
+    # served by notes_updated_at_id so every page costs the same
+    if cursor:
+        after_updated_at, after_id = _decode_cursor(cursor)
         conditions.append(
-            f"(coalesce(title,'') ILIKE ${len(params) + 1} OR coalesce(description,'') ILIKE ${len(params) + 1} OR coalesce(url,'') ILIKE ${len(params) + 1})"
+            f"(updated_at, id) < (${len(params) + 1}::timestamptz, ${len(params) + 2}::uuid)"
         )
-        params.append(search_term)
-        # For now, keep simple order by updated_at - we can add ranking later if needed
-        order_by = "updated_at desc"
+        params.extend([after_updated_at, after_id])
+
+    # Full-text search on the generated search_tsv column (GIN-indexed), best matches first
+    order_by = "updated_at desc, id desc"
+    if keyword:
+        q_idx = f"${len(params) + 1}"
+        conditions.append(f"search_tsv @@ {tsquery_sql(q_idx)}")
+        params.append(keyword)
+        order_by = f"{text_rank_sql(q_idx)} desc, updated_at desc"
 
     where_clause = f" where {' and '.join(conditions)}" if conditions else ""
     sql = (
@@ -150,6 +254,11 @@ async def list_notes(
         except Exception as exc:
             raise HTTPException(status_code=500, detail=f"Failed to list notes: {exc}")
 
+    # A full page may have a successor; ranked keyword results aren't cursor-paginated
+    if rows and len(rows) == limit and not keyword:
+        last = rows[-1]
+        response.headers["X-Next-Cursor"] = _encode_cursor(last["updated_at"], last["id"])
+
     return [_row_to_note_out(r) for r in rows]
 
 
@@ -165,9 +274,9 @@ async def update_note(note_id: str, payload: NoteUpdate) -> NoteOut:
             raise HTTPException(status_code=404, detail="Note not found")
 
         new_url = str(payload.url) if payload.url is not None else current["url"]
-        new_title = _clean_text(payload.title) if payload.title is not None else current["title"]
+        new_title = clean_text(payload.title) if payload.title is not None else current["title"]
         new_description = (
-            _clean_text(payload.description, max_len=8000)
+            clean_text(payload.description, max_len=DESCRIPTION_MAX_CHARS)
             if payload.description is not None
             else current["description"]
         )
@@ -175,29 +284,20 @@ async def update_note(note_id: str, payload: NoteUpdate) -> NoteOut:
 
         # Determine if embedding must be recomputed
         needs_reembed = (new_title != current["title"]) or (new_description != current["description"])
-        vector_literal: Optional[str] = None
-        if needs_reembed:
-            settings = get_settings()
-            base_text = _clean_text(f"{new_title}\n\n{new_description}", max_len=12000)
-            provider = None
+        embed_async = get_settings().embed_async
+        embedding: Optional[np.ndarray] = None
+        embedding_model: Optional[str] = None
+        if needs_reembed and not embed_async:
+            base_text = note_embedding_text(new_title, new_description)
+            provider = keyless_fallback_provider()
             api_key = None
-            if not settings.hf_api_key:
-                provider = "mock"
             try:
-                vector = await get_embedding(base_text, provider=provider, api_key=api_key)
+                batch = await embed_for_index([base_text], provider=provider, api_key=api_key)
             except EmbeddingError as exc:
                 raise HTTPException(status_code=502, detail=str(exc))
-            # Fit to DB dimension and re-normalize
-            target_dim = int(settings.embed_dimension or len(vector))
-            if len(vector) != target_dim:
-                if len(vector) > target_dim:
-                    vector = vector[:target_dim]
-                else:
-                    vector = list(vector) + [0.0] * (target_dim - len(vector))
-                s = sum(v * v for v in vector) or 1.0
-                inv = (1.0 / (s ** 0.5))
-                vector = [v * inv for v in vector]
-            vector_literal = _vector_literal(vector)
+            embedding_model = batch.model_id
+            if not is_degenerate(batch.vectors[0]):
+                embedding = batch.vectors[0]
 
         # Build dynamic update statement
         fields: List[str] = []
@@ -211,9 +311,30 @@ async def update_note(note_id: str, payload: NoteUpdate) -> NoteOut:
         params.append(new_description)
         fields.append(f"tags = ${len(params) + 1}::text[]")
         params.append(new_tags)
-        if vector_literal is not None:
+        fields.append(f"url_canonical = ${len(params) + 1}")
+        params.append(canonicalize_url(new_url))
+        if needs_reembed and embed_async:
+            # Keep the old vector for search until the worker replaces it. Clearing the claim
+            # stamp makes a worker already embedding the old text drop its write-back
+            fields.append("embedding_status = 'pending'")
+            fields.append("embedding_attempts = 0")
+            fields.append("embedding_claimed_at = null")
+        elif needs_reembed:
             fields.append(f"embedding = ${len(params) + 1}::vector")
-            params.append(vector_literal)
+            params.append(embedding)
+            fields.append(f"embedding_model = ${len(params) + 1}")
+            params.append(embedding_model)
+            fields.append("embedding_status = 'ready'")
+            fields.append("embedding_attempts = 0")
+            fields.append("embedding_claimed_at = null")
+            compact = projections.compact(embedding, embedding_model) if embedding is not None else None
+            if compact:
+                fields.append(f"embedding_compact = ${len(params) + 1}::vector")
+                fields.append(f"embedding_compact_version = ${len(params) + 2}")
+                params.extend(compact)
+            else:
+                # The old projected vector no longer matches the note
+                fields.append("embedding_compact_version = null")
 
         sql = (
             "update public.notes set "
@@ -224,11 +345,16 @@ async def update_note(note_id: str, payload: NoteUpdate) -> NoteOut:
 
         try:
             row = await conn.fetchrow(sql, *params)
+        except asyncpg.UniqueViolationError:
+            raise HTTPException(status_code=409, detail="Another note already has this URL")
         except Exception as exc:
             raise HTTPException(status_code=500, detail=f"Failed to update note: {exc}")
 
     if row is None:
         raise HTTPException(status_code=404, detail="Note not found")
+    notes_version.bump()
+    if needs_reembed and embed_async:
+        embedding_worker.notify()
 
     return _row_to_note_out(row)
 
@@ -240,6 +366,7 @@ async def delete_note(note_id: str) -> dict:
             result = await conn.execute("delete from public.notes where id = $1", note_id)
         except Exception as exc:
             raise HTTPException(status_code=500, detail=f"Failed to delete note: {exc}")
+    notes_version.bump()
 
     # asyncpg returns a status string like "DELETE 1"
     if not result.startswith("DELETE"):
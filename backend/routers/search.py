@@ -1,37 +1,56 @@
 from __future__ import annotations
 
-import re
-from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
-
-from fastapi import APIRouter, HTTPException
+import asyncio
+import json
+import secrets
+import time
+from dataclasses import dataclass
+from typing import Annotated, Any, AsyncIterator, Dict, List, Literal, Optional, Tuple
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import JSONResponse
 from sse_starlette.sse import EventSourceResponse
 
 from ..db import db_pool
 from ..schemas import (
     ChatRequest,
     NoteOut,
+    SearchBatchRequest,
     SearchRequest,
     SearchResultItem,
 )
-from ..services.embeddings import EmbeddingError, get_embedding
-from ..services.chat_providers import ChatMessage, ChatProviderError, stream_chat_tokens
+from ..services.embeddings import (
+    NOTE_TEXT_MAX_CHARS,
+    EmbeddingError,
+    clean_text,
+    configured_model_id,
+    embed_for_index,
+    keyless_fallback_provider,
+)
+from ..services.chat_metrics import chat_metrics
+from ..services.chat_providers import (
+    WARMUP_GRACE,
+    ChatMessage,
+    ChatProviderError,
+    stream_chat_tokens,
+    warm_up_chat_provider,
+)
+from ..services.completion_cache import get_completion_cache
+from ..services.context_packer import MESSAGE_OVERHEAD, estimate_tokens, pack_context
+from ..services.conversation_cache import get_conversation_cache
+from ..services.projection import projections
+from ..services.query_cache import get_query_cache
+from ..services.retrieval import batch_search_sql, candidate_count, hybrid_search_sql, scan_settings_sql
+from ..services.search_cache import get_search_cache, notes_version
+from ..services.timing import StageTimer
+from ..services.vector_ops import is_degenerate
 from ..settings import get_settings
 
 
 router = APIRouter(prefix="/api", tags=["search", "chat"])
 
-
-def _clean_text(value: Optional[str], *, max_len: int = 12000) -> str:
-    if not value:
-        return ""
-    text = re.sub(r"\s+", " ", value).strip()
-    if len(text) > max_len:
-        return text[:max_len]
-    return text
-
-
-def _vector_literal(vec: Sequence[float]) -> str:
-    return "[" + ",".join(f"{float(x):.7f}" for x in vec) + "]"
+# `?debug=` modes: per-stage timings, or timings plus EXPLAIN ANALYZE (needs ADMIN_TOKEN)
+DebugMode = Literal["timings", "explain"]
 
 
 def _row_to_note_out(row: Any) -> NoteOut:
@@ -46,137 +65,390 @@ def _row_to_note_out(row: Any) -> NoteOut:
     )
 
 
-@router.post("/search", response_model=List[SearchResultItem])
-async def semantic_search(payload: SearchRequest) -> List[SearchResultItem]:
-    settings = get_settings()
-    query_text = _clean_text(payload.query)
-    if not query_text:
-        return []
+async def _embed_queries(texts: List[str]) -> List[Tuple[Any, str]]:
+    """Embed search queries, serving repeats from the in-process query cache.
 
+    Cache misses go upstream in a single batch. Returns the fitted vector and the
+    provider:model id it came from for each text, in order.
+    """
+    cache = get_query_cache()
     # Compute embedding with graceful fallback per settings
-    provider = None
-    api_key = None
-    if not settings.hf_api_key and not settings.openai_api_key:
-        provider = "mock"
-
-    try:
-        qvec = await get_embedding(query_text, provider=provider, api_key=api_key)
-    except EmbeddingError as exc:
-        raise HTTPException(status_code=502, detail=str(exc))
-
-    # Fit vector to DB dimension and re-normalize
-    target_dim = int(settings.embed_dimension or len(qvec))
-    if len(qvec) != target_dim:
-        if len(qvec) > target_dim:
-            qvec = qvec[:target_dim]
-        else:
-            qvec = list(qvec) + [0.0] * (target_dim - len(qvec))
-        # L2 re-normalize
-        s = sum(v * v for v in qvec) or 1.0
-        inv = (1.0 / (s ** 0.5))
-        qvec = [v * inv for v in qvec]
-
-    qvec_literal = _vector_literal(qvec)
+    provider = keyless_fallback_provider()
+    active_model = configured_model_id()
+    found: Dict[str, Tuple[Any, str]] = {}
+    for text in texts:
+        cached = cache.get(text, active_model)
+        if cached is not None:
+            found[text] = (cached, active_model)
+    missing = list(dict.fromkeys(t for t in texts if t not in found))
+    if missing:
+        try:
+            # Queries may be hedged against a fallback provider; writes never are
+            qbatch = await embed_for_index(missing, provider=provider, api_key=None, hedge=True)
+        except EmbeddingError as exc:
+            raise HTTPException(status_code=502, detail=str(exc))
+        for text, qvec in zip(missing, qbatch.vectors):
+            found[text] = (qvec, qbatch.model_id)
+            # Only cache vectors from the active model; a failover answer shouldn't outlive the outage
+            if qbatch.model_id == active_model:
+                cache.put(text, active_model, qvec)
+    return [found[text] for text in texts]
+
+
+@dataclass
+class _PreparedSearch:
+    query_text: str
+    top_k: int
+    hybrid: float
+    fusion: str
+    tags: Optional[List[str]]
+    ef_search: Optional[int]
+    probes: Optional[int]
+    cache_key: Tuple[Any, ...]
+
+
+def _prepare_search(
+    query: Optional[str],
+    *,
+    active_model: str,
+    tags: Optional[List[str]] = None,
+    top_k: Optional[int] = 10,
+    hybrid_weight: Optional[float] = 0.7,
+    fusion: Optional[str] = "weighted",
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+) -> Optional[_PreparedSearch]:
+    """Clamp search parameters; None when there's nothing to search for."""
+    query_text = clean_text(query, max_len=NOTE_TEXT_MAX_CHARS)
+    if not query_text:
+        return None
 
-    hybrid = 0.7 if payload.hybridWeight is None else float(payload.hybridWeight)
+    hybrid = 0.7 if hybrid_weight is None else float(hybrid_weight)
     hybrid = 0.0 if hybrid < 0 else (1.0 if hybrid > 1.0 else hybrid)
-    top_k = int(payload.topK or 10)
+    top_k = int(top_k or 10)
     if top_k < 1:
         top_k = 1
     if top_k > 200:
         top_k = 200
+    fusion = fusion or "weighted"
+
+    cache_key = get_search_cache().key(
+        query=query_text,
+        tags=tags,
+        top_k=top_k,
+        hybrid_weight=hybrid,
+        model_id=active_model,
+        extra=(fusion, ef_search, probes),
+    )
+    return _PreparedSearch(
+        query_text=query_text,
+        top_k=top_k,
+        hybrid=hybrid,
+        fusion=fusion,
+        tags=list(tags) if tags else None,
+        ef_search=ef_search,
+        probes=probes,
+        cache_key=cache_key,
+    )
 
-    # Build dynamic SQL with optional tag filter and hybrid ranking
-    conditions: List[str] = []
-    params: List[Any] = []
 
-    if payload.tags:
-        conditions.append(f"tags @> ${len(params) + 1}::text[]")
-        params.append(list(payload.tags))
+def _prepare(payload: SearchRequest, active_model: str) -> Optional[_PreparedSearch]:
+    return _prepare_search(
+        payload.query,
+        active_model=active_model,
+        tags=payload.tags,
+        top_k=payload.topK,
+        hybrid_weight=payload.hybridWeight,
+        fusion=payload.fusion,
+        ef_search=payload.efSearch,
+        probes=payload.probes,
+    )
 
-    where_clause = f" where {' and '.join(conditions)}" if conditions else ""
 
-    # vector_cosine_ops: distance smaller means more similar. Convert to similarity 1 - dist.
-    # trigram similarity on combined text
-    score_expr = (
-        f"({hybrid:.6f}) * coalesce(1.0 - (embedding <=> ${len(params) + 1}::vector), 0.0) + "
-        f"({1.0 - hybrid:.6f}) * similarity((coalesce(title,'') || ' ' || coalesce(description,'')), ${len(params) + 2})"
-    )
-    params.append(qvec_literal)
-    params.append(query_text)
-
-    sql = (
-        "select id, url, title, description, tags, created_at, updated_at, "
-        f"{score_expr} as score "
-        "from public.notes"
-        f"{where_clause} "
-        f"order by score desc limit ${len(params) + 1}"
-    )
-    params.append(top_k)
+def _vector_index_options() -> Dict[str, Any]:
+    settings = get_settings()
+    return {
+        "quantization": (settings.vector_quantization or "none").lower(),
+        "rescore_factor": max(1, settings.vector_rescore_factor),
+        "dimension": settings.embed_dimension,
+    }
+
+
+def _index_fetch_count(top_k: int) -> int:
+    # Quantized and projected indexes over-fetch rescore_factor x the candidates
+    options = _vector_index_options()
+    compact_index = options["quantization"] != "none" or projections.active is not None
+    factor = options["rescore_factor"] if compact_index else 1
+    return candidate_count(top_k) * factor
 
+
+def _scan_knobs(searches: List[_PreparedSearch]) -> str:
+    # HNSW returns at most ef_search rows per scan, so by default make room for every
+    # candidate. Tag filters discard rows after the index scan; iterate to refill them.
+    settings = get_settings()
+    ef_search = max(
+        s.ef_search or max(settings.hnsw_ef_search, _index_fetch_count(s.top_k)) for s in searches
+    )
+    probes = max((s.probes for s in searches if s.probes), default=None)
+    iterative = settings.vector_iterative_scan if any(s.tags for s in searches) else None
+    return scan_settings_sql(ef_search=ef_search, probes=probes, iterative_scan=iterative)
+
+
+async def _fetch_search_rows(
+    knobs: str,
+    sql: str,
+    params: List[Any],
+    *,
+    timer: Optional[StageTimer] = None,
+    explain: bool = False,
+) -> Tuple[List[Any], Optional[Any]]:
+    """Run a search statement under its index knobs; returns the rows and, with `explain`,
+    the EXPLAIN (ANALYZE, BUFFERS) plan of the same statement."""
+    timer = timer or StageTimer()
+    plan: Optional[Any] = None
+    waited = time.perf_counter()
     async with db_pool.pool.acquire() as conn:
+        timer.add("acquire", (time.perf_counter() - waited) * 1000.0)
         try:
-            rows = await conn.fetch(sql, *params)
+            # SET LOCAL only lasts until commit, so pooled connections stay untouched
+            async with conn.transaction():
+                with timer.stage("sql"):
+                    await conn.execute(knobs)
+                    rows = await conn.fetch(sql, *params)
+                if explain:
+                    # Runs the query a second time, so buffer counts reflect a warm cache
+                    with timer.stage("explain"):
+                        raw = await conn.fetchval(f"explain (analyze, buffers, format json) {sql}", *params)
+                    plan = json.loads(raw) if isinstance(raw, str) else raw
         except Exception as exc:
             raise HTTPException(status_code=500, detail=f"Failed to search notes: {exc}")
+    return rows, plan
+
+
+def _check_debug(debug: Optional[str], admin_token: Optional[str]) -> None:
+    # EXPLAIN ANALYZE executes the query again and exposes the schema, so it's admin-only
+    if debug != "explain":
+        return
+    expected = get_settings().admin_token
+    if not expected or not admin_token or not secrets.compare_digest(admin_token, expected):
+        raise HTTPException(status_code=403, detail="debug=explain requires a valid X-Admin-Token")
+
+
+async def _search_rows(
+    search: _PreparedSearch, timer: StageTimer, *, explain: bool = False
+) -> Tuple[List[Any], Optional[Any]]:
+    """Hybrid search rows for one prepared search, timing each stage into `timer`.
+
+    Rows are what both /search (as SearchResultItem) and /chat (straight into the prompt)
+    consume, so they are also what the result cache holds. With `explain` the cache is
+    bypassed so the plan of the generated SQL can be captured; the plan is None otherwise.
+    """
+    active_model = configured_model_id()
+    # Repeated searches skip both the embedding call and the SQL while no note has changed
+    result_cache = get_search_cache()
+    version = notes_version.value
+    if not explain:
+        with timer.stage("cache"):
+            cached = result_cache.get(search.cache_key)
+        timer.info["cached"] = cached is not None
+        if cached is not None:
+            return cached, None
+
+    with timer.stage("embed"):
+        [(qvec, qmodel)] = await _embed_queries([search.query_text])
+
+    # NULL query vector disables the vector branch, i.e. keyword-only ranking
+    qvec_param = None if is_degenerate(qvec) else qvec
+
+    # Optional tag filter goes first; both retrieval branches apply it
+    params: List[Any] = []
+    tags_idx: Optional[str] = None
+    if search.tags:
+        params.append(search.tags)
+        tags_idx = f"${len(params)}"
+
+    # Rows without a comparable embedding (still waiting for the worker, or embedded by a
+    # different model than the query) only come back through the keyword branch. Rows from
+    # before embedding_model existed count as the configured model.
+    base = len(params)
+    # With an active projection, candidates come from the compact index, reranked on the
+    # full vector
+    compact = projections.compact(qvec, qmodel) if qvec_param is not None else None
+    sql = hybrid_search_sql(
+        vec=f"${base + 1}",
+        query=f"${base + 2}",
+        limit=f"${base + 3}",
+        candidates=f"${base + 4}",
+        model=f"${base + 5}",
+        default_model=f"${base + 6}",
+        tags=tags_idx,
+        weight=search.hybrid,
+        fusion=search.fusion,
+        compact_vec=f"${base + 7}" if compact else None,
+        compact_version=f"${base + 8}" if compact else None,
+        **_vector_index_options(),
+    )
+    params.extend(
+        [qvec_param, search.query_text, search.top_k, candidate_count(search.top_k), qmodel, active_model]
+    )
+    if compact:
+        params.extend(compact)
 
-    results: List[SearchResultItem] = []
-    for r in rows:
-        results.append(
-            SearchResultItem(note=_row_to_note_out(r), score=float(r["score"]))
-        )
-    return results
+    rows, plan = await _fetch_search_rows(
+        _scan_knobs([search]), sql, params, timer=timer, explain=explain
+    )
+    timer.info["rows"] = len(rows)
+    # Results ranked with a failover model's query vector aren't cached
+    if qmodel == active_model:
+        result_cache.put(search.cache_key, rows, version=version)
+    return rows, plan
 
 
-def _build_citation_context(items: List[SearchResultItem]) -> Tuple[str, List[Dict[str, str]]]:
-    citations: List[Dict[str, str]] = []
-    parts: List[str] = []
-    for idx, item in enumerate(items, start=1):
-        n = item.note
-        citations.append({"id": n.id, "title": n.title, "url": n.url})
-        parts.append(f"[{idx}] {n.title}\n{n.description}\nSource: {n.url}")
-    context = "\n\n".join(parts)
-    return context, citations
+def _to_result_items(rows: List[Any]) -> List[SearchResultItem]:
+    return [SearchResultItem(note=_row_to_note_out(r), score=float(r["score"])) for r in rows]
 
 
-@router.post("/chat")
-async def rag_chat(payload: ChatRequest):
-    settings = get_settings()
+@router.post("/search", response_model=List[SearchResultItem])
+async def semantic_search(
+    payload: SearchRequest,
+    debug: Optional[DebugMode] = None,
+    x_admin_token: Annotated[Optional[str], Header()] = None,
+):
+    """Hybrid search. `debug=timings` wraps the results as {"results", "timings"} and adds
+    a Server-Timing header; `debug=explain` (admin only) also returns the query plan."""
+    _check_debug(debug, x_admin_token)
+    timer = StageTimer()
+    search = _prepare(payload, configured_model_id())
+    rows: List[Any] = []
+    plan: Optional[Any] = None
+    if search is not None:
+        rows, plan = await _search_rows(search, timer, explain=debug == "explain")
+    with timer.stage("serialize"):
+        results = _to_result_items(rows)
+        if debug is not None:
+            body: Dict[str, Any] = {"results": [item.model_dump() for item in results]}
+    if debug is None:
+        return results
+
+    body["timings"] = timer.breakdown()
+    if debug == "explain":
+        body["plan"] = plan
+    return JSONResponse(body, headers={"Server-Timing": timer.server_timing()})
+
+
+@router.post("/search/batch", response_model=List[List[SearchResultItem]])
+async def batch_search(payload: SearchBatchRequest) -> List[List[SearchResultItem]]:
+    """Run several searches with one embedding call and one SQL round-trip.
+
+    Results are returned in request order; cached searches are answered without touching
+    the embedding provider or the database.
+    """
+    active_model = configured_model_id()
+    result_cache = get_search_cache()
+    version = notes_version.value
+
+    found: List[List[Any]] = [[] for _ in payload.searches]
+    pending: List[Tuple[int, _PreparedSearch]] = []
+    for index, request in enumerate(payload.searches):
+        search = _prepare(request, active_model)
+        if search is None:
+            continue
+        cached = result_cache.get(search.cache_key)
+        if cached is not None:
+            found[index] = cached
+        else:
+            pending.append((index, search))
+    if not pending:
+        return [_to_result_items(rows) for rows in found]
 
-    # Extract the latest user message to embed
-    user_messages = [m for m in payload.messages if (m.role or "").lower() == "user"]
-    latest_user = user_messages[-1].content if user_messages else ""
-    latest_user = _clean_text(latest_user)
+    embedded = await _embed_queries([search.query_text for _, search in pending])
 
-    # Retrieve topK context using the same hybrid search
-    search_req = SearchRequest(
-        query=latest_user or "",
-        tags=payload.tags,
-        topK=payload.topK or 5,
-        hybridWeight=0.7,
+    # The projected index serves the whole batch only if it applies to every query vector
+    usable = [None if is_degenerate(qvec) else qvec for qvec, _ in embedded]
+    compacts = [
+        projections.compact(qvec, qmodel) if qvec is not None else None
+        for qvec, (_, qmodel) in zip(usable, embedded)
+    ]
+    use_compact = projections.active is not None and all(
+        c is not None for c, qvec in zip(compacts, usable) if qvec is not None
     )
-    search_results = await semantic_search(search_req) if latest_user else []
 
-    context_block, citations = _build_citation_context(search_results)
+    params: List[Any] = []
+    for (index, search), qvec, (_, qmodel), compact in zip(pending, usable, embedded, compacts):
+        params.extend(
+            [
+                index,
+                qvec,
+                search.query_text,
+                search.top_k,
+                candidate_count(search.top_k),
+                search.tags or [],
+                search.hybrid,
+                search.fusion == "rrf",
+                qmodel,
+                compact[0] if use_compact and compact else None,
+            ]
+        )
+    params.append(active_model)
+    if use_compact:
+        params.append(projections.active.version)  # type: ignore[union-attr]
 
-    # Construct messages with context and citation instructions
-    system_prefix = (
-        "You are a helpful assistant. Use the provided notes as context. "
-        "Cite sources inline using [n] where n is the citation number. If the answer is unknown, say so."
-    )
-    context_instruction = (
-        "Context notes (use them to answer and include citation numbers):\n" + context_block
-        if context_block
-        else "No context available. Answer from general knowledge."
+    searches = [search for _, search in pending]
+    sql = batch_search_sql(len(pending), compact=use_compact, **_vector_index_options())
+    rows, _ = await _fetch_search_rows(_scan_knobs(searches), sql, params)
+    for r in rows:
+        found[int(r["ord"])].append(r)
+
+    for (index, search), (_, qmodel) in zip(pending, embedded):
+        if qmodel == active_model:
+            result_cache.put(search.cache_key, found[index], version=version)
+    return [_to_result_items(rows) for rows in found]
+
+
+async def _chat_rows(
+    conversation_id: Optional[str], search: _PreparedSearch, timer: StageTimer, *, explain: bool = False
+) -> Tuple[List[Any], Optional[Any]]:
+    """Retrieval for a chat turn, through the conversation's session when it has one.
+
+    A repeated retrieval in the conversation skips embedding and SQL; a new one is merged
+    with the notes earlier turns retrieved (at decayed scores), up to twice topK rows.
+    """
+    if conversation_id is None:
+        return await _search_rows(search, timer, explain=explain)
+    sessions = get_conversation_cache()
+    with timer.stage("cache"):
+        rows = sessions.lookup(conversation_id, search.cache_key)
+    timer.info["conversation_hit"] = rows is not None
+    if rows is not None:
+        return rows, None
+    version = notes_version.value
+    rows, plan = await _search_rows(search, timer, explain=explain)
+    merged = sessions.extend(
+        conversation_id, search.cache_key, rows, version=version, limit=2 * search.top_k
     )
+    return merged, plan
 
-    chat_messages: List[ChatMessage] = [
-        ChatMessage(role="system", content=system_prefix),
-        ChatMessage(role="system", content=context_instruction),
-    ]
-    # Append user/assistant history
-    for m in payload.messages:
-        chat_messages.append(ChatMessage(role=m.role, content=m.content))
+
+CHAT_SYSTEM_PROMPT = (
+    "You are a helpful assistant. Use the provided notes as context. "
+    "Cite sources inline using [n] where n is the citation number. If the answer is unknown, say so."
+)
+CONTEXT_HEADER = "Context notes (use them to answer and include citation numbers):\n"
+NO_CONTEXT = "No context available. Answer from general knowledge."
+
+
+@router.post("/chat")
+async def rag_chat(
+    payload: ChatRequest,
+    debug: Optional[DebugMode] = None,
+    x_admin_token: Annotated[Optional[str], Header()] = None,
+):
+    """RAG chat over SSE. With `debug`, retrieval stages go in a Server-Timing header and
+    the full breakdown (plus generation timings and, for `explain`, the plan) in the
+    final `done` event."""
+    _check_debug(debug, x_admin_token)
+    settings = get_settings()
+    timer = StageTimer()
 
     provider = (payload.provider or "groq").lower()
     model = payload.model or "openai/gpt-oss-120b"
@@ -189,25 +461,129 @@ async def rag_chat(payload: ChatRequest):
     elif provider == "openrouter" and settings.openrouter_api_key:
         api_key = settings.openrouter_api_key
 
+    # Connect to the provider while retrieval runs; the stream then reuses the pooled connection
+    warm_up = asyncio.create_task(warm_up_chat_provider(provider, api_key))
+    try:
+        # Extract the latest user message to embed
+        user_messages = [m for m in payload.messages if (m.role or "").lower() == "user"]
+        latest_user = user_messages[-1].content if user_messages else ""
+
+        # Retrieve topK context using the same hybrid search; rows go straight into the prompt
+        search = _prepare_search(
+            latest_user, active_model=configured_model_id(), tags=payload.tags, top_k=payload.topK or 5
+        )
+        rows: List[Any] = []
+        plan: Optional[Any] = None
+        conversation = payload.conversationId if debug != "explain" else None
+        if search is not None:
+            rows, plan = await _chat_rows(conversation, search, timer, explain=debug == "explain")
+
+        # Fit notes and history into the model's prompt budget: best-scored notes first,
+        # oldest turns dropped first
+        history = [ChatMessage(role=m.role, content=m.content) for m in payload.messages]
+        with timer.stage("pack"):
+            packed = pack_context(
+                rows,
+                history,
+                budget=settings.chat_context_budget(model),
+                reserved_tokens=estimate_tokens(CHAT_SYSTEM_PROMPT) + estimate_tokens(CONTEXT_HEADER)
+                + 2 * MESSAGE_OVERHEAD,
+                max_note_tokens=settings.chat_note_max_tokens,
+            )
+        citations = packed.citations
+        context_instruction = (
+            CONTEXT_HEADER + packed.context_block if packed.context_block else NO_CONTEXT
+        )
+
+        # Construct messages with context and citation instructions, then the kept history
+        chat_messages: List[ChatMessage] = [
+            ChatMessage(role="system", content=CHAT_SYSTEM_PROMPT),
+            ChatMessage(role="system", content=context_instruction),
+            *packed.history,
+        ]
+
+        # Opt-in completion cache: the same prompt over the same note versions replays the
+        # earlier answer instead of calling the provider
+        completions = get_completion_cache() if settings.chat_cache_enabled else None
+        completion_key: Optional[str] = None
+        replay: Optional[Tuple[str, ...]] = None
+        if completions is not None:
+            updated = {str(r["id"]): r["updated_at"].isoformat() for r in rows}
+            completion_key = completions.key(
+                provider=provider,
+                model=model,
+                messages=chat_messages,
+                notes=[(c["id"], updated[c["id"]]) for c in citations],
+            )
+            replay = completions.get(completion_key)
+            if replay is not None:
+                warm_up.cancel()
+        timer.info["completion_cached"] = replay is not None
+
+        # Headers go out before the first token, so they only carry the retrieval stages
+        headers = {"Server-Timing": timer.server_timing()} if debug else None
+    except BaseException:
+        # Anything failing before the stream takes over must not orphan the warm-up
+        warm_up.cancel()
+        raise
+
     async def event_generator() -> AsyncIterator[Dict[str, str] | str]:
         try:
-            async for token in stream_chat_tokens(
-                provider=provider, model=model, messages=chat_messages, api_key=api_key
-            ):
-                # Stream raw tokens
-                yield token
-        except ChatProviderError as exc:
-            # Surface provider errors to the client as an SSE error event
-            yield {"event": "error", "data": str(exc)}
-            return
-        # Final event with citations metadata
-        import json as _json
-
-        yield {
-            "event": "done",
-            "data": _json.dumps({"citations": citations}),
-        }
-
-    return EventSourceResponse(event_generator())
+            if replay is not None:
+                # Same token chunks as the original stream, then the usual done event
+                for token in replay:
+                    yield token
+            else:
+                with timer.stage("connect"):
+                    # A slow or hanging warm-up must not delay the request it was meant to speed up
+                    await asyncio.wait({warm_up}, timeout=WARMUP_GRACE)
+                    warm_up.cancel()
+                generate_started = time.perf_counter()
+                first_token = True
+                streamed: List[str] = []
+                try:
+                    async for token in stream_chat_tokens(
+                        provider=provider, model=model, messages=chat_messages, api_key=api_key
+                    ):
+                        if first_token:
+                            now = time.perf_counter()
+                            timer.add("first_token", (now - generate_started) * 1000.0)
+                            # Time to first token counts from request arrival: what the user waits for
+                            chat_metrics.record_ttft(provider, now - timer.started)
+                            timer.info["ttft_ms"] = round((now - timer.started) * 1000.0, 3)
+                            first_token = False
+                        if completion_key is not None:
+                            streamed.append(token)
+                        # Stream raw tokens
+                        yield token
+                except ChatProviderError as exc:
+                    chat_metrics.record_error(provider)
+                    # Surface provider errors to the client as an SSE error event
+                    yield {"event": "error", "data": str(exc)}
+                    return
+                timer.add("generate", (time.perf_counter() - generate_started) * 1000.0)
+                # Only complete answers are cached; an aborted stream never reaches this point
+                if completions is not None and completion_key is not None:
+                    completions.put(completion_key, streamed)
+            # Final event with citations metadata
+            done: Dict[str, Any] = {
+                "citations": citations,
+                "usage": packed.usage,
+                "cached": replay is not None,
+            }
+            if debug:
+                done["timings"] = timer.breakdown()
+            if debug == "explain":
+                done["plan"] = plan
+
+            yield {
+                "event": "done",
+                "data": json.dumps(done),
+            }
+        finally:
+            # Covers replays, provider errors and clients that disconnect mid-stream
+            warm_up.cancel()
+
+    return EventSourceResponse(event_generator(), headers=headers)
 
 
@@ -1,8 +1,8 @@
 from __future__ import annotations
 
-from typing import List, Optional
+from typing import List, Literal, Optional
 
-from pydantic import BaseModel, HttpUrl, field_validator
+from pydantic import BaseModel, Field, HttpUrl, field_validator
 
 
 class NoteCreate(BaseModel):
@@ -39,6 +39,11 @@ class SearchRequest(BaseModel):
     tags: Optional[List[str]] = None
     topK: Optional[int] = 10
     hybridWeight: Optional[float] = 0.7
+    # How vector and keyword candidates are combined: blended scores or reciprocal ranks
+    fusion: Optional[Literal["weighted", "rrf"]] = "weighted"
+    # Per-request vector index knobs: higher means better recall, slower search
+    efSearch: Optional[int] = Field(default=None, ge=1, le=1000)
+    probes: Optional[int] = Field(default=None, ge=1, le=1000)
 
     @field_validator("tags")
     @classmethod
@@ -48,6 +53,11 @@ class SearchRequest(BaseModel):
         return [t.strip() for t in v if t and t.strip()]
 
 
+class SearchBatchRequest(BaseModel):
+    # Answered with one list of results per search, in the same order
+    searches: List[SearchRequest] = Field(min_length=1, max_length=20)
+
+
 class SearchResultItem(BaseModel):
     note: NoteOut
     score: float
@@ -64,6 +74,8 @@ class ChatRequest(BaseModel):
     tags: Optional[List[str]] = None
     provider: Optional[str] = "groq"
     model: Optional[str] = "openai/gpt-oss-120b"
+    # Opaque client-chosen id; follow-up turns reuse and extend the earlier retrieval
+    conversationId: Optional[str] = Field(default=None, min_length=1, max_length=128)
 
     @field_validator("tags")
     @classmethod
@@ -0,0 +1,77 @@
+"""Fill notes.url_canonical for rows saved before URL dedupe existed.
+
+Run from the repo root after applying supabase/schema.sql:
+
+    python -m backend.scripts.backfill_url_canonical [--merge]
+
+Rows whose canonical URL is already taken (the same link saved more than once) are
+reported and left NULL, which keeps them out of the unique index. With `--merge` the
+duplicates are folded into the most recently updated copy instead: their tags are added to
+it and the other rows are deleted.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from dotenv import find_dotenv, load_dotenv
+
+from ..db import db_pool
+from ..services.url_canonical import canonicalize_url
+
+
+async def backfill(*, merge: bool) -> None:
+    await db_pool.connect()
+    try:
+        async with db_pool.pool.acquire() as conn:
+            rows = await conn.fetch(
+                "select id, url, url_canonical, tags, updated_at from public.notes"
+            )
+            groups: Dict[str, List[Any]] = defaultdict(list)
+            for r in rows:
+                groups[r["url_canonical"] or canonicalize_url(r["url"])].append(r)
+
+            filled = merged = skipped = 0
+            for canonical, group in groups.items():
+                # Keep the row that already owns the key, else the most recently updated one
+                group.sort(key=lambda r: (r["url_canonical"] is not None, r["updated_at"]), reverse=True)
+                keeper, duplicates = group[0], group[1:]
+                async with conn.transaction():
+                    if duplicates and merge:
+                        tags = list(keeper["tags"] or [])
+                        for dup in duplicates:
+                            tags.extend(t for t in dup["tags"] or [] if t not in tags)
+                        await conn.execute(
+                            "delete from public.notes where id = any($1::uuid[])",
+                            [dup["id"] for dup in duplicates],
+                        )
+                        if tags != list(keeper["tags"] or []):
+                            await conn.execute(
+                                "update public.notes set tags = $2::text[] where id = $1", keeper["id"], tags
+                            )
+                        merged += len(duplicates)
+                    elif duplicates:
+                        skipped += len(duplicates)
+                        print(f"duplicate of {keeper['id']} left unkeyed: {', '.join(str(d['id']) for d in duplicates)}")
+                    if keeper["url_canonical"] is None:
+                        await conn.execute(
+                            "update public.notes set url_canonical = $2 where id = $1", keeper["id"], canonical
+                        )
+                        filled += 1
+            print(f"filled {filled}, merged {merged}, left {skipped} duplicates unkeyed")
+    finally:
+        await db_pool.disconnect()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--merge", action="store_true", help="fold duplicate notes into one")
+    args = parser.parse_args()
+    load_dotenv(find_dotenv(usecwd=True))
+    asyncio.run(backfill(merge=args.merge))
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,160 @@
+"""Fit a dimension-reducing projection and build the compact embedding index.
+
+Run from the repo root:
+
+    python -m backend.scripts.fit_projection [--method pca|truncate] [--dim 256]
+        [--sample 20000] [--backfill-only]
+
+Steps: sample stored embeddings of the configured model, fit PCA (or take the leading
+dimensions for Matryoshka-trained models such as OpenAI text-embedding-3), store the
+matrix as a new version in public.embedding_projections, add notes.embedding_compact
+vector(dim) with its HNSW index if missing, project every matching row and finally mark
+the new version active. Search then takes candidates from the compact index and reranks
+them on the full embedding. Restart the API afterwards: the projection is loaded at
+startup and search only uses rows projected with the loaded version.
+
+`--backfill-only` re-projects rows missing the active version (e.g. written by an API
+process that was still running the previous projection).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+from typing import Any, List
+
+import numpy as np
+from dotenv import find_dotenv, load_dotenv
+
+from ..db import db_pool
+from ..services.embeddings import configured_model_id
+from ..services.projection import PROJECTION_METHODS, Projection, ProjectionRegistry, fit_pca, truncation
+from ..settings import get_settings
+
+
+INDEX_NAME = "notes_embedding_compact_hnsw"
+BACKFILL_BATCH = 1000
+
+
+async def _compact_column_dim(conn: Any) -> int | None:
+    # vector's typmod is its dimension
+    return await conn.fetchval(
+        "select atttypmod from pg_attribute where attrelid = 'public.notes'::regclass "
+        "and attname = 'embedding_compact' and not attisdropped"
+    )
+
+
+async def _ensure_compact_column(conn: Any, dim: int) -> None:
+    current = await _compact_column_dim(conn)
+    if current is not None and current != dim:
+        # Changing dimension means dropping the column and its index first
+        raise SystemExit(
+            f"notes.embedding_compact is vector({current}); drop it to switch to {dim} dims"
+        )
+    if current is None:
+        await conn.execute(f"alter table public.notes add column embedding_compact vector({dim})")
+
+
+async def _fit(conn: Any, *, method: str, dim: int, sample: int, source_model: str) -> Projection:
+    rows = await conn.fetch(
+        "select embedding from public.notes where embedding is not null "
+        "and coalesce(embedding_model, $1) = $1 order by random() limit $2",
+        source_model,
+        sample,
+    )
+    if not rows:
+        raise SystemExit(f"No stored embeddings for {source_model}")
+    data = np.stack([np.asarray(r["embedding"], dtype=np.float32) for r in rows])
+    if method == "pca":
+        mean, components = fit_pca(data, dim)
+        kept = float(((data - mean) @ components.T).var(axis=0).sum() / (data - mean).var(axis=0).sum())
+        print(f"PCA on {len(data)} vectors keeps {kept:.1%} of the variance in {dim} dims")
+    else:
+        mean, components = truncation(data.shape[1], dim)
+
+    version = await conn.fetchval(
+        "insert into public.embedding_projections "
+        "(method, source_model, input_dim, output_dim, mean, components) "
+        "values ($1, $2, $3, $4, $5, $6) returning version",
+        method,
+        source_model,
+        int(components.shape[1]),
+        dim,
+        mean.astype("<f4").tobytes(),
+        components.astype("<f4").tobytes(),
+    )
+    return Projection(version=version, method=method, source_model=source_model, mean=mean, components=components)
+
+
+async def _backfill(conn: Any, projection: Projection) -> int:
+    total = 0
+    while True:
+        rows = await conn.fetch(
+            "select id, embedding from public.notes where embedding is not null "
+            "and coalesce(embedding_model, $1) = $1 "
+            "and embedding_compact_version is distinct from $2 limit $3",
+            projection.source_model,
+            projection.version,
+            BACKFILL_BATCH,
+        )
+        if not rows:
+            return total
+        compact = projection.project(np.stack([np.asarray(r["embedding"], dtype=np.float32) for r in rows]))
+        records: List[Any] = [(r["id"], compact[i], projection.version) for i, r in enumerate(rows)]
+        await conn.executemany(
+            "update public.notes set embedding_compact = $2::vector, embedding_compact_version = $3 "
+            "where id = $1",
+            records,
+        )
+        total += len(rows)
+        print(f"projected {total} notes")
+
+
+async def run(*, method: str, dim: int, sample: int, backfill_only: bool) -> None:
+    settings = get_settings()
+    source_model = configured_model_id()
+    await db_pool.connect()
+    try:
+        async with db_pool.pool.acquire() as conn:
+            if backfill_only:
+                projection = await ProjectionRegistry().load(conn)
+                if projection is None:
+                    raise SystemExit("No active projection to backfill")
+            else:
+                if dim >= settings.embed_dimension:
+                    raise SystemExit(f"--dim must be below EMBED_DIMENSION ({settings.embed_dimension})")
+                await _ensure_compact_column(conn, dim)
+                projection = await _fit(conn, method=method, dim=dim, sample=sample, source_model=source_model)
+
+            started = time.perf_counter()
+            count = await _backfill(conn, projection)
+            print(f"projected {count} notes with version {projection.version} in {time.perf_counter() - started:.1f}s")
+
+            await conn.execute(
+                f"create index concurrently if not exists {INDEX_NAME} on public.notes "
+                f"using hnsw (embedding_compact vector_cosine_ops) "
+                f"with (m = {int(settings.hnsw_m)}, ef_construction = {int(settings.hnsw_ef_construction)})",
+                timeout=None,
+            )
+            async with conn.transaction():
+                await conn.execute("update public.embedding_projections set active = (version = $1)", projection.version)
+            await conn.execute("analyze public.notes")
+            print(f"projection {projection.version} active; restart the API to load it")
+    finally:
+        await db_pool.disconnect()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--method", choices=PROJECTION_METHODS, default="pca")
+    parser.add_argument("--dim", type=int, default=None, help="output dimension (default PROJECTION_DIM)")
+    parser.add_argument("--sample", type=int, default=20000, help="embeddings to fit PCA on")
+    parser.add_argument("--backfill-only", action="store_true")
+    args = parser.parse_args()
+    load_dotenv(find_dotenv(usecwd=True))
+    dim = args.dim or get_settings().projection_dim
+    asyncio.run(run(method=args.method, dim=dim, sample=args.sample, backfill_only=args.backfill_only))
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,121 @@
+"""Replace the ivfflat embedding index with HNSW.
+
+Run from the repo root once notes exist (HNSW builds incrementally, so unlike ivfflat it
+doesn't need data up front, but building on a populated table is faster than inserting):
+
+    python -m backend.scripts.migrate_hnsw [--keep-ivfflat] [--maintenance-work-mem 1GB]
+        [--quantization none|halfvec|binary] [--keep-variants]
+
+Build parameters come from HNSW_M and HNSW_EF_CONSTRUCTION. The index is built with
+`create index concurrently`, so reads and writes continue meanwhile; the old ivfflat index
+is dropped only after the new one is valid. Re-running with different parameters rebuilds.
+
+`--quantization` (default VECTOR_QUANTIZATION) indexes a compact copy of each embedding
+instead: `halfvec` halves the index, `binary` (one bit per dimension) shrinks it 32x.
+The full-precision column stays for exact rescoring. Other HNSW variants are dropped
+unless `--keep-variants`; set VECTOR_QUANTIZATION to the same mode so search uses it.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import re
+import time
+
+from dotenv import find_dotenv, load_dotenv
+
+from ..db import db_pool
+from ..settings import get_settings
+
+
+IVFFLAT_NAME = "notes_embedding_ivfflat"
+
+# Index name and indexed expression + opclass per quantization mode. The expressions must
+# match the ORDER BY in services/retrieval.py for the planner to use the index.
+VARIANTS = {
+    "none": ("notes_embedding_hnsw", "embedding vector_cosine_ops"),
+    "halfvec": ("notes_embedding_hnsw_halfvec", "(embedding::halfvec({dim})) halfvec_cosine_ops"),
+    "binary": ("notes_embedding_hnsw_binary", "(binary_quantize(embedding)::bit({dim})) bit_hamming_ops"),
+}
+
+
+async def _index_options(conn, name: str) -> dict:
+    row = await conn.fetchrow(
+        "select c.reloptions, i.indisvalid from pg_class c join pg_index i on i.indexrelid = c.oid "
+        "where c.relname = $1 and c.relnamespace = 'public'::regnamespace",
+        name,
+    )
+    if row is None:
+        return {}
+    options = dict(opt.split("=", 1) for opt in (row["reloptions"] or []))
+    options["valid"] = row["indisvalid"]
+    return options
+
+
+async def migrate(
+    *, keep_ivfflat: bool, maintenance_work_mem: str, quantization: str, keep_variants: bool
+) -> None:
+    settings = get_settings()
+    m, ef_construction = int(settings.hnsw_m), int(settings.hnsw_ef_construction)
+    if not re.fullmatch(r"\d+\s*(kB|MB|GB)", maintenance_work_mem):
+        raise SystemExit("--maintenance-work-mem must look like 512MB or 1GB")
+    if quantization not in VARIANTS:
+        raise SystemExit(f"--quantization must be one of {', '.join(VARIANTS)}")
+    index_name, indexed = VARIANTS[quantization]
+    indexed = indexed.format(dim=int(settings.embed_dimension))
+
+    await db_pool.connect()
+    try:
+        async with db_pool.pool.acquire() as conn:
+            current = await _index_options(conn, index_name)
+            wanted = {"m": str(m), "ef_construction": str(ef_construction)}
+            if current and current.get("valid") and all(current.get(k) == v for k, v in wanted.items()):
+                print(f"{index_name} already exists with m={m}, ef_construction={ef_construction}")
+            else:
+                if current:
+                    # Different parameters, or an invalid leftover from an interrupted build
+                    await conn.execute(f"drop index concurrently if exists public.{index_name}")
+                # Graph construction is much faster when it fits in memory
+                await conn.execute(f"set maintenance_work_mem = '{maintenance_work_mem}'")
+                started = time.perf_counter()
+                await conn.execute(
+                    f"create index concurrently {index_name} on public.notes "
+                    f"using hnsw ({indexed}) "
+                    f"with (m = {m}, ef_construction = {ef_construction})",
+                    timeout=None,
+                )
+                print(f"built {index_name} (m={m}, ef_construction={ef_construction}) "
+                      f"in {time.perf_counter() - started:.1f}s")
+            if not keep_ivfflat:
+                await conn.execute(f"drop index concurrently if exists public.{IVFFLAT_NAME}")
+                print(f"dropped {IVFFLAT_NAME}")
+            if not keep_variants:
+                for other, _ in VARIANTS.values():
+                    if other != index_name:
+                        await conn.execute(f"drop index concurrently if exists public.{other}")
+            await conn.execute("analyze public.notes")
+    finally:
+        await db_pool.disconnect()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keep-ivfflat", action="store_true", help="leave the old index in place")
+    parser.add_argument("--maintenance-work-mem", default="512MB")
+    parser.add_argument("--quantization", choices=sorted(VARIANTS), default=None)
+    parser.add_argument("--keep-variants", action="store_true", help="keep other HNSW variants")
+    args = parser.parse_args()
+    load_dotenv(find_dotenv(usecwd=True))
+    quantization = args.quantization or (get_settings().vector_quantization or "none").lower()
+    asyncio.run(
+        migrate(
+            keep_ivfflat=args.keep_ivfflat,
+            maintenance_work_mem=args.maintenance_work_mem,
+            quantization=quantization,
+            keep_variants=args.keep_variants,
+        )
+    )
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
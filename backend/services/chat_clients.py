@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import hashlib
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import httpx
+from groq import AsyncGroq
+
+from .http_clients import UpstreamConfig, build_async_client, pool_usage
+
+
+# Connection pool bounds per chat provider. Streams hold their connection for the whole
+# answer, so max_connections also caps concurrent streams per (provider, API key).
+CHAT_UPSTREAMS: Dict[str, UpstreamConfig] = {
+    "openai": UpstreamConfig(max_connections=20, max_keepalive=10, timeout=60.0),
+    "openrouter": UpstreamConfig(max_connections=20, max_keepalive=10, timeout=60.0),
+    "groq": UpstreamConfig(max_connections=20, max_keepalive=10, timeout=60.0),
+}
+_DEFAULT_UPSTREAM = UpstreamConfig(max_connections=10, max_keepalive=5, timeout=60.0)
+
+
+def key_fingerprint(api_key: str) -> str:
+    # Identifies a key in stats without exposing it
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:8]
+
+
+@dataclass
+class ChatClient:
+    """Long-lived connection pool (and SDK client, for Groq) for one provider + API key."""
+
+    provider: str
+    config: UpstreamConfig
+    http: httpx.AsyncClient
+    sdk: Optional[Any] = None
+    active_streams: int = 0
+    streams: int = 0
+    errors: int = 0
+    # When the pool last had a working connection, so warm-ups can be skipped
+    last_used: float = field(default=float("-inf"))
+
+    @asynccontextmanager
+    async def stream_slot(self) -> AsyncIterator[None]:
+        """Track one in-flight stream; also released when the consumer stops early."""
+        self.active_streams += 1
+        self.streams += 1
+        try:
+            yield
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.active_streams -= 1
+        self.last_used = time.monotonic()
+
+    def is_warm(self) -> bool:
+        # Idle keep-alive connections are dropped after keepalive_expiry; stay well inside it
+        return time.monotonic() - self.last_used < self.config.keepalive_expiry / 2
+
+
+class ChatClientRegistry:
+    """Chat provider clients keyed by (provider, API key), created lazily and reused.
+
+    Replaces building an AsyncGroq or httpx client per request. Closed on app shutdown.
+    """
+
+    def __init__(self) -> None:
+        self._clients: Dict[Tuple[str, str], ChatClient] = {}
+
+    def get(self, provider: str, api_key: str) -> ChatClient:
+        key = (provider, api_key)
+        client = self._clients.get(key)
+        if client is None or client.http.is_closed:
+            config = CHAT_UPSTREAMS.get(provider, _DEFAULT_UPSTREAM)
+            http = build_async_client(config)
+            sdk = AsyncGroq(api_key=api_key, http_client=http) if provider == "groq" else None
+            client = ChatClient(provider=provider, config=config, http=http, sdk=sdk)
+            self._clients[key] = client
+        return client
+
+    async def aclose(self) -> None:
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            # The Groq SDK client wraps this same httpx client
+            await client.http.aclose()
+
+    def stats(self) -> dict:
+        out: Dict[str, dict] = {}
+        for (provider, api_key), client in self._clients.items():
+            out[f"{provider}:{key_fingerprint(api_key)}"] = {
+                "active_streams": client.active_streams,
+                "streams": client.streams,
+                "errors": client.errors,
+                "max_connections": client.config.max_connections,
+                **pool_usage(client.http),
+            }
+        return out
+
+
+chat_clients = ChatClientRegistry()
+
+
+__all__ = ["CHAT_UPSTREAMS", "ChatClient", "ChatClientRegistry", "chat_clients", "key_fingerprint"]
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Optional
+
+
+# Rolling window of time-to-first-token samples per provider
+TTFT_WINDOW = 200
+
+
+def _percentile(samples: Deque[float], q: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+@dataclass
+class _ProviderChatStats:
+    ttft: Deque[float] = field(default_factory=lambda: deque(maxlen=TTFT_WINDOW))
+    streams: int = 0
+    errors: int = 0
+
+
+class ChatMetrics:
+    """Per-provider chat latency: time-to-first-token measured from request arrival, i.e.
+    retrieval plus provider queueing, which is what users perceive."""
+
+    def __init__(self) -> None:
+        self._providers: Dict[str, _ProviderChatStats] = {}
+
+    def _entry(self, provider: str) -> _ProviderChatStats:
+        return self._providers.setdefault(provider, _ProviderChatStats())
+
+    def record_ttft(self, provider: str, seconds: float) -> None:
+        entry = self._entry(provider)
+        entry.streams += 1
+        entry.ttft.append(seconds)
+
+    def record_error(self, provider: str) -> None:
+        self._entry(provider).errors += 1
+
+    def stats(self) -> dict:
+        out: Dict[str, dict] = {}
+        for name, entry in self._providers.items():
+            p50, p95 = _percentile(entry.ttft, 0.5), _percentile(entry.ttft, 0.95)
+            out[name] = {
+                "streams": entry.streams,
+                "errors": entry.errors,
+                "ttft_p50_ms": None if p50 is None else round(p50 * 1000.0, 1),
+                "ttft_p95_ms": None if p95 is None else round(p95 * 1000.0, 1),
+                "samples": len(entry.ttft),
+            }
+        return out
+
+
+chat_metrics = ChatMetrics()
+
+
+__all__ = ["ChatMetrics", "chat_metrics"]
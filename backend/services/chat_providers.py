@@ -1,11 +1,26 @@
 from __future__ import annotations
 
 import asyncio
+import json
+import time
 from dataclasses import dataclass
-from typing import AsyncIterator, Dict, Iterable, List, Optional
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
 
 import httpx
-from groq import AsyncGroq
+
+from .chat_clients import ChatClient, chat_clients
+
+
+# Provider API roots; streams go through the long-lived client for (provider, API key)
+PROVIDER_BASE_URLS: Dict[str, str] = {
+    "openrouter": "https://openrouter.ai/api",
+    "openai": "https://api.openai.com",
+    "groq": "https://api.groq.com",
+}
+WARMUP_TIMEOUT = 3.0
+# Once retrieval is done the stream waits at most this long for a warm-up still in flight,
+# then cancels it and connects on its own
+WARMUP_GRACE = 0.1
 
 
 class ChatProviderError(RuntimeError):
@@ -19,6 +34,7 @@ class ChatMessage:
 
 
 async def _openai_compatible_stream(
+    client: httpx.AsyncClient,
     base_url: str,
     api_key: str,
     model: str,
@@ -47,14 +63,16 @@ async def _openai_compatible_stream(
         "messages": [{"role": m.role, "content": m.content} for m in messages],
     }
 
-    async with httpx.AsyncClient(timeout=httpx.Timeout(60.0)) as client:
-        # Use a streaming POST request
+    # Use a streaming POST request. Transport failures (connect errors, timeouts, a full
+    # per-key pool) surface as ChatProviderError like upstream error responses do
+    try:
         async with client.stream("POST", url, headers=headers, json=payload) as resp:
             if resp.status_code >= 400:
+                body = await resp.aread()
                 try:
-                    err = await resp.json()
-                except Exception:
-                    err = {"error": await resp.aread()}
+                    err = json.loads(body)
+                except ValueError:
+                    err = {"error": body.decode("utf-8", "replace")}
                 raise ChatProviderError(f"Chat provider error {resp.status_code}: {err}")
 
             async for line in resp.aiter_lines():
@@ -71,14 +89,7 @@ async def _openai_compatible_stream(
                 # OpenAI-compatible chunk
                 # Typical shape: {"choices":[{"delta":{"content":"..."}}]}
                 try:
-                    obj = httpx.Response(200, request=None, json=None)  # type: ignore
-                except Exception:
-                    obj = None  # unreachable placeholder
-                # Avoid depending on httpx parser; use std json
-                import json as _json
-
-                try:
-                    payload_obj = _json.loads(data)
+                    payload_obj = json.loads(data)
                     choices = payload_obj.get("choices") or []
                     if not choices:
                         continue
@@ -89,19 +100,16 @@ async def _openai_compatible_stream(
                 except Exception:
                     # Non-fatal: skip malformed chunk
                     continue
+    except httpx.HTTPError as exc:
+        raise ChatProviderError(f"Chat provider request failed: {exc!r}") from exc
 
 
 async def _groq_stream(
-    api_key: str,
+    client: Any,
     model: str,
     messages: List[ChatMessage],
 ) -> AsyncIterator[str]:
-    """Streams content tokens from Groq API using the official client."""
-    if not api_key:
-        raise ChatProviderError("API key required for Groq provider")
-
-    client = AsyncGroq(api_key=api_key)
-    
+    """Streams content tokens from Groq API using the official (long-lived) client."""
     try:
         # Convert our ChatMessage format to Groq's expected format
         groq_messages = [{"role": msg.role, "content": msg.content} for msg in messages]
@@ -123,8 +131,34 @@ async def _groq_stream(
                 
     except Exception as exc:
         raise ChatProviderError(f"Groq API error: {exc}")
-    finally:
-        await client.close()
+
+
+def _client_for(name: str, api_key: Optional[str]) -> ChatClient:
+    if not api_key:
+        label = "Groq provider" if name == "groq" else "chat provider"
+        raise ChatProviderError(f"API key required for {label}")
+    return chat_clients.get(name, api_key)
+
+
+async def warm_up_chat_provider(provider: str, api_key: Optional[str]) -> None:
+    """Open a pooled connection (DNS, TCP, TLS) to the provider ahead of its stream.
+
+    rag_chat starts this alongside retrieval so the handshakes overlap it. Best-effort: the
+    response is ignored and errors are swallowed; the stream itself reports real failures.
+    Skipped while the client's pool likely still holds a live keep-alive connection.
+    """
+    name = (provider or "").lower()
+    base_url = PROVIDER_BASE_URLS.get(name)
+    if base_url is None or not api_key:
+        return
+    client = chat_clients.get(name, api_key)
+    if client.is_warm():
+        return
+    try:
+        await client.http.head(base_url, timeout=WARMUP_TIMEOUT)
+    except Exception:
+        return
+    client.last_used = time.monotonic()
 
 
 async def stream_chat_tokens(
@@ -138,7 +172,9 @@ async def stream_chat_tokens(
     Supported providers:
     - openrouter: base_url https://openrouter.ai/api
     - openai: base_url https://api.openai.com
-    (Others can be added later.)
+    - groq: official SDK client
+    (Others can be added later.) Each stream runs on the registry's client for
+    (provider, api_key) and counts as one of its active streams.
     """
     name = (provider or "openrouter").lower()
 
@@ -149,46 +185,36 @@ async def stream_chat_tokens(
             yield chunk
         return
 
-    if name == "openrouter":
-        base_url = "https://openrouter.ai/api"
-        extra_headers = {"HTTP-Referer": "https://notenest", "X-Title": "notenest"}
-        async for token in _openai_compatible_stream(
-            base_url=base_url,
-            api_key=api_key or "",
-            model=model,
-            messages=messages,
-            extra_headers=extra_headers,
-        ):
-            yield token
-        return
-
-    if name == "openai":
-        base_url = "https://api.openai.com"
-        async for token in _openai_compatible_stream(
-            base_url=base_url,
-            api_key=api_key or "",
-            model=model,
-            messages=messages,
-        ):
-            yield token
-        return
+    if name not in PROVIDER_BASE_URLS:
+        raise ChatProviderError(f"Unsupported chat provider: {provider}")
 
+    client = _client_for(name, api_key)
     if name == "groq":
-        async for token in _groq_stream(
+        tokens = _groq_stream(client.sdk, model=model, messages=messages)
+    else:
+        extra_headers = (
+            {"HTTP-Referer": "https://notenest", "X-Title": "notenest"} if name == "openrouter" else None
+        )
+        tokens = _openai_compatible_stream(
+            client.http,
+            base_url=PROVIDER_BASE_URLS[name],
             api_key=api_key or "",
             model=model,
             messages=messages,
-        ):
+            extra_headers=extra_headers,
+        )
+    async with client.stream_slot():
+        async for token in tokens:
             yield token
-        return
-
-    raise ChatProviderError(f"Unsupported chat provider: {provider}")
 
 
 __all__ = [
     "ChatProviderError",
     "ChatMessage",
+    "PROVIDER_BASE_URLS",
+    "WARMUP_GRACE",
     "stream_chat_tokens",
+    "warm_up_chat_provider",
 ]
 
 
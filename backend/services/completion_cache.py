@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from functools import lru_cache
+from typing import Optional, Sequence, Tuple
+
+from ..settings import get_settings
+from .chat_providers import ChatMessage
+from .lru_cache import LRUCache
+from .query_cache import normalize_query
+
+
+# Longer answers aren't cached: they're rarely repeated verbatim and would dominate memory
+MAX_CACHED_CHARS = 32000
+
+
+class CompletionCache:
+    """TTL'd LRU of finished chat completions, replayed as SSE on an identical request.
+
+    The key covers provider, model, the whitespace-normalized prompt messages and the id and
+    updated_at of every note in the context, so editing or deleting a cited note (which
+    changes what retrieval returns) never serves an answer built on the old text.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        self._lru: LRUCache[Tuple[str, ...]] = LRUCache(max_entries, ttl_seconds=ttl_seconds)
+
+    @staticmethod
+    def key(
+        *,
+        provider: str,
+        model: str,
+        messages: Sequence[ChatMessage],
+        notes: Sequence[Tuple[str, str]],
+    ) -> str:
+        payload = json.dumps(
+            [
+                provider,
+                model,
+                [[m.role.lower(), normalize_query(m.content)] for m in messages],
+                [list(note) for note in notes],
+            ],
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[str, ...]]:
+        return self._lru.get(key)
+
+    def put(self, key: str, tokens: Sequence[str]) -> None:
+        if not tokens or sum(len(t) for t in tokens) > MAX_CACHED_CHARS:
+            return
+        self._lru.put(key, tuple(tokens))
+
+    def stats(self) -> dict:
+        return self._lru.snapshot()
+
+
+@lru_cache(maxsize=1)
+def get_completion_cache() -> CompletionCache:
+    settings = get_settings()
+    return CompletionCache(settings.chat_cache_size, settings.chat_cache_ttl_seconds)
+
+
+__all__ = ["CompletionCache", "MAX_CACHED_CHARS", "get_completion_cache"]
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Sequence
+
+from .chat_providers import ChatMessage
+
+
+# Chat formatting overhead per message (role, separators) in provider tokenizers
+MESSAGE_OVERHEAD = 4
+# Share of the budget earlier turns may claim before notes; whatever notes leave over also
+# goes to history
+HISTORY_SHARE = 0.3
+# A note trimmed below this many tokens isn't worth its citation slot
+MIN_NOTE_TOKENS = 48
+
+_SENTENCE_END = re.compile(r"[.!?؟。]\s")
+
+
+def estimate_tokens(text: str) -> int:
+    """Fast upper-leaning token estimate without a tokenizer.
+
+    BPE vocabularies average ~4 characters per token for ASCII text and far fewer for
+    Arabic and other non-Latin scripts, so those characters count half a token each.
+    """
+    if not text:
+        return 0
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return math.ceil(ascii_chars / 4 + (len(text) - ascii_chars) / 2)
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` to about `max_tokens`, preferring a sentence or word boundary."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # Characters per token of this text, so non-Latin scripts are cut proportionally
+    ratio = len(text) / max(1, estimate_tokens(text))
+    cut = text[: max(1, int(max_tokens * ratio) - 1)]
+    floor = int(len(cut) * 0.6)
+    ends = [m.end() for m in _SENTENCE_END.finditer(cut)]
+    if ends and ends[-1] >= floor:
+        cut = cut[: ends[-1]].rstrip()
+    elif cut.rfind(" ") >= floor:
+        cut = cut[: cut.rfind(" ")]
+    return cut.rstrip() + "…"
+
+
+def _note_block(index: int, row: Any, description: str) -> str:
+    return f"[{index}] {row['title']}\n{description}\nSource: {row['url']}"
+
+
+@dataclass
+class PackedContext:
+    context_block: str
+    citations: List[Dict[str, str]]
+    history: List[ChatMessage]
+    usage: Dict[str, int] = field(default_factory=dict)
+
+
+def pack_context(
+    rows: Sequence[Any],
+    messages: Sequence[ChatMessage],
+    *,
+    budget: int,
+    reserved_tokens: int,
+    max_note_tokens: int,
+) -> PackedContext:
+    """Fit retrieved notes and chat history into a prompt token budget.
+
+    `reserved_tokens` covers the fixed system text. The latest message is always kept.
+    Notes go in by descending score, each description trimmed to `max_note_tokens`; when
+    the next note no longer fits it is trimmed further or, below MIN_NOTE_TOKENS, dropped
+    along with every lower-scored note. Earlier turns are kept newest first in what's left,
+    with at least HISTORY_SHARE of the budget held back for them if they need it.
+    """
+    history = list(messages[:-1])
+    latest = list(messages[-1:])
+    latest_tokens = sum(estimate_tokens(m.content) + MESSAGE_OVERHEAD for m in latest)
+    available = max(0, budget - reserved_tokens - latest_tokens)
+
+    history_costs = [estimate_tokens(m.content) + MESSAGE_OVERHEAD for m in history]
+    history_hold = min(sum(history_costs), int(available * HISTORY_SHARE))
+    notes_budget = available - history_hold
+
+    ranked = sorted(rows, key=lambda r: float(r["score"]), reverse=True)
+    parts: List[str] = []
+    citations: List[Dict[str, str]] = []
+    notes_tokens = 0
+    for row in ranked:
+        index = len(parts) + 1
+        description = trim_to_tokens(row["description"] or "", max_note_tokens)
+        block = _note_block(index, row, description)
+        cost = estimate_tokens(block) + 1
+        if notes_tokens + cost > notes_budget:
+            # Shrink the description into what's left, or stop: lower scores come after
+            room = notes_budget - notes_tokens - (cost - estimate_tokens(description))
+            if room < MIN_NOTE_TOKENS:
+                break
+            block = _note_block(index, row, trim_to_tokens(description, room))
+            cost = estimate_tokens(block) + 1
+            if notes_tokens + cost > notes_budget:
+                break
+        parts.append(block)
+        citations.append({"id": str(row["id"]), "title": row["title"], "url": row["url"]})
+        notes_tokens += cost
+
+    # Newest turns first, back to the first one that doesn't fit
+    history_budget = available - notes_tokens
+    kept = 0
+    history_tokens = 0
+    for cost in reversed(history_costs):
+        if history_tokens + cost > history_budget:
+            break
+        history_tokens += cost
+        kept += 1
+    kept_history = history[len(history) - kept :] if kept else []
+
+    return PackedContext(
+        context_block="\n\n".join(parts),
+        citations=citations,
+        history=kept_history + latest,
+        usage={
+            "budget": budget,
+            "prompt_tokens": reserved_tokens + notes_tokens + history_tokens + latest_tokens,
+            "notes_tokens": notes_tokens,
+            "history_tokens": history_tokens + latest_tokens,
+            "notes_used": len(parts),
+            "notes_dropped": len(ranked) - len(parts),
+            "messages_dropped": len(history) - kept,
+        },
+    )
+
+
+__all__ = [
+    "MESSAGE_OVERHEAD",
+    "PackedContext",
+    "estimate_tokens",
+    "pack_context",
+    "trim_to_tokens",
+]
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+
+from ..settings import get_settings
+from .lru_cache import LRUCache
+from .search_cache import notes_version
+
+
+# Each turn a carried candidate ages, its score is multiplied by this
+CARRY_DECAY = 0.5
+# Per-session bounds, so the cache's memory is max_entries x these
+MAX_CANDIDATES = 50
+MAX_TURNS = 8
+
+
+@dataclass
+class ConversationSession:
+    """Retrieval state of one chat conversation, read at notes version `version`."""
+
+    version: int
+    # note id -> row (as a dict, score decayed by age), best candidates only
+    candidates: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    # retrieval key -> rows handed to the prompt for it, most recent last
+    turns: "OrderedDict[Hashable, List[Dict[str, Any]]]" = field(default_factory=OrderedDict)
+
+
+class ConversationCache:
+    """TTL'd LRU of chat sessions keyed by the client's conversationId.
+
+    A follow-up turn that repeats an earlier retrieval (a retry, or the same question
+    again) is answered from the session. A new question still runs a search. Its rows are
+    merged with the session's earlier candidates at decayed scores, so notes the
+    conversation was already about stay available to the prompt. Any note write
+    invalidates a session's rows, the same way it invalidates the search result cache.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        self._lru: LRUCache[ConversationSession] = LRUCache(max_entries, ttl_seconds=ttl_seconds)
+
+    def _session(self, conversation_id: str) -> Optional[ConversationSession]:
+        current = notes_version.value
+        return self._lru.get(conversation_id, valid=lambda s: s.version == current)
+
+    def lookup(self, conversation_id: str, key: Hashable) -> Optional[List[Dict[str, Any]]]:
+        session = self._session(conversation_id)
+        if session is None or key not in session.turns:
+            return None
+        session.turns.move_to_end(key)
+        return list(session.turns[key])
+
+    def extend(
+        self,
+        conversation_id: str,
+        key: Hashable,
+        rows: Sequence[Any],
+        *,
+        version: int,
+        limit: int,
+    ) -> List[Dict[str, Any]]:
+        """Merge a turn's fresh rows with the session's carried candidates.
+
+        Returns up to `limit` rows by score, new ones ahead of equally scored carried ones.
+        `version` is the notes version captured before searching; rows read across a write
+        start a fresh session.
+        """
+        session = self._session(conversation_id)
+        if session is None or session.version != version:
+            session = ConversationSession(version=version)
+
+        merged: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            merged[str(row["id"])] = dict(row)
+        for note_id, row in session.candidates.items():
+            if note_id not in merged:
+                merged[note_id] = {**row, "score": float(row["score"]) * CARRY_DECAY}
+
+        ranked = sorted(merged.values(), key=lambda r: float(r["score"]), reverse=True)
+        session.candidates = {str(r["id"]): r for r in ranked[:MAX_CANDIDATES]}
+        result = ranked[:limit]
+        session.turns[key] = result
+        session.turns.move_to_end(key)
+        while len(session.turns) > MAX_TURNS:
+            session.turns.popitem(last=False)
+        self._lru.put(conversation_id, session)
+        return list(result)
+
+    def stats(self) -> dict:
+        return self._lru.snapshot()
+
+
+@lru_cache(maxsize=1)
+def get_conversation_cache() -> ConversationCache:
+    settings = get_settings()
+    return ConversationCache(settings.conversation_cache_size, settings.conversation_cache_ttl_seconds)
+
+
+__all__ = ["ConversationCache", "ConversationSession", "get_conversation_cache"]
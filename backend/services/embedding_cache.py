@@ -0,0 +1,278 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence, TypeVar
+
+import numpy as np
+
+from ..settings import get_settings
+from .lru_cache import LRUCache
+
+
+T = TypeVar("T")
+
+
+def clean_text(value: Optional[str], *, max_len: Optional[int] = 4000) -> str:
+    """Collapse whitespace and cut to `max_len` characters.
+
+    Every path that embeds text cleans it here, so the same note text always yields the
+    same cache key whichever path (request or background worker) embeds it.
+    """
+    if not value:
+        return ""
+    text = re.sub(r"\s+", " ", value).strip()
+    if max_len is not None and len(text) > max_len:
+        return text[:max_len]
+    return text
+
+
+def cache_key(provider: str, model: str, dimension: int, text: str) -> str:
+    """Content address for an embedding: provider, model, target dim and cleaned text."""
+    raw = "\x1f".join((provider, model, str(int(dimension)), clean_text(text, max_len=None)))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _pack(vector: np.ndarray) -> bytes:
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def _unpack(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+# last_used updates from disk hits are buffered and written in one transaction once this
+# many keys are pending (or before an eviction pass / on close)
+TOUCH_FLUSH = 256
+# Eviction walks the last_used index in pages of this many rows
+EVICT_PAGE = 512
+
+
+class _DiskTier:
+    """SQLite-backed store that survives restarts, evicting least recently used rows by size.
+
+    Blocking: EmbeddingCache calls it on its own single worker thread, which also serializes
+    access to the connection.
+    """
+
+    def __init__(self, path: str, max_bytes: int) -> None:
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.max_bytes = max(0, int(max_bytes))
+        self.evictions = 0
+        self._touched: Dict[str, float] = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("pragma journal_mode=wal")
+        self._conn.execute("pragma synchronous=normal")
+        self._conn.execute(
+            "create table if not exists embeddings ("
+            " key text primary key,"
+            " vector blob not null,"
+            " nbytes integer not null,"
+            " last_used real not null)"
+        )
+        self._conn.execute("create index if not exists embeddings_last_used on embeddings (last_used)")
+        row = self._conn.execute("select coalesce(sum(nbytes), 0), count(*) from embeddings").fetchone()
+        self.total_bytes = int(row[0])
+        self.entries = int(row[1])
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        if not keys:
+            return {}
+        placeholders = ",".join("?" for _ in keys)
+        rows = self._conn.execute(
+            f"select key, vector from embeddings where key in ({placeholders})", list(keys)
+        ).fetchall()
+        if rows:
+            now = time.time()
+            self._touched.update((key, now) for key, _ in rows)
+            if len(self._touched) >= TOUCH_FLUSH:
+                self._flush_touched()
+        return {key: _unpack(blob) for key, blob in rows}
+
+    def _flush_touched(self) -> None:
+        if not self._touched:
+            return
+        touched, self._touched = self._touched, {}
+        self._conn.execute("begin")
+        try:
+            self._conn.executemany(
+                "update embeddings set last_used = ? where key = ?",
+                [(used, key) for key, used in touched.items()],
+            )
+        except BaseException:
+            self._conn.execute("rollback")
+            raise
+        self._conn.execute("commit")
+
+    def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        if not items:
+            return
+        now = time.time()
+        blobs = {key: _pack(vector) for key, vector in items.items()}
+        placeholders = ",".join("?" for _ in blobs)
+        self._conn.execute("begin")
+        try:
+            previous = dict(
+                self._conn.execute(
+                    f"select key, nbytes from embeddings where key in ({placeholders})", list(blobs)
+                ).fetchall()
+            )
+            self._conn.executemany(
+                "insert or replace into embeddings (key, vector, nbytes, last_used) values (?, ?, ?, ?)",
+                [(key, blob, len(blob), now) for key, blob in blobs.items()],
+            )
+        except BaseException:
+            self._conn.execute("rollback")
+            raise
+        self._conn.execute("commit")
+        for key, blob in blobs.items():
+            self._touched.pop(key, None)
+            if key in previous:
+                self.total_bytes -= int(previous[key])
+            else:
+                self.entries += 1
+            self.total_bytes += len(blob)
+        self._evict()
+
+    def _evict(self) -> None:
+        if self.max_bytes <= 0 or self.total_bytes <= self.max_bytes:
+            return
+        # Eviction order must see recent hits
+        self._flush_touched()
+        # Free ~10% headroom so a full cache doesn't evict on every insert
+        target = int(self.max_bytes * 0.9)
+        victims: List[str] = []
+        freed = 0
+        while self.total_bytes - freed > target:
+            rows = self._conn.execute(
+                "select key, nbytes from embeddings order by last_used asc limit ? offset ?",
+                (EVICT_PAGE, len(victims)),
+            ).fetchall()
+            if not rows:
+                break
+            for key, nbytes in rows:
+                if self.total_bytes - freed <= target:
+                    break
+                victims.append(key)
+                freed += int(nbytes)
+        self._conn.execute("begin")
+        try:
+            self._conn.executemany("delete from embeddings where key = ?", [(k,) for k in victims])
+        except BaseException:
+            self._conn.execute("rollback")
+            raise
+        self._conn.execute("commit")
+        self.total_bytes -= freed
+        self.entries -= len(victims)
+        self.evictions += len(victims)
+
+    def close(self) -> None:
+        self._flush_touched()
+        self._conn.close()
+
+
+class EmbeddingCache:
+    """Two-tier embedding cache: in-memory LRU in front of an optional SQLite file.
+
+    Vectors are float32 arrays (what pgvector keeps anyway); treat returned rows as read-only.
+    Memory hits return without leaving the event loop; disk reads and writes run on a
+    dedicated thread.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_entries: int,
+        disk_path: Optional[str] = None,
+        disk_max_bytes: int = 0,
+    ) -> None:
+        self._memory: LRUCache[np.ndarray] = LRUCache(max_entries)
+        self._disk = _DiskTier(disk_path, disk_max_bytes) if disk_path else None
+        self._executor = (
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding-cache")
+            if self._disk is not None
+            else None
+        )
+        self.disk_hits = 0
+
+    async def _on_disk_thread(self, fn: Callable[..., T], *args: Any) -> T:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        missing: List[str] = []
+        for key in keys:
+            vector = self._memory.get(key)
+            if vector is not None:
+                found[key] = vector
+            else:
+                missing.append(key)
+        if missing and self._disk is not None:
+            from_disk = await self._on_disk_thread(self._disk.get_many, missing)
+            self.disk_hits += len(from_disk)
+            for key, vector in from_disk.items():
+                self._memory.put(key, vector)
+            found.update(from_disk)
+        return found
+
+    async def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        for key, vector in items.items():
+            self._memory.put(key, vector)
+        if self._disk is not None:
+            await self._on_disk_thread(self._disk.put_many, items)
+
+    def stats(self) -> dict:
+        memory = self._memory.snapshot()
+        # Memory misses that the disk tier answered are hits overall
+        misses = memory["misses"] - self.disk_hits
+        hits = memory["hits"] + self.disk_hits
+        out = {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": (hits / (hits + misses)) if (hits + misses) else 0.0,
+            "memory": memory,
+            "disk": None,
+        }
+        if self._disk is not None:
+            out["disk"] = {
+                "hits": self.disk_hits,
+                "entries": self._disk.entries,
+                "bytes": self._disk.total_bytes,
+                "max_bytes": self._disk.max_bytes,
+                "evictions": self._disk.evictions,
+            }
+        return out
+
+    def close(self) -> None:
+        if self._executor is not None:
+            # Let queued writes finish before closing the connection
+            self._executor.shutdown(wait=True)
+        if self._disk is not None:
+            self._disk.close()
+
+
+@lru_cache(maxsize=1)
+def get_embedding_cache() -> EmbeddingCache:
+    settings = get_settings()
+    return EmbeddingCache(
+        max_entries=settings.embed_cache_size,
+        disk_path=settings.embed_cache_path,
+        disk_max_bytes=settings.embed_cache_max_bytes,
+    )
+
+
+def close_embedding_cache() -> None:
+    # Only close an instance that was actually built
+    if get_embedding_cache.cache_info().currsize:
+        get_embedding_cache().close()
+        get_embedding_cache.cache_clear()
+
+
+__all__ = ["EmbeddingCache", "cache_key", "clean_text", "close_embedding_cache", "get_embedding_cache"]
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, List, Optional
+
+from ..db import db_pool
+from ..settings import get_settings
+from .embeddings import (
+    DESCRIPTION_MAX_CHARS,
+    EmbeddingError,
+    clean_text,
+    embed_for_index,
+    keyless_fallback_provider,
+    note_embedding_text,
+)
+from .og_scraper import fetch_og_metadata
+from .projection import projections
+from .search_cache import notes_version
+from .vector_ops import degenerate_rows
+
+
+logger = logging.getLogger(__name__)
+
+# Give up on a note after this many failed embedding attempts
+MAX_ATTEMPTS = 5
+# A claimed row not written back within this long (crashed or stuck worker) can be claimed again
+CLAIM_LEASE_SECONDS = 300.0
+
+
+class EmbeddingWorker:
+    """Background task that fills in embeddings for notes saved with status 'pending'.
+
+    Rows are claimed in batches (`for update skip locked`, bumping embedding_attempts and
+    stamping embedding_claimed_at), have missing title/description scraped, are embedded
+    with one batched provider call and written back with their status set to 'ready'.
+
+    embedding_claimed_at is both a lease and the claim's revision token: other workers skip
+    the row until the lease expires, and an edit that re-queues the note clears it, so the
+    write-back (which requires the stamp it claimed) never overwrites a newer edit.
+    """
+
+    def __init__(self) -> None:
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self.processed = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="embedding-worker")
+
+    def notify(self) -> None:
+        """Wake the worker early, e.g. right after a pending note was inserted."""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self) -> None:
+        settings = get_settings()
+        assert self._wake is not None
+        while True:
+            try:
+                # Drain the backlog before sleeping
+                while await self.process_once(settings.embed_worker_batch) >= settings.embed_worker_batch:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Embedding worker iteration failed")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=settings.embed_worker_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def process_once(self, batch_size: int) -> int:
+        """Embed up to `batch_size` pending notes. Returns how many were embedded."""
+        async with db_pool.pool.acquire() as conn:
+            rows = await conn.fetch(
+                "update public.notes set embedding_attempts = embedding_attempts + 1, "
+                "embedding_claimed_at = now() "
+                "where id in (select id from public.notes where embedding_status = 'pending' "
+                "and (embedding_claimed_at is null "
+                "or embedding_claimed_at < now() - make_interval(secs => $2)) "
+                "order by created_at limit $1 for update skip locked) "
+                "returning id, url, title, description, embedding_attempts, embedding_claimed_at",
+                batch_size,
+                CLAIM_LEASE_SECONDS,
+            )
+        if not rows:
+            return 0
+        # now() is per transaction, so every row of one claim carries the same stamp
+        claimed_at = rows[0]["embedding_claimed_at"]
+
+        titles: List[str] = [r["title"] or "" for r in rows]
+        descriptions: List[str] = [r["description"] or "" for r in rows]
+        await self._fill_metadata(rows, titles, descriptions)
+
+        texts = [
+            note_embedding_text(t, d) for t, d in zip(titles, descriptions)
+        ]
+        try:
+            batch = await embed_for_index(texts, provider=keyless_fallback_provider())
+        except EmbeddingError as exc:
+            logger.warning("Embedding %d pending notes failed: %s", len(rows), exc)
+            # Release the claim: retried next tick, or given up on after MAX_ATTEMPTS
+            async with db_pool.pool.acquire() as conn:
+                await conn.execute(
+                    "update public.notes set embedding_claimed_at = null, embedding_status = "
+                    "case when embedding_attempts >= $2 then 'failed' else embedding_status end "
+                    "where id = any($1::uuid[]) and embedding_claimed_at = $3",
+                    [r["id"] for r in rows],
+                    MAX_ATTEMPTS,
+                    claimed_at,
+                )
+            self.failed += len(rows)
+            # Back off until the next tick instead of hot-looping on a failing provider
+            return 0
+
+        vectors = batch.vectors
+        bad = degenerate_rows(vectors)
+        records: List[Any] = [
+            (r["id"], titles[i], descriptions[i], None if bad[i] else vectors[i], batch.model_id, claimed_at)
+            for i, r in enumerate(rows)
+        ]
+        compact_set = "embedding_compact_version = null"
+        compact = projections.compact(vectors, batch.model_id)
+        if compact is not None:
+            # Projected ANN column for the active projection; NULL for degenerate rows
+            projected, version = compact
+            records = [
+                (*rec, None if bad[i] else projected[i], None if bad[i] else version)
+                for i, rec in enumerate(records)
+            ]
+            compact_set = "embedding_compact = $7::vector, embedding_compact_version = $8"
+        # Scraped metadata only fills fields that are still empty; rows edited since the
+        # claim no longer carry its stamp and are left for the next claim
+        sql = (
+            "update public.notes set title = coalesce(nullif(title, ''), $2), "
+            "description = coalesce(nullif(description, ''), $3), embedding = $4::vector, "
+            "embedding_model = $5, embedding_status = 'ready', embedding_attempts = 0, "
+            f"embedding_claimed_at = null, {compact_set} "
+            "where id = $1 and embedding_status = 'pending' and embedding_claimed_at = $6"
+        )
+        async with db_pool.pool.acquire() as conn:
+            await conn.executemany(sql, records)
+        # Newly embedded notes change vector-branch results
+        notes_version.bump()
+        self.processed += len(rows)
+        return len(rows)
+
+    async def _fill_metadata(self, rows: List[Any], titles: List[str], descriptions: List[str]) -> None:
+        # Only scrape on the first attempt; a failing site shouldn't block embedding forever
+        todo = [
+            i for i, r in enumerate(rows)
+            if (not titles[i] or not descriptions[i]) and r["embedding_attempts"] <= 1
+        ]
+        if not todo:
+            return
+        results = await asyncio.gather(
+            *(fetch_og_metadata(rows[i]["url"]) for i in todo), return_exceptions=True
+        )
+        for i, scraped in zip(todo, results):
+            if isinstance(scraped, BaseException):
+                continue
+            if not titles[i]:
+                titles[i] = clean_text(scraped.title)
+            if not descriptions[i]:
+                descriptions[i] = clean_text(scraped.description, max_len=DESCRIPTION_MAX_CHARS)
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "processed": self.processed,
+            "failed": self.failed,
+        }
+
+
+embedding_worker = EmbeddingWorker()
+
+
+__all__ = ["CLAIM_LEASE_SECONDS", "EmbeddingWorker", "MAX_ATTEMPTS", "embedding_worker"]
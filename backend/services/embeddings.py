@@ -1,17 +1,34 @@
 from __future__ import annotations
 
-import math
-from typing import Any, Iterable, List, Optional
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
 
 import httpx
+import numpy as np
 from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_exponential
 
 from ..settings import get_settings
+from .embedding_cache import cache_key, clean_text, get_embedding_cache
+from .http_clients import http_clients
+from .local_embedder import LocalEmbedderError, get_local_embedder
+from .provider_router import ProviderRouter
+from .vector_ops import as_float32, fit_dimension, l2_normalize, mock_embeddings
 
 
 DEFAULT_HF_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 DEFAULT_OPENAI_EMBED_MODEL = "text-embedding-3-small"
 
+# Max inputs per upstream request. OpenAI caps `input` at 2048 items; HF serverless
+# inference tends to time out on large batches, so keep those small.
+OPENAI_MAX_BATCH = 2048
+HF_MAX_BATCH = 32
+# In-process ONNX inference; bounds peak memory of one padded batch
+LOCAL_MAX_BATCH = 32
+
 
 class EmbeddingError(RuntimeError):
     pass
@@ -49,22 +66,35 @@ def _flatten_embedding_payload(payload: Any) -> List[float]:
     raise EmbeddingError("Unsupported embedding payload type from provider")
 
 
-def _l2_normalize(values: Iterable[float]) -> List[float]:
-    acc = 0.0
-    result = [float(v) for v in values]
-    for v in result:
-        acc += v * v
-    norm = math.sqrt(acc)
-    if not math.isfinite(norm) or norm <= 1e-12:
-        # Return zeros to signal unusable vector rather than exploding
-        return [0.0 for _ in result]
-    inv = 1.0 / norm
-    for i in range(len(result)):
-        result[i] *= inv
-    return result
+def _flatten_embedding_batch(payload: Any, expected: int) -> List[List[float]]:
+    """Split a batched provider response into one 1-D vector per input.
+
+    Each row goes through `_flatten_embedding_payload`, so token-level rows collapse the
+    same way a single-input response would.
+    """
+    if isinstance(payload, dict):
+        for key in ("embeddings", "data", "vector"):
+            if key in payload:
+                return _flatten_embedding_batch(payload[key], expected)
+        raise EmbeddingError("Unexpected embedding response object shape from provider")
+
+    if not isinstance(payload, (list, tuple)):
+        raise EmbeddingError("Unsupported embedding payload type from provider")
+    if expected == 1 and payload and not isinstance(payload[0], (list, tuple)):
+        # Single input answered with a bare 1-D vector
+        return [_flatten_embedding_payload(payload)]
+    if len(payload) != expected:
+        raise EmbeddingError(f"Embedding response has {len(payload)} rows, expected {expected}")
+    return [_flatten_embedding_payload(row) for row in payload]
+
+
+def _chunked(items: Sequence[str], size: int) -> Iterator[List[str]]:
+    for start in range(0, len(items), size):
+        yield list(items[start : start + size])
 
 
-async def _hf_bge_m3_embedding(text: str, api_key: Optional[str]) -> List[float]:
+async def _hf_bge_m3_embeddings(texts: List[str], api_key: Optional[str]) -> List[List[float]]:
+    """Embed one provider-sized batch with a single HF Inference API call."""
     if not api_key:
         raise EmbeddingError("HF API key is required for HuggingFace embeddings")
 
@@ -74,93 +104,89 @@ async def _hf_bge_m3_embedding(text: str, api_key: Optional[str]) -> List[float]
         "Content-Type": "application/json",
     }
     json_payload = {
-        "inputs": text,
+        "inputs": texts,
         "task": "feature-extraction",
         # Ask HF to auto-load the model on first call
         "options": {"wait_for_model": True},
     }
 
-    async with httpx.AsyncClient(timeout=httpx.Timeout(60.0)) as client:
-        # Retry a few times on transient model loading/timeouts
-        async for attempt in AsyncRetrying(
-            stop=stop_after_attempt(3),
-            wait=wait_exponential(multiplier=1, min=1, max=8),
-            retry=retry_if_exception_type(httpx.HTTPError),
-            reraise=True,
-        ):
-            with attempt:
-                resp = await client.post(url, headers=headers, json=json_payload)
-                # The HF API returns 200 on success; 5xx and 503 for loading
-                if resp.status_code >= 400:
-                    try:
-                        data = resp.json()
-                    except Exception:
-                        data = {"error": resp.text}
-                    message = data.get("error") if isinstance(data, dict) else str(data)
-                    raise EmbeddingError(
-                        f"HF Inference API error (status={resp.status_code}): {message}"
-                    )
-                payload = resp.json()
-                vector = _flatten_embedding_payload(payload)
-                return vector
+    client = http_clients.get("hf")
+    # Retry a few times on transient model loading/timeouts
+    async for attempt in AsyncRetrying(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=1, max=8),
+        retry=retry_if_exception_type(httpx.HTTPError),
+        reraise=True,
+    ):
+        with attempt:
+            resp = await client.post(url, headers=headers, json=json_payload)
+            # The HF API returns 200 on success; 5xx and 503 for loading
+            if resp.status_code >= 400:
+                try:
+                    data = resp.json()
+                except Exception:
+                    data = {"error": resp.text}
+                message = data.get("error") if isinstance(data, dict) else str(data)
+                raise EmbeddingError(
+                    f"HF Inference API error (status={resp.status_code}): {message}"
+                )
+            payload = resp.json()
+            return _flatten_embedding_batch(payload, len(texts))
 
     # Should not reach here due to reraise=True
     raise EmbeddingError("Unexpected failure to obtain embedding from HF provider")
 
 
-async def _openai_embedding(
-    text: str,
+async def _openai_embeddings(
+    texts: List[str],
     api_key: Optional[str],
     *,
     base_url: Optional[str] = None,
     model: Optional[str] = None,
-) -> List[float]:
+) -> List[List[float]]:
+    """Embed one provider-sized batch with a single OpenAI embeddings call."""
     if not api_key:
         raise EmbeddingError("OpenAI API key is required for OpenAI embeddings")
 
     url_base = (base_url or "https://api.openai.com/v1").rstrip("/")
     url = f"{url_base}/embeddings"
-    payload = {"input": text, "model": model or DEFAULT_OPENAI_EMBED_MODEL}
+    payload = {"input": texts, "model": model or DEFAULT_OPENAI_EMBED_MODEL}
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json",
     }
 
-    async with httpx.AsyncClient(timeout=httpx.Timeout(60.0)) as client:
-        resp = await client.post(url, headers=headers, json=payload)
-        if resp.status_code >= 400:
-            try:
-                data = resp.json()
-            except Exception:
-                data = {"error": resp.text}
-            if isinstance(data, dict):
-                message = data.get("error") or data
-                if isinstance(message, dict):
-                    message = message.get("message") or str(message)
-            else:
-                message = str(data)
-            raise EmbeddingError(
-                f"OpenAI embeddings API error (status={resp.status_code}): {message}"
-            )
-        data = resp.json()
+    client = http_clients.get("openai")
+    resp = await client.post(url, headers=headers, json=payload)
+    if resp.status_code >= 400:
         try:
-            vector = data["data"][0]["embedding"]
-        except Exception as exc:
-            raise EmbeddingError("Unexpected OpenAI embeddings response shape") from exc
-        return [float(x) for x in vector]
-
+            data = resp.json()
+        except Exception:
+            data = {"error": resp.text}
+        if isinstance(data, dict):
+            message = data.get("error") or data
+            if isinstance(message, dict):
+                message = message.get("message") or str(message)
+        else:
+            message = str(data)
+        raise EmbeddingError(
+            f"OpenAI embeddings API error (status={resp.status_code}): {message}"
+        )
+    data = resp.json()
+    try:
+        # Items carry their input index; don't rely on response ordering
+        items = sorted(data["data"], key=lambda item: int(item.get("index", 0)))
+        vectors = [[float(x) for x in item["embedding"]] for item in items]
+    except Exception as exc:
+        raise EmbeddingError("Unexpected OpenAI embeddings response shape") from exc
+    if len(vectors) != len(texts):
+        raise EmbeddingError(
+            f"OpenAI embeddings response has {len(vectors)} rows, expected {len(texts)}"
+        )
+    return vectors
 
-async def get_embedding(
-    text: str,
-    provider: Optional[str] = None,
-    api_key: Optional[str] = None,
-) -> List[float]:
-    """Get an L2-normalized embedding vector for the input text.
 
-    Provider selection:
-    - provider == "hf" (default): uses HuggingFace Inference API with BAAI/bge-m3
-    - provider == "mock": deterministic mock vector (for testing without network)
-    """
+def _resolve_provider(provider: Optional[str]) -> str:
     settings = get_settings()
     raw_choice = provider if provider is not None else settings.embed_provider
     # Auto-select provider when not explicitly set: prefer OpenAI if key exists
@@ -180,47 +206,412 @@ async def get_embedding(
     # Normalize ambiguous values to default
     if chosen in ("", "none", "null", "default", "auto"):
         chosen = "hf"
+    return chosen
+
+
+def keyless_fallback_provider() -> Optional[str]:
+    """Provider override for request handlers: "mock" when nothing usable is configured.
+
+    The local provider needs no key, so it is never overridden.
+    """
+    settings = get_settings()
+    if _resolve_provider(None) == "local":
+        return None
+    if not settings.hf_api_key and not settings.openai_api_key:
+        return "mock"
+    return None
+
+
+# Length bounds for note fields and the combined text embedded for a note
+TITLE_MAX_CHARS = 4000
+DESCRIPTION_MAX_CHARS = 8000
+NOTE_TEXT_MAX_CHARS = 12000
+
+
+def note_embedding_text(title: Optional[str], description: Optional[str]) -> str:
+    """The text embedded for a note, shared by the request handlers and the worker."""
+    return clean_text(f"{title or ''}\n\n{description or ''}", max_len=NOTE_TEXT_MAX_CHARS)
+
+
+def _model_for(provider: str) -> str:
+    if provider == "hf":
+        return DEFAULT_HF_MODEL
+    if provider == "openai":
+        return get_settings().openai_embed_model or DEFAULT_OPENAI_EMBED_MODEL
+    if provider == "local":
+        model_dir = get_settings().local_embed_model_dir or ""
+        return os.path.basename(os.path.normpath(model_dir)) or "local"
+    return provider
+
+
+def _stack(rows: List[List[float]]) -> np.ndarray:
+    try:
+        return as_float32(rows)
+    except ValueError as exc:
+        raise EmbeddingError("Provider returned embeddings of inconsistent dimension") from exc
+
+
+async def _call_provider(texts: List[str], provider: str, api_key: Optional[str]) -> np.ndarray:
+    settings = get_settings()
+
+    if provider == "mock":
+        return l2_normalize(mock_embeddings(texts))
+
+    if provider == "hf":
+        raw: List[List[float]] = []
+        for batch in _chunked(texts, HF_MAX_BATCH):
+            raw.extend(await _hf_bge_m3_embeddings(batch, api_key))
+        return l2_normalize(_stack(raw))
+
+    if provider == "openai":
+        raw = []
+        for batch in _chunked(texts, OPENAI_MAX_BATCH):
+            raw.extend(
+                await _openai_embeddings(
+                    batch,
+                    api_key,
+                    base_url=settings.openai_base_url,
+                    model=_model_for("openai"),
+                )
+            )
+        return l2_normalize(_stack(raw))
+
+    if provider == "local":
+        chunks: List[np.ndarray] = []
+        try:
+            # Raises too when LOCAL_EMBED_MODEL_DIR is unset; a failover chain moves on
+            embedder = get_local_embedder()
+            for batch in _chunked(texts, LOCAL_MAX_BATCH):
+                chunks.append(await embedder.embed(batch))
+        except LocalEmbedderError as exc:
+            raise EmbeddingError(str(exc)) from exc
+        return l2_normalize(np.concatenate(chunks))
+
+    raise EmbeddingError(f"Unsupported embedding provider: {provider}")
+
+
+async def _embed_uncached(texts: List[str], provider: str, api_key: Optional[str]) -> np.ndarray:
+    # Only real upstream calls feed provider health; cache hits would skew latency
+    router = get_provider_router()
+    started = time.perf_counter()
+    try:
+        vectors = await _call_provider(texts, provider, api_key)
+    except Exception:
+        router.record_failure(provider)
+        raise
+    router.record_success(provider, time.perf_counter() - started)
+    return vectors
+
+
+async def _embed_and_cache(
+    pending: Dict[str, str], provider: str, api_key: Optional[str]
+) -> Dict[str, np.ndarray]:
+    vectors = await _embed_uncached(list(pending.values()), provider, api_key)
+    fresh = dict(zip(pending.keys(), vectors))
+    await get_embedding_cache().put_many(fresh)
+    return fresh
+
+
+_Group = Tuple[str, Optional[str]]
+
+
+class EmbeddingCoalescer:
+    """Micro-batcher for concurrent embedding cache misses.
+
+    Misses from concurrent callers are queued per (provider, api key) and flushed as one
+    upstream batch after `window_ms` or once `max_items` are queued, whichever comes first.
+    Identical in-flight texts (same cache key) share a single future, so a burst of the
+    same query costs one embedding. Not thread-safe; runs on the event loop.
+    """
+
+    def __init__(self, *, window_ms: float, max_items: int) -> None:
+        self.window = max(0.0, float(window_ms)) / 1000.0
+        self.max_items = max(1, int(max_items))
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._queues: Dict[_Group, Dict[str, str]] = {}
+        self._timers: Dict[_Group, asyncio.TimerHandle] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.items = 0
+        self.shared = 0
+
+    async def embed(
+        self, provider: str, api_key: Optional[str], pending: Dict[str, str]
+    ) -> Dict[str, np.ndarray]:
+        loop = asyncio.get_running_loop()
+        group: _Group = (provider, api_key)
+        waits: Dict[str, asyncio.Future] = {}
+        for cache_id, text in pending.items():
+            future = self._inflight.get(cache_id)
+            if future is not None and future.get_loop() is loop:
+                self.shared += 1
+            else:
+                future = loop.create_future()
+                self._inflight[cache_id] = future
+                self._queues.setdefault(group, {})[cache_id] = text
+            waits[cache_id] = future
+
+        queue = self._queues.get(group)
+        if queue:
+            if self.window <= 0 or len(queue) >= self.max_items:
+                self._flush(group)
+            elif group not in self._timers:
+                self._timers[group] = loop.call_later(self.window, self._flush, group)
+
+        # Shield so one cancelled caller doesn't cancel a future others are waiting on
+        results = await asyncio.gather(*(asyncio.shield(f) for f in waits.values()))
+        return dict(zip(waits.keys(), results))
+
+    def _flush(self, group: _Group) -> None:
+        timer = self._timers.pop(group, None)
+        if timer is not None:
+            timer.cancel()
+        queue = self._queues.pop(group, None)
+        if not queue:
+            return
+        task = asyncio.ensure_future(self._run(group, queue))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, group: _Group, queue: Dict[str, str]) -> None:
+        provider, api_key = group
+        self.batches += 1
+        self.items += len(queue)
+        vectors: Dict[str, np.ndarray] = {}
+        error: Optional[BaseException] = None
+        try:
+            vectors = await _embed_and_cache(queue, provider, api_key)
+        except Exception as exc:
+            error = exc
+        finally:
+            # Also runs when the batch is cancelled (shutdown): every waiter is released and
+            # no later caller attaches to a future nothing will resolve
+            for cache_id in queue:
+                future = self._inflight.pop(cache_id, None)
+                if future is None or future.done():
+                    continue
+                if cache_id in vectors:
+                    future.set_result(vectors[cache_id])
+                else:
+                    future.set_exception(error or EmbeddingError("Embedding batch was cancelled"))
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": self.window * 1000.0,
+            "max_items": self.max_items,
+            "batches": self.batches,
+            "items": self.items,
+            "shared_inflight": self.shared,
+            "inflight": len(self._inflight),
+        }
+
+
+@lru_cache(maxsize=1)
+def get_embedding_coalescer() -> EmbeddingCoalescer:
+    settings = get_settings()
+    return EmbeddingCoalescer(
+        window_ms=settings.embed_batch_window_ms,
+        max_items=settings.embed_batch_max_items,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_provider_router() -> ProviderRouter:
+    settings = get_settings()
+    return ProviderRouter(
+        failure_threshold=settings.embed_circuit_failures,
+        reset_after=settings.embed_circuit_reset_seconds,
+        hedge_default_delay=settings.embed_hedge_delay_ms / 1000.0,
+    )
+
 
-    if chosen == "mock":
-        # Deterministic 1024-dim pseudo-embedding for tests (no network, no keys)
-        seed_len = float(len(text or ""))
-        seed_sum = float(sum(ord(c) for c in (text or ""))) or 1.0
-        vec = []
-        for i in range(1024):
-            val = math.sin(0.017 * (i + 1) * seed_len) + math.cos(0.013 * (i + 7) * seed_sum)
-            vec.append(val)
-        return _l2_normalize(vec)
+@dataclass(slots=True)
+class EmbeddingBatch:
+    """Vectors plus the provider/model that produced them.
 
+    Vectors from different models live in different spaces; `model_id` is what gets stored
+    next to each embedding so they are never compared with each other.
+    """
+
+    vectors: np.ndarray
+    provider: str
+    model: str
+
+    @property
+    def model_id(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+
+def _usable(chosen: str, api_key: Optional[str]) -> Tuple[str, Optional[str]]:
+    """Resolve the API key for a provider, degrading keyless HF to mock."""
+    settings = get_settings()
     if chosen == "hf":
         key = api_key or settings.hf_api_key
         if not key:
             # Graceful fallback for local/dev: use mock when key absent
-            seed_len = float(len(text or ""))
-            seed_sum = float(sum(ord(c) for c in (text or ""))) or 1.0
-            vec = []
-            for i in range(1024):
-                val = math.sin(0.017 * (i + 1) * seed_len) + math.cos(0.013 * (i + 7) * seed_sum)
-                vec.append(val)
-            return _l2_normalize(vec)
-        raw = await _hf_bge_m3_embedding(text, key)
-        return _l2_normalize(raw)
-
+            return "mock", None
+        return "hf", key
     if chosen == "openai":
-        key = api_key or settings.openai_api_key
-        raw = await _openai_embedding(
-            text,
-            key,
-            base_url=settings.openai_base_url,
-            model=settings.openai_embed_model or DEFAULT_OPENAI_EMBED_MODEL,
-        )
-        return _l2_normalize(raw)
+        return "openai", api_key or settings.openai_api_key
+    if chosen in ("mock", "local"):
+        return chosen, None
+    raise EmbeddingError(f"Unsupported embedding provider: {chosen}")
 
-    raise EmbeddingError(f"Unsupported embedding provider: {provider}")
+
+def _fallback_chain() -> List[str]:
+    # Only fall back to providers that can actually serve (no silent HF -> mock downgrade)
+    settings = get_settings()
+    usable = []
+    for name in settings.embed_fallback_providers:
+        name = name.lower()
+        if name == "hf" and not settings.hf_api_key:
+            continue
+        if name == "openai" and not settings.openai_api_key:
+            continue
+        if name in ("hf", "openai", "local", "mock"):
+            usable.append(name)
+    return usable
+
+
+def configured_model_id() -> str:
+    """Model id of the provider request handlers use by default (see `keyless_fallback_provider`)."""
+    chosen, _ = _usable(_resolve_provider(keyless_fallback_provider()), None)
+    return f"{chosen}:{_model_for(chosen)}"
+
+
+async def _embed_with(items: List[str], chosen: str, key: Optional[str]) -> np.ndarray:
+    settings = get_settings()
+    cache = get_embedding_cache()
+    model = _model_for(chosen)
+    keys = [cache_key(chosen, model, settings.embed_dimension, text) for text in items]
+    found = await cache.get_many(keys)
+
+    # Embed each distinct missing text once
+    pending: Dict[str, str] = {}
+    for cache_id, text in zip(keys, items):
+        if cache_id not in found and cache_id not in pending:
+            pending[cache_id] = text
+    if pending:
+        coalescer = get_embedding_coalescer()
+        if len(pending) < coalescer.max_items:
+            found.update(await coalescer.embed(chosen, key, pending))
+        else:
+            # Already a full batch; nothing to gain from waiting for company
+            found.update(await _embed_and_cache(pending, chosen, key))
+
+    return np.stack([found[cache_id] for cache_id in keys])
+
+
+async def embed_texts(
+    texts: Sequence[str],
+    provider: Optional[str] = None,
+    api_key: Optional[str] = None,
+    *,
+    hedge: bool = False,
+) -> EmbeddingBatch:
+    """Get L2-normalized float32 embeddings (n, d) for many texts, in input order.
+
+    Inputs are split into provider-sized batches (`OPENAI_MAX_BATCH`, `HF_MAX_BATCH`) and
+    each batch is sent as one upstream request. Provider selection matches `get_embedding`.
+    Results are served from the embedding cache when the same provider/model/text was
+    embedded before; only misses go upstream, coalesced with other concurrent callers'
+    misses by `EmbeddingCoalescer`.
+
+    If the provider fails (or its circuit is open) the whole batch moves to the next entry
+    of EMBED_FALLBACK_PROVIDERS, so one batch never mixes models. `hedge=True` (for
+    latency-sensitive queries, honoured when EMBED_HEDGE_QUERIES is set) races the first
+    fallback after the primary's p95 latency.
+    """
+    settings = get_settings()
+    items = [text or "" for text in texts]
+    primary, primary_key = _usable(_resolve_provider(provider), api_key)
+    if not items:
+        return EmbeddingBatch(np.zeros((0, 0), dtype=np.float32), primary, _model_for(primary))
+
+    router = get_provider_router()
+    candidates = router.candidates([primary, *_fallback_chain()])
+
+    async def attempt(name: str) -> np.ndarray:
+        key = primary_key if name == primary else _usable(name, None)[1]
+        return await _embed_with(items, name, key)
+
+    name, vectors = await router.call(
+        candidates,
+        attempt,
+        hedge=hedge and settings.embed_hedge_queries,
+        retry_on=(EmbeddingError, httpx.HTTPError),
+    )
+    return EmbeddingBatch(vectors, name, _model_for(name))
+
+
+async def get_embeddings_array(
+    texts: Sequence[str],
+    provider: Optional[str] = None,
+    api_key: Optional[str] = None,
+) -> np.ndarray:
+    """Array-only variant of `embed_texts`."""
+    return (await embed_texts(texts, provider=provider, api_key=api_key)).vectors
+
+
+async def get_embeddings(
+    texts: Sequence[str],
+    provider: Optional[str] = None,
+    api_key: Optional[str] = None,
+) -> List[List[float]]:
+    """List-of-lists variant of `embed_texts`."""
+    return (await get_embeddings_array(texts, provider=provider, api_key=api_key)).tolist()
+
+
+async def embed_for_index(
+    texts: Sequence[str],
+    provider: Optional[str] = None,
+    api_key: Optional[str] = None,
+    *,
+    hedge: bool = False,
+) -> EmbeddingBatch:
+    """`embed_texts` with vectors fitted to `Settings.embed_dimension` (the pgvector column)."""
+    batch = await embed_texts(texts, provider=provider, api_key=api_key, hedge=hedge)
+    if batch.vectors.size:
+        dim = int(get_settings().embed_dimension or batch.vectors.shape[-1])
+        batch.vectors = fit_dimension(batch.vectors, dim)
+    return batch
+
+
+async def get_embedding(
+    text: str,
+    provider: Optional[str] = None,
+    api_key: Optional[str] = None,
+) -> List[float]:
+    """Get an L2-normalized embedding vector for the input text.
+
+    Provider selection:
+    - provider == "hf" (default): uses HuggingFace Inference API with BAAI/bge-m3
+    - provider == "openai": OpenAI-compatible /embeddings endpoint
+    - provider == "local": in-process ONNX model from LOCAL_EMBED_MODEL_DIR (CPU, offline)
+    - provider == "mock": deterministic mock vector (for testing without network)
+    """
+    vectors = await get_embeddings_array([text], provider=provider, api_key=api_key)
+    return vectors[0].tolist()
 
 
 __all__ = [
+    "DESCRIPTION_MAX_CHARS",
+    "NOTE_TEXT_MAX_CHARS",
+    "TITLE_MAX_CHARS",
+    "EmbeddingBatch",
+    "EmbeddingCoalescer",
     "EmbeddingError",
     "get_embedding",
+    "get_embeddings",
+    "get_embeddings_array",
+    "get_embedding_coalescer",
+    "get_provider_router",
+    "configured_model_id",
+    "embed_for_index",
+    "embed_texts",
+    "keyless_fallback_provider",
+    "clean_text",
+    "note_embedding_text",
     "DEFAULT_HF_MODEL",
     "DEFAULT_OPENAI_EMBED_MODEL",
 ]
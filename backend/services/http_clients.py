@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import httpx
+
+from ..settings import get_settings
+
+try:  # Optional h2 for HTTP/2 multiplexing (pip install httpx[http2])
+    import h2  # type: ignore  # noqa: F401
+
+    _HAS_H2 = True
+except Exception:  # pragma: no cover
+    _HAS_H2 = False
+
+
+@dataclass(frozen=True)
+class UpstreamConfig:
+    max_connections: int
+    max_keepalive: int
+    timeout: float
+    keepalive_expiry: float = 60.0
+
+
+# Per-upstream pool sizing. Unknown names fall back to "default".
+UPSTREAMS: Dict[str, UpstreamConfig] = {
+    "openai": UpstreamConfig(max_connections=20, max_keepalive=10, timeout=60.0),
+    "hf": UpstreamConfig(max_connections=10, max_keepalive=5, timeout=60.0),
+    # Scraping hits arbitrary hosts, so keep-alive buys little; bound concurrency instead
+    "scraper": UpstreamConfig(max_connections=20, max_keepalive=5, timeout=20.0, keepalive_expiry=15.0),
+    "default": UpstreamConfig(max_connections=10, max_keepalive=5, timeout=60.0),
+}
+
+
+def build_async_client(config: UpstreamConfig, **kwargs: Any) -> httpx.AsyncClient:
+    """An httpx.AsyncClient with `config`'s timeout and pool bounds; the caller owns it."""
+    http2 = bool(get_settings().http2_enabled and _HAS_H2)
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(config.timeout),
+        limits=httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive,
+            keepalive_expiry=config.keepalive_expiry,
+        ),
+        http2=http2,
+        **kwargs,
+    )
+
+
+@dataclass
+class _UpstreamStats:
+    requests: int = 0
+    responses: int = 0
+    errors: int = 0
+
+
+class HttpClientRegistry:
+    """Holds one long-lived httpx.AsyncClient per upstream for the application lifecycle.
+
+    Clients are created lazily on first use so scripts and tests work without the app
+    startup hook; `start` just builds them eagerly.
+    """
+
+    def __init__(self) -> None:
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._stats: Dict[str, _UpstreamStats] = {}
+
+    def _build(self, name: str) -> httpx.AsyncClient:
+        config = UPSTREAMS.get(name) or UPSTREAMS["default"]
+        stats = self._stats.setdefault(name, _UpstreamStats())
+
+        async def on_request(request: httpx.Request) -> None:
+            stats.requests += 1
+
+        async def on_response(response: httpx.Response) -> None:
+            stats.responses += 1
+            if response.status_code >= 400:
+                stats.errors += 1
+
+        return build_async_client(config, event_hooks={"request": [on_request], "response": [on_response]})
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._build(name)
+            self._clients[name] = client
+        return client
+
+    def start(self) -> None:
+        for name in UPSTREAMS:
+            if name != "default":
+                self.get(name)
+
+    async def aclose(self) -> None:
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
+
+    def stats(self) -> dict:
+        out: Dict[str, dict] = {}
+        for name, stats in self._stats.items():
+            config = UPSTREAMS.get(name) or UPSTREAMS["default"]
+            entry = {
+                "requests": stats.requests,
+                "responses": stats.responses,
+                "errors": stats.errors,
+                "max_connections": config.max_connections,
+            }
+            client = self._clients.get(name)
+            if client is not None:
+                entry.update(pool_usage(client))
+            out[name] = entry
+        return out
+
+
+def pool_usage(client: httpx.AsyncClient) -> dict:
+    # httpx doesn't expose pool state publicly; read httpcore's pool best-effort. Unknown
+    # transports report zeros; tests/test_http_clients.py pins the output against httpcore
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", []) or [])
+    idle = 0
+    for conn in connections:
+        try:
+            if conn.is_idle():
+                idle += 1
+        except Exception:
+            continue
+    return {"connections": len(connections), "idle": idle, "active": len(connections) - idle}
+
+
+http_clients = HttpClientRegistry()
+
+
+__all__ = [
+    "HttpClientRegistry",
+    "UpstreamConfig",
+    "UPSTREAMS",
+    "build_async_client",
+    "http_clients",
+    "pool_usage",
+]
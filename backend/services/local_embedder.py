@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+
+from ..settings import get_settings
+
+try:  # Optional ONNX Runtime + tokenizers for EMBED_PROVIDER=local
+    import onnxruntime as ort  # type: ignore
+    from tokenizers import Tokenizer  # type: ignore
+except Exception:  # pragma: no cover
+    ort = None  # type: ignore
+    Tokenizer = None  # type: ignore
+
+
+class LocalEmbedderError(RuntimeError):
+    pass
+
+
+def _mean_pool(hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Attention-mask-weighted mean over the token axis: (n, t, d) -> (n, d)."""
+    weights = mask.astype(np.float32)[:, :, None]
+    summed = (hidden * weights).sum(axis=1)
+    counts = np.clip(weights.sum(axis=1), 1e-9, None)
+    return summed / counts
+
+
+class LocalEmbedder:
+    """Sentence-embedding model running in-process on ONNX Runtime.
+
+    The model directory must hold `model.onnx` and a HuggingFace `tokenizer.json`
+    (e.g. an exported all-MiniLM-L6-v2 or bge-small). Inference runs on a bounded thread
+    pool so the event loop never blocks; ORT releases the GIL while it computes.
+    """
+
+    def __init__(self, model_dir: str, *, threads: int = 2, max_length: int = 256) -> None:
+        self.model_dir = model_dir
+        self.model_name = os.path.basename(os.path.normpath(model_dir)) or "local"
+        self.threads = max(1, int(threads))
+        self.max_length = max(8, int(max_length))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._session = None
+        self._tokenizer = None
+        self._input_names: List[str] = []
+        # The pool's threads may all hit the first request at once; only one builds the session
+        self._load_lock = threading.Lock()
+
+    def _load(self) -> None:
+        if self._session is not None:
+            return
+        with self._load_lock:
+            if self._session is None:
+                self._load_locked()
+
+    def _load_locked(self) -> None:
+        if ort is None or Tokenizer is None:
+            raise LocalEmbedderError(
+                "EMBED_PROVIDER=local requires the onnxruntime and tokenizers packages"
+            )
+        model_path = os.path.join(self.model_dir, "model.onnx")
+        tokenizer_path = os.path.join(self.model_dir, "tokenizer.json")
+        if not (os.path.isfile(model_path) and os.path.isfile(tokenizer_path)):
+            raise LocalEmbedderError(
+                f"LOCAL_EMBED_MODEL_DIR must contain model.onnx and tokenizer.json: {self.model_dir}"
+            )
+        options = ort.SessionOptions()
+        # Parallelism comes from the thread pool; keep each run single-threaded
+        options.intra_op_num_threads = 1
+        options.inter_op_num_threads = 1
+        tokenizer = Tokenizer.from_file(tokenizer_path)
+        tokenizer.enable_truncation(max_length=self.max_length)
+        tokenizer.enable_padding()
+        session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self._input_names = [i.name for i in session.get_inputs()]
+        self._tokenizer = tokenizer
+        self._session = session
+
+    def _embed_sync(self, texts: List[str]) -> np.ndarray:
+        self._load()
+        encodings = self._tokenizer.encode_batch(texts)  # type: ignore[union-attr]
+        ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.zeros_like(ids)
+        outputs = self._session.run(None, {k: v for k, v in feeds.items() if k in self._input_names})  # type: ignore[union-attr]
+        hidden = np.asarray(outputs[0], dtype=np.float32)
+        # Some exports already pool to (n, d); token-level outputs are (n, t, d)
+        if hidden.ndim == 3:
+            hidden = _mean_pool(hidden, mask)
+        return hidden
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="local-embed")
+        return self._executor
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool(), self._embed_sync, list(texts))
+
+    async def warm_up(self) -> None:
+        # Load the model, then run one inference so the first real request isn't slow
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._pool(), self._load)
+        await self.embed(["warm up"])
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_embedder: Optional[LocalEmbedder] = None
+
+
+def get_local_embedder() -> LocalEmbedder:
+    global _embedder
+    if _embedder is None:
+        settings = get_settings()
+        if not settings.local_embed_model_dir:
+            raise LocalEmbedderError("LOCAL_EMBED_MODEL_DIR is required for EMBED_PROVIDER=local")
+        _embedder = LocalEmbedder(
+            settings.local_embed_model_dir,
+            threads=settings.local_embed_threads,
+            max_length=settings.local_embed_max_length,
+        )
+    return _embedder
+
+
+def close_local_embedder() -> None:
+    global _embedder
+    if _embedder is not None:
+        _embedder.close()
+        _embedder = None
+
+
+__all__ = [
+    "LocalEmbedder",
+    "LocalEmbedderError",
+    "close_local_embedder",
+    "get_local_embedder",
+]
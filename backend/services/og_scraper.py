@@ -4,9 +4,10 @@ import re
 from dataclasses import dataclass
 from typing import Optional
 
-import httpx
 from bs4 import BeautifulSoup
 
+from .http_clients import http_clients
+
 
 @dataclass(slots=True)
 class ScrapedMetadata:
@@ -44,10 +45,10 @@ async def fetch_og_metadata(url: str) -> ScrapedMetadata:
         "Accept-Language": "en-US,en;q=0.8",
     }
 
-    async with httpx.AsyncClient(timeout=httpx.Timeout(20.0)) as client:
-        resp = await client.get(url, headers=headers, follow_redirects=True)
-        resp.raise_for_status()
-        html = resp.text
+    client = http_clients.get("scraper")
+    resp = await client.get(url, headers=headers, follow_redirects=True)
+    resp.raise_for_status()
+    html = resp.text
 
     soup = BeautifulSoup(html, "html.parser")
 
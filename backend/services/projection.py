@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from typing import Any, Optional, Tuple
+
+import numpy as np
+
+from .vector_ops import as_float32, l2_normalize
+
+
+logger = logging.getLogger(__name__)
+
+PROJECTION_METHODS = ("pca", "truncate")
+
+
+@dataclass(frozen=True)
+class Projection:
+    """A versioned linear map from stored embeddings to the compact ANN column.
+
+    `project(x)` is `l2_normalize((x - mean) @ components.T)`. PCA fits `mean` and the top
+    principal `components`; "truncate" (Matryoshka-style models) keeps the leading
+    dimensions with a zero mean. Only vectors from `source_model` are projected.
+    """
+
+    version: int
+    method: str
+    source_model: str
+    mean: np.ndarray  # (input_dim,)
+    components: np.ndarray  # (output_dim, input_dim)
+
+    @property
+    def input_dim(self) -> int:
+        return int(self.components.shape[1])
+
+    @property
+    def output_dim(self) -> int:
+        return int(self.components.shape[0])
+
+    def project(self, vectors: Any) -> np.ndarray:
+        return l2_normalize((as_float32(vectors) - self.mean) @ self.components.T)
+
+    @classmethod
+    def from_row(cls, row: Any) -> "Projection":
+        input_dim, output_dim = int(row["input_dim"]), int(row["output_dim"])
+        mean = np.frombuffer(bytes(row["mean"]), dtype="<f4").astype(np.float32)
+        components = np.frombuffer(bytes(row["components"]), dtype="<f4").astype(np.float32)
+        return cls(
+            version=int(row["version"]),
+            method=row["method"],
+            source_model=row["source_model"],
+            mean=mean.reshape(input_dim),
+            components=components.reshape(output_dim, input_dim),
+        )
+
+
+def fit_pca(vectors: Any, output_dim: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Mean and top `output_dim` principal components of `vectors` (n, d)."""
+    data = as_float32(vectors)
+    if data.shape[0] < output_dim:
+        raise ValueError(f"PCA to {output_dim} dims needs at least {output_dim} vectors, got {data.shape[0]}")
+    mean = data.mean(axis=0)
+    # Rows of vt are the principal axes, by decreasing variance
+    _, _, vt = np.linalg.svd(data - mean, full_matrices=False)
+    return mean.astype(np.float32), vt[:output_dim].astype(np.float32)
+
+
+def truncation(input_dim: int, output_dim: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Identity on the first `output_dim` dimensions, for Matryoshka-trained models."""
+    if output_dim > input_dim:
+        raise ValueError("Cannot truncate to more dimensions than the input has")
+    return np.zeros(input_dim, dtype=np.float32), np.eye(output_dim, input_dim, dtype=np.float32)
+
+
+class ProjectionRegistry:
+    """Holds the active projection, loaded once at startup from public.embedding_projections."""
+
+    def __init__(self) -> None:
+        self.active: Optional[Projection] = None
+
+    async def load(self, conn: Any) -> Optional[Projection]:
+        try:
+            row = await conn.fetchrow(
+                "select version, method, source_model, input_dim, output_dim, mean, components "
+                "from public.embedding_projections where active order by version desc limit 1"
+            )
+        except Exception as exc:
+            # Table missing (schema not re-applied) just means no projection
+            logger.warning("Could not load embedding projection: %s", exc)
+            row = None
+        self.active = Projection.from_row(row) if row is not None else None
+        return self.active
+
+    def compact(self, vectors: Any, model_id: str) -> Optional[Tuple[np.ndarray, int]]:
+        """Projected vectors and the projection version, or None when not applicable."""
+        projection = self.active
+        if projection is None or model_id != projection.source_model:
+            return None
+        values = as_float32(vectors)
+        if values.shape[-1] != projection.input_dim:
+            return None
+        return projection.project(values), projection.version
+
+    def stats(self) -> dict:
+        projection = self.active
+        if projection is None:
+            return {"active": False}
+        return {
+            "active": True,
+            "version": projection.version,
+            "method": projection.method,
+            "source_model": projection.source_model,
+            "input_dim": projection.input_dim,
+            "output_dim": projection.output_dim,
+        }
+
+
+projections = ProjectionRegistry()
+
+
+__all__ = [
+    "PROJECTION_METHODS",
+    "Projection",
+    "ProjectionRegistry",
+    "fit_pca",
+    "projections",
+    "truncation",
+]
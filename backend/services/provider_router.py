@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+
+T = TypeVar("T")
+
+# Rolling window sizes for latency percentiles and error rate
+LATENCY_WINDOW = 200
+OUTCOME_WINDOW = 50
+# Need this many samples before trusting the p95 for hedging
+MIN_LATENCY_SAMPLES = 10
+
+
+@dataclass
+class ProviderHealth:
+    """Rolling latency/error stats plus a consecutive-failure circuit breaker."""
+
+    name: str
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
+    outcomes: Deque[bool] = field(default_factory=lambda: deque(maxlen=OUTCOME_WINDOW))
+    consecutive_failures: int = 0
+    opened_at: Optional[float] = None
+    trial_in_flight: bool = False
+
+    def record_success(self, latency: float) -> None:
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self, *, threshold: int, now: float) -> None:
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        self.trial_in_flight = False
+        if self.consecutive_failures >= threshold:
+            # (Re)open; a failed half-open trial restarts the cool-down
+            self.opened_at = now
+
+    def state(self, *, reset_after: float, now: float) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if now - self.opened_at >= reset_after:
+            return "half_open"
+        return "open"
+
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+
+class ProviderRouter:
+    """Chooses embedding providers by health and runs calls with failover or hedging.
+
+    A provider's circuit opens after `failure_threshold` consecutive failures and lets a
+    single trial request through once `reset_after` seconds have passed. Hedged calls start
+    the next candidate if the first hasn't answered within its p95 latency (clamped to
+    `hedge_min_delay`..`hedge_max_delay`; `hedge_default_delay` until enough samples exist).
+    """
+
+    def __init__(
+        self,
+        *,
+        failure_threshold: int = 5,
+        reset_after: float = 30.0,
+        hedge_default_delay: float = 0.3,
+        hedge_min_delay: float = 0.05,
+        hedge_max_delay: float = 2.0,
+    ) -> None:
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_after = float(reset_after)
+        self.hedge_default_delay = float(hedge_default_delay)
+        self.hedge_min_delay = float(hedge_min_delay)
+        self.hedge_max_delay = float(hedge_max_delay)
+        self._health: Dict[str, ProviderHealth] = {}
+        self.hedges_started = 0
+        self.hedges_won = 0
+        self.failovers = 0
+
+    def health(self, name: str) -> ProviderHealth:
+        entry = self._health.get(name)
+        if entry is None:
+            entry = self._health[name] = ProviderHealth(name)
+        return entry
+
+    def record_success(self, name: str, latency: float) -> None:
+        self.health(name).record_success(latency)
+
+    def record_failure(self, name: str) -> None:
+        self.health(name).record_failure(threshold=self.failure_threshold, now=time.monotonic())
+
+    def _admissible(self, name: str, now: float) -> bool:
+        entry = self.health(name)
+        state = entry.state(reset_after=self.reset_after, now=now)
+        return state == "closed" or (state == "half_open" and not entry.trial_in_flight)
+
+    def _acquire(self, name: str) -> Optional[bool]:
+        """Admit `name` for one attempt, right before it starts.
+
+        Returns None if its circuit turns the attempt away, else whether the attempt is the
+        half-open trial (whose slot the caller must `_release`).
+        """
+        entry = self.health(name)
+        if not self._admissible(name, time.monotonic()):
+            return None
+        if entry.opened_at is None:
+            return False
+        entry.trial_in_flight = True
+        return True
+
+    def _release(self, name: str, trial: Optional[bool]) -> None:
+        # A trial that ended without recording an outcome (served from cache, cancelled, lost
+        # a hedge) frees the slot for the next caller; recording one already cleared it
+        if trial:
+            self.health(name).trial_in_flight = False
+
+    def candidates(self, ordered: Sequence[str]) -> List[str]:
+        """Providers in preference order, skipping open circuits.
+
+        Nothing is reserved here: `call` admits each provider (and takes a half-open
+        circuit's single trial) only when it is about to be tried. If every circuit is
+        open, the first provider is still returned so callers get a real error instead of
+        an empty list.
+        """
+        now = time.monotonic()
+        unique = list(dict.fromkeys(ordered))
+        admitted = [name for name in unique if self._admissible(name, now)]
+        return admitted or unique[:1]
+
+    def hedge_delay(self, name: str) -> float:
+        p95 = self.health(name).p95()
+        delay = self.hedge_default_delay if p95 is None else p95
+        return min(self.hedge_max_delay, max(self.hedge_min_delay, delay))
+
+    async def call(
+        self,
+        candidates: Sequence[str],
+        fn: Callable[[str], Awaitable[T]],
+        *,
+        hedge: bool = False,
+        retry_on: Tuple[type, ...] = (Exception,),
+    ) -> Tuple[str, T]:
+        """Run `fn(provider)` on the first candidate, failing over in order on errors.
+
+        With `hedge=True` and a second candidate, the second is started after the first
+        candidate's hedge delay and whichever succeeds first wins.
+        """
+        if not candidates:
+            raise ValueError("No provider candidates")
+        if hedge and len(candidates) > 1:
+            return await self._hedged(candidates[0], list(candidates[1:]), fn, retry_on)
+
+        last_exc: Optional[BaseException] = None
+        attempted = False
+        for index, name in enumerate(candidates):
+            is_last = index + 1 == len(candidates)
+            trial = self._acquire(name)
+            if trial is None and (attempted or not is_last):
+                # Circuit opened, or its trial started, since `candidates` was computed. The
+                # last one still runs when nothing else did, so the caller gets a real error
+                continue
+            attempted = True
+            try:
+                return name, await fn(name)
+            except retry_on as exc:
+                last_exc = exc
+                if not is_last:
+                    self.failovers += 1
+            finally:
+                self._release(name, trial)
+        assert last_exc is not None
+        raise last_exc
+
+    async def _hedged(
+        self,
+        primary: str,
+        others: List[str],
+        fn: Callable[[str], Awaitable[T]],
+        retry_on: Tuple[type, ...],
+    ) -> Tuple[str, T]:
+        primary_trial = self._acquire(primary)
+        if primary_trial is None:
+            return await self.call(others, fn, hedge=True, retry_on=retry_on)
+        trials: Dict[str, Optional[bool]] = {primary: primary_trial}
+        tasks: Dict[asyncio.Task, str] = {asyncio.ensure_future(fn(primary)): primary}
+        rest = list(others)
+        errors: List[BaseException] = []
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay(primary))
+            if not done or next(iter(done)).exception() is not None:
+                # Race the first fallback its circuit admits
+                while rest:
+                    name = rest.pop(0)
+                    trial = self._acquire(name)
+                    if trial is not None:
+                        trials[name] = trial
+                        self.hedges_started += 1
+                        tasks[asyncio.ensure_future(fn(name))] = name
+                        break
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    exc = task.exception()
+                    if exc is None:
+                        if tasks[task] != primary:
+                            self.hedges_won += 1
+                        return tasks[task], task.result()
+                    errors.append(exc)
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            for name, trial in trials.items():
+                self._release(name, trial)
+        if rest and all(isinstance(e, retry_on) for e in errors):
+            self.failovers += 1
+            return await self.call(rest, fn, retry_on=retry_on)
+        raise errors[-1]
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        providers = {}
+        for name, entry in self._health.items():
+            providers[name] = {
+                "state": entry.state(reset_after=self.reset_after, now=now),
+                "p95_ms": None if entry.p95() is None else round(entry.p95() * 1000.0, 1),
+                "error_rate": entry.error_rate(),
+                "consecutive_failures": entry.consecutive_failures,
+                "samples": len(entry.latencies),
+            }
+        return {
+            "providers": providers,
+            "failovers": self.failovers,
+            "hedges_started": self.hedges_started,
+            "hedges_won": self.hedges_won,
+        }
+
+
+__all__ = ["ProviderHealth", "ProviderRouter"]
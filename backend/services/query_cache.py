@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+from typing import Tuple
+
+import numpy as np
+
+from ..settings import get_settings
+from .lru_cache import LRUCache
+
+
+def normalize_query(text: str) -> str:
+    """Whitespace-insensitive form of a search query, used as the cache key.
+
+    Case is kept: it carries meaning for acronyms, names and code ("US" vs "us").
+    """
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+class QueryEmbeddingCache:
+    """Small TTL'd LRU of query vectors for /api/search and /api/chat retrieval.
+
+    Keyed by normalized query text and the active provider:model, so switching providers
+    never serves a vector from the wrong space. Values are fitted, read-only float32 rows.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        self._lru: LRUCache[np.ndarray] = LRUCache(max_entries, ttl_seconds=ttl_seconds)
+
+    @staticmethod
+    def key(text: str, model_id: str) -> Tuple[str, str]:
+        return (model_id, normalize_query(text))
+
+    def get(self, text: str, model_id: str) -> np.ndarray | None:
+        return self._lru.get(self.key(text, model_id))
+
+    def put(self, text: str, model_id: str, vector: np.ndarray) -> None:
+        vector = np.array(vector, dtype=np.float32)
+        vector.setflags(write=False)
+        self._lru.put(self.key(text, model_id), vector)
+
+    def stats(self) -> dict:
+        return self._lru.snapshot()
+
+
+@lru_cache(maxsize=1)
+def get_query_cache() -> QueryEmbeddingCache:
+    settings = get_settings()
+    return QueryEmbeddingCache(settings.query_cache_size, settings.query_cache_ttl_seconds)
+
+
+__all__ = ["QueryEmbeddingCache", "get_query_cache", "normalize_query"]
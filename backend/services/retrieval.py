@@ -0,0 +1,268 @@
+from __future__ import annotations
+
+from typing import Optional, Union
+
+
+# Reciprocal rank fusion constant (Cormack et al.); dampens the head of each ranking
+RRF_K = 60
+# Each branch returns this many candidates per requested result, within the bounds below
+CANDIDATE_MULTIPLIER = 4
+MIN_CANDIDATES = 40
+MAX_CANDIDATES = 800
+
+FUSION_MODES = ("weighted", "rrf")
+# Compact ANN index variants; see backend.scripts.migrate_hnsw --quantization
+QUANTIZATION_MODES = ("none", "halfvec", "binary")
+# pgvector caps hnsw.ef_search at this
+MAX_EF_SEARCH = 1000
+ITERATIVE_SCAN_MODES = ("relaxed_order", "strict_order", "off")
+
+NOTE_COLUMNS = "id, url, title, description, tags, created_at, updated_at"
+
+# Text search configs folded into the generated notes.search_tsv column (see schema.sql):
+# unstemmed tokens plus stemming for the app's languages (EN/AR/TR)
+TEXT_SEARCH_CONFIGS = ("simple", "english", "arabic", "turkish")
+# ts_rank_cd normalization 32 maps rank to rank / (rank + 1), i.e. into [0, 1)
+RANK_NORMALIZATION = 32
+
+
+def tsquery_sql(query: str) -> str:
+    """A tsquery matching `query` (an SQL expression) under any of TEXT_SEARCH_CONFIGS."""
+    parts = [f"websearch_to_tsquery('{config}', {query})" for config in TEXT_SEARCH_CONFIGS]
+    return "(" + " || ".join(parts) + ")"
+
+
+def text_rank_sql(query: str) -> str:
+    return f"ts_rank_cd(search_tsv, {tsquery_sql(query)}, {RANK_NORMALIZATION})"
+
+
+def candidate_count(top_k: int) -> int:
+    return max(MIN_CANDIDATES, min(MAX_CANDIDATES, top_k * CANDIDATE_MULTIPLIER))
+
+
+def scan_settings_sql(
+    *,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    iterative_scan: Optional[str] = None,
+) -> str:
+    """`SET LOCAL` statements tuning the vector index scan; run inside the search transaction.
+
+    `ef_search` applies to HNSW, `probes` to ivfflat. `iterative_scan` (pgvector >= 0.8)
+    lets the index keep scanning when filters such as `tags @>` discard candidates, instead
+    of returning fewer rows than the limit. ivfflat only supports relaxed ordering.
+    """
+    statements = []
+    if ef_search is not None:
+        statements.append(f"set local hnsw.ef_search = {min(int(ef_search), MAX_EF_SEARCH)}")
+    if probes is not None:
+        statements.append(f"set local ivfflat.probes = {int(probes)}")
+    if iterative_scan:
+        if iterative_scan not in ITERATIVE_SCAN_MODES:
+            raise ValueError(f"Unknown iterative scan mode: {iterative_scan}")
+        statements.append(f"set local hnsw.iterative_scan = {iterative_scan}")
+        ivf_mode = "off" if iterative_scan == "off" else "relaxed_order"
+        statements.append(f"set local ivfflat.iterative_scan = {ivf_mode}")
+    return "; ".join(statements)
+
+
+def hybrid_search_sql(
+    *,
+    vec: str,
+    query: str,
+    limit: str,
+    candidates: str,
+    model: str,
+    default_model: str,
+    tags: Optional[str] = None,
+    weight: Union[float, str] = 0.7,
+    fusion: str = "weighted",
+    rrf: Optional[str] = None,
+    quantization: str = "none",
+    rescore_factor: int = 4,
+    dimension: int = 1024,
+    compact_vec: Optional[str] = None,
+    compact_version: Optional[str] = None,
+) -> str:
+    """SQL for two-branch hybrid retrieval over public.notes.
+
+    Arguments are SQL expressions (usually `$n` placeholders) so callers control parameter
+    numbering. The vector branch is a KNN `order by embedding <=> vec limit candidates`
+    that the ivfflat/hnsw index serves, restricted to rows embedded by the query's model;
+    the keyword branch is a full-text `search_tsv @@ tsquery` match served by its GIN index.
+    Only the union of both candidate lists is scored, so cost follows `candidates`, not the
+    table size.
+
+    `fusion="weighted"` blends cosine similarity and normalized `ts_rank_cd` by `weight`;
+    `fusion="rrf"` blends reciprocal ranks instead, which ignores score scales. A NULL
+    `vec` disables the vector branch (keyword-only ranking). For per-row parameters (e.g.
+    inside a LATERAL join) `weight` may be an SQL expression, and `rrf`, a boolean SQL
+    expression, picks the fusion mode per row instead of `fusion`.
+
+    With `quantization` "halfvec" or "binary" the KNN runs on the matching compact
+    expression index (`embedding::halfvec(dimension)` or `binary_quantize(embedding)`),
+    fetches `rescore_factor` times the candidates and keeps the best by exact cosine
+    distance on the full-precision column. `compact_vec` (the query under the active
+    projection) and `compact_version` do the same over the reduced-dimension
+    `embedding_compact` index, restricted to rows projected with that version; they take
+    precedence over `quantization`.
+    """
+    if fusion not in FUSION_MODES:
+        raise ValueError(f"Unknown fusion mode: {fusion}")
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode: {quantization}")
+    if isinstance(weight, str):
+        w, one_minus_w = f"({weight})", f"(1.0 - {weight})"
+    else:
+        weight = 0.0 if weight < 0 else (1.0 if weight > 1.0 else float(weight))
+        w, one_minus_w = f"({weight:.6f})", f"({1.0 - weight:.6f})"
+    tag_filter = f" and tags @> {tags}::text[]" if tags else ""
+
+    vector_filter = (
+        f"where {vec}::vector is not null and embedding is not null "
+        f"and coalesce(embedding_model, {default_model}) = {model}{tag_filter}"
+    )
+    if compact_vec is not None:
+        vector_candidates = (
+            f"select id, embedding <=> {vec}::vector as dist from (select id, embedding "
+            f"from public.notes {vector_filter} and embedding_compact_version = {compact_version} "
+            f"order by embedding_compact <=> {compact_vec}::vector "
+            f"limit ({candidates}) * {int(rescore_factor)}) q order by dist limit {candidates}"
+        )
+    elif quantization == "none":
+        vector_candidates = (
+            f"select id, embedding <=> {vec}::vector as dist from public.notes "
+            f"{vector_filter} order by dist limit {candidates}"
+        )
+    else:
+        if quantization == "halfvec":
+            approx = f"embedding::halfvec({dimension}) <=> {vec}::vector::halfvec({dimension})"
+        else:
+            approx = f"binary_quantize(embedding)::bit({dimension}) <~> binary_quantize({vec}::vector)"
+        # Over-fetch from the compact index, then rescore exactly
+        vector_candidates = (
+            f"select id, embedding <=> {vec}::vector as dist from (select id, embedding "
+            f"from public.notes {vector_filter} order by {approx} "
+            f"limit ({candidates}) * {int(rescore_factor)}) q order by dist limit {candidates}"
+        )
+    vector_branch = (
+        "select id, 1.0 - dist as vscore, row_number() over (order by dist) as vrank, "
+        "null::float8 as kscore, null::bigint as krank "
+        f"from ({vector_candidates}) v"
+    )
+    keyword_branch = (
+        "select id, null::float8 as vscore, null::bigint as vrank, "
+        "kscore, row_number() over (order by kscore desc) as krank "
+        f"from (select id, {text_rank_sql(query)} as kscore "
+        f"from public.notes where search_tsv @@ {tsquery_sql(query)}{tag_filter} "
+        f"order by kscore desc limit {candidates}) k"
+    )
+
+    rrf_score = (
+        f"{w} * coalesce(1.0 / ({RRF_K} + c.vrank), 0.0) + "
+        f"{one_minus_w} * coalesce(1.0 / ({RRF_K} + c.krank), 0.0)"
+    )
+    weighted_score = (
+        f"{w} * coalesce(c.vscore, 0.0) + "
+        f"{one_minus_w} * coalesce(c.kscore, 0.0)"
+    )
+    if rrf is not None:
+        score = f"case when {rrf} then {rrf_score} else {weighted_score} end"
+    elif fusion == "rrf":
+        score = rrf_score
+    else:
+        score = weighted_score
+
+    # A note found by both branches appears twice in the union; collapse to one row
+    fused = (
+        "select id, max(vscore) as vscore, min(vrank) as vrank, "
+        "max(kscore) as kscore, min(krank) as krank "
+        f"from ({vector_branch} union all {keyword_branch}) u group by id"
+    )
+    return (
+        f"select {NOTE_COLUMNS}, {score} as score "
+        f"from ({fused}) c join public.notes using (id) "
+        f"order by score desc limit {limit}"
+    )
+
+
+# Per-search columns of the batch VALUES list, in parameter order
+BATCH_COLUMNS = (
+    ("ord", "int"),
+    ("qvec", "vector"),
+    ("qtext", "text"),
+    ("qlimit", "int"),
+    ("qcand", "int"),
+    ("qtags", "text[]"),
+    ("qweight", "float8"),
+    ("qrrf", "bool"),
+    ("qmodel", "text"),
+    ("qcompact", "vector"),
+)
+
+
+def batch_search_sql(
+    count: int,
+    *,
+    quantization: str = "none",
+    rescore_factor: int = 4,
+    dimension: int = 1024,
+    compact: bool = False,
+) -> str:
+    """One statement running `count` hybrid searches via VALUES + LATERAL.
+
+    Parameters are the BATCH_COLUMNS values for each search in turn (an empty `qtags`
+    array matches every note), followed by the configured default model id and the
+    projection version (NULL unless `compact`, which searches the projected index with
+    each row's `qcompact`). Each LATERAL
+    row gets its own index-served KNN and keyword scans. Rows come back with their `ord`,
+    ordered by `ord` and then score.
+    """
+    width = len(BATCH_COLUMNS)
+    rows = []
+    for i in range(count):
+        base = i * width
+        rows.append(
+            "(" + ", ".join(f"${base + j + 1}::{t}" for j, (_, t) in enumerate(BATCH_COLUMNS)) + ")"
+        )
+    inner = hybrid_search_sql(
+        vec="b.qvec",
+        query="b.qtext",
+        limit="b.qlimit",
+        candidates="b.qcand",
+        model="b.qmodel",
+        default_model=f"${count * width + 1}",
+        tags="b.qtags",
+        weight="b.qweight",
+        rrf="b.qrrf",
+        quantization=quantization,
+        rescore_factor=rescore_factor,
+        dimension=dimension,
+        compact_vec="b.qcompact" if compact else None,
+        compact_version=f"${count * width + 2}::int" if compact else None,
+    )
+    columns = ", ".join(name for name, _ in BATCH_COLUMNS)
+    return (
+        f"select b.ord, r.* from (values {', '.join(rows)}) as b({columns}) "
+        f"cross join lateral ({inner}) r "
+        "order by b.ord, r.score desc"
+    )
+
+
+__all__ = [
+    "BATCH_COLUMNS",
+    "CANDIDATE_MULTIPLIER",
+    "FUSION_MODES",
+    "ITERATIVE_SCAN_MODES",
+    "MAX_EF_SEARCH",
+    "NOTE_COLUMNS",
+    "QUANTIZATION_MODES",
+    "RRF_K",
+    "TEXT_SEARCH_CONFIGS",
+    "batch_search_sql",
+    "candidate_count",
+    "hybrid_search_sql",
+    "scan_settings_sql",
+    "text_rank_sql",
+    "tsquery_sql",
+]
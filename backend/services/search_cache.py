@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Any, Hashable, List, Optional, Sequence, Tuple
+
+from ..settings import get_settings
+from .lru_cache import LRUCache
+from .query_cache import normalize_query
+
+
+class NotesVersion:
+    """Process-wide counter bumped by every write that can change search results."""
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def bump(self) -> int:
+        self.value += 1
+        return self.value
+
+
+notes_version = NotesVersion()
+
+
+class SearchResultCache:
+    """TTL'd LRU of semantic_search results, tagged with the notes version they were read at.
+
+    A lookup only hits when the entry's version is still current, so a note write
+    invalidates every cached result in O(1); stale entries are dropped as they are found.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        self._lru: LRUCache[Tuple[int, List[Any]]] = LRUCache(max_entries, ttl_seconds=ttl_seconds)
+
+    @staticmethod
+    def key(
+        *,
+        query: str,
+        tags: Optional[Sequence[str]],
+        top_k: int,
+        hybrid_weight: float,
+        model_id: str,
+        extra: Tuple[Hashable, ...] = (),
+    ) -> Tuple[Hashable, ...]:
+        return (
+            model_id,
+            normalize_query(query),
+            tuple(sorted(set(tags or ()))),
+            int(top_k),
+            round(float(hybrid_weight), 6),
+            *extra,
+        )
+
+    def get(self, key: Tuple[Hashable, ...]) -> Optional[List[Any]]:
+        current = notes_version.value
+        entry = self._lru.get(key, valid=lambda e: e[0] == current)
+        return None if entry is None else list(entry[1])
+
+    def put(self, key: Tuple[Hashable, ...], results: List[Any], *, version: int) -> None:
+        """Store results read at `version`; pass the version captured before querying so a
+        write that lands mid-query leaves the entry already stale."""
+        if version != notes_version.value:
+            return
+        self._lru.put(key, (version, list(results)))
+
+    def stats(self) -> dict:
+        return {"notes_version": notes_version.value, **self._lru.snapshot()}
+
+
+@lru_cache(maxsize=1)
+def get_search_cache() -> SearchResultCache:
+    settings = get_settings()
+    return SearchResultCache(settings.search_cache_size, settings.search_cache_ttl_seconds)
+
+
+__all__ = ["NotesVersion", "SearchResultCache", "get_search_cache", "notes_version"]
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from typing import Iterable, Sequence, Union
+
+import numpy as np
+
+
+MOCK_DIMENSION = 1024
+
+# Norms at or below this are treated as zero vectors
+_EPS = 1e-12
+
+ArrayLike = Union[np.ndarray, Sequence[float], Sequence[Sequence[float]]]
+
+
+def as_float32(values: ArrayLike) -> np.ndarray:
+    """Return `values` as a float32 array without copying when it already is one."""
+    return np.asarray(values, dtype=np.float32)
+
+
+def mock_embeddings(texts: Iterable[str], dim: int = MOCK_DIMENSION) -> np.ndarray:
+    """Deterministic pseudo-embeddings for tests and keyless dev, shape (n, dim), unnormalized.
+
+    Row i is sin(0.017 * (j + 1) * len(text)) + cos(0.013 * (j + 7) * sum(ord(text))).
+    """
+    items = [text or "" for text in texts]
+    seed_len = np.array([float(len(t)) for t in items], dtype=np.float64)[:, None]
+    seed_sum = np.array([float(sum(map(ord, t))) or 1.0 for t in items], dtype=np.float64)[:, None]
+    j = np.arange(dim, dtype=np.float64)[None, :]
+    vec = np.sin(0.017 * (j + 1.0) * seed_len) + np.cos(0.013 * (j + 7.0) * seed_sum)
+    return vec.astype(np.float32)
+
+
+def degenerate_rows(values: ArrayLike) -> np.ndarray:
+    """Boolean mask of rows that are all-zero or contain NaN/inf. Scalar for 1-D input."""
+    arr = as_float32(values)
+    bad_values = ~np.isfinite(arr)
+    zero = np.abs(arr) <= _EPS
+    return bad_values.any(axis=-1) | zero.all(axis=-1)
+
+
+def is_degenerate(vector: ArrayLike) -> bool:
+    return bool(degenerate_rows(vector))
+
+
+def l2_normalize(values: ArrayLike) -> np.ndarray:
+    """L2-normalize a vector or each row of a matrix.
+
+    Rows with a zero or non-finite norm come back as zeros to signal an unusable vector
+    rather than exploding.
+    """
+    arr = as_float32(values)
+    with np.errstate(invalid="ignore", over="ignore"):
+        norms = np.linalg.norm(arr, axis=-1, keepdims=True)
+    usable = np.isfinite(norms) & (norms > _EPS)
+    safe = np.where(usable, norms, 1.0)
+    return np.where(usable, arr / safe, 0.0).astype(np.float32, copy=False)
+
+
+def fit_dimension(values: ArrayLike, dim: int) -> np.ndarray:
+    """Truncate or zero-pad vectors (last axis) to `dim`, then re-normalize."""
+    arr = as_float32(values)
+    current = arr.shape[-1]
+    if dim <= 0 or current == dim:
+        return arr
+    if current > dim:
+        fitted = arr[..., :dim]
+    else:
+        pad = [(0, 0)] * (arr.ndim - 1) + [(0, dim - current)]
+        fitted = np.pad(arr, pad)
+    return l2_normalize(fitted)
+
+
+__all__ = [
+    "MOCK_DIMENSION",
+    "as_float32",
+    "degenerate_rows",
+    "fit_dimension",
+    "is_degenerate",
+    "l2_normalize",
+    "mock_embeddings",
+]
@@ -40,6 +40,65 @@ class Settings(BaseSettings):
     groq_api_key: Optional[str] = Field(default=None, alias="GROQ_API_KEY")
     # Target embedding dimension for DB column (pgvector), used to fit vectors
     embed_dimension: int = Field(default=1024, alias="EMBED_DIMENSION")
+    # Embedding cache: in-memory LRU entries, plus an optional SQLite file that survives restarts
+    embed_cache_size: int = Field(default=4096, alias="EMBED_CACHE_SIZE")
+    embed_cache_path: Optional[str] = Field(default=None, alias="EMBED_CACHE_PATH")
+    embed_cache_max_bytes: int = Field(default=256 * 1024 * 1024, alias="EMBED_CACHE_MAX_BYTES")
+    # Query-vector LRU for /api/search and /api/chat (entries expire after the TTL)
+    query_cache_size: int = Field(default=1024, alias="QUERY_CACHE_SIZE")
+    query_cache_ttl_seconds: float = Field(default=600.0, alias="QUERY_CACHE_TTL_SECONDS")
+    # Search-result cache, invalidated by any note write in this process (TTL bounds staleness
+    # from writes made elsewhere, e.g. other instances)
+    search_cache_size: int = Field(default=512, alias="SEARCH_CACHE_SIZE")
+    search_cache_ttl_seconds: float = Field(default=300.0, alias="SEARCH_CACHE_TTL_SECONDS")
+    # Per-conversation retrieval sessions for /api/chat with a conversationId (sessions, seconds idle)
+    conversation_cache_size: int = Field(default=256, alias="CONVERSATION_CACHE_SIZE")
+    conversation_cache_ttl_seconds: float = Field(default=1800.0, alias="CONVERSATION_CACHE_TTL_SECONDS")
+    # Coalesce concurrent embedding cache misses into one upstream batch
+    embed_batch_window_ms: float = Field(default=5.0, alias="EMBED_BATCH_WINDOW_MS")
+    embed_batch_max_items: int = Field(default=64, alias="EMBED_BATCH_MAX_ITEMS")
+    # Provider failover (raw CSV, tried in order after the primary) and query hedging
+    embed_fallback_providers_csv: str = Field(default="", alias="EMBED_FALLBACK_PROVIDERS")
+    embed_hedge_queries: bool = Field(default=False, alias="EMBED_HEDGE_QUERIES")
+    embed_hedge_delay_ms: float = Field(default=300.0, alias="EMBED_HEDGE_DELAY_MS")
+    embed_circuit_failures: int = Field(default=5, alias="EMBED_CIRCUIT_FAILURES")
+    embed_circuit_reset_seconds: float = Field(default=30.0, alias="EMBED_CIRCUIT_RESET_SECONDS")
+    # Save notes immediately with embedding_status='pending' and embed them in a background worker
+    embed_async: bool = Field(default=False, alias="EMBED_ASYNC")
+    embed_worker_batch: int = Field(default=32, alias="EMBED_WORKER_BATCH")
+    embed_worker_interval: float = Field(default=5.0, alias="EMBED_WORKER_INTERVAL")
+    # Local CPU embeddings (EMBED_PROVIDER=local): directory with model.onnx + tokenizer.json
+    local_embed_model_dir: Optional[str] = Field(default=None, alias="LOCAL_EMBED_MODEL_DIR")
+    local_embed_threads: int = Field(default=2, alias="LOCAL_EMBED_THREADS")
+    local_embed_max_length: int = Field(default=256, alias="LOCAL_EMBED_MAX_LENGTH")
+    # Vector index: HNSW build parameters (used by backend.scripts.migrate_hnsw), default
+    # query-time ef_search, and pgvector >= 0.8 iterative scans for filtered searches
+    # ("relaxed_order", "strict_order", "off"; empty for pgvector < 0.8)
+    hnsw_m: int = Field(default=16, alias="HNSW_M")
+    hnsw_ef_construction: int = Field(default=64, alias="HNSW_EF_CONSTRUCTION")
+    hnsw_ef_search: int = Field(default=40, alias="HNSW_EF_SEARCH")
+    vector_iterative_scan: str = Field(default="relaxed_order", alias="VECTOR_ITERATIVE_SCAN")
+    # Search a compact ANN index ("halfvec" or "binary", built by migrate_hnsw --quantization)
+    # and rescore VECTOR_RESCORE_FACTOR x candidates exactly; "none" uses the full vectors
+    vector_quantization: str = Field(default="none", alias="VECTOR_QUANTIZATION")
+    vector_rescore_factor: int = Field(default=4, alias="VECTOR_RESCORE_FACTOR")
+    # Output dimension of the learned projection (backend.scripts.fit_projection); once a
+    # projection is active, search takes candidates from its compact index instead
+    projection_dim: int = Field(default=256, alias="PROJECTION_DIM")
+    # Chat prompt token budget (system text, notes and history; the reply is extra), with
+    # per-model overrides as CSV "model=tokens", and the cap for each note's description
+    chat_context_tokens: int = Field(default=6000, alias="CHAT_CONTEXT_TOKENS")
+    chat_context_tokens_by_model_csv: str = Field(default="", alias="CHAT_CONTEXT_TOKENS_BY_MODEL")
+    chat_note_max_tokens: int = Field(default=400, alias="CHAT_NOTE_MAX_TOKENS")
+    # Opt-in completion cache: identical chat prompts over unchanged notes replay the stored
+    # answer as SSE instead of calling the provider (entries, seconds)
+    chat_cache_enabled: bool = Field(default=False, alias="CHAT_CACHE_ENABLED")
+    chat_cache_size: int = Field(default=256, alias="CHAT_CACHE_SIZE")
+    chat_cache_ttl_seconds: float = Field(default=3600.0, alias="CHAT_CACHE_TTL_SECONDS")
+    # Enables ?debug=explain (EXPLAIN ANALYZE of search SQL) for requests sending it as X-Admin-Token
+    admin_token: Optional[str] = Field(default=None, alias="ADMIN_TOKEN")
+    # Outbound HTTP: negotiate HTTP/2 with upstreams when the h2 package is installed
+    http2_enabled: bool = Field(default=False, alias="HTTP2_ENABLED")
 
     @classmethod
     def from_environ(cls) -> "Settings":
@@ -56,6 +115,17 @@ class Settings(BaseSettings):
     def allowed_origins(self) -> List[str]:
         return _parse_csv(self.allowed_origins_csv)
 
+    @property
+    def embed_fallback_providers(self) -> List[str]:
+        return _parse_csv(self.embed_fallback_providers_csv)
+
+    def chat_context_budget(self, model: str) -> int:
+        for item in _parse_csv(self.chat_context_tokens_by_model_csv):
+            name, _, tokens = item.rpartition("=")
+            if name.strip() == model and tokens.strip().isdigit():
+                return int(tokens)
+        return self.chat_context_tokens
+
 
 @lru_cache(maxsize=1)
 def get_settings() -> Settings:
@@ -4,13 +4,16 @@ import math
 import os
 import asyncio
 
+import numpy as np
+import pytest
+
 
 def _l2_norm(values):
     return math.sqrt(sum(v * v for v in values))
 
 
 def run(coro):
-    return asyncio.get_event_loop().run_until_complete(coro)
+    return asyncio.run(coro)
 
 
 def setup_module(module):  # noqa: D401
@@ -37,3 +40,294 @@ def test_mock_embedding_length_and_norm_arabic():
     assert 0.99 <= norm <= 1.01
 
 
+def test_batch_embeddings_match_single_and_keep_order():
+    from backend.services.embeddings import get_embedding, get_embeddings
+
+    texts = ["hello world", "مرحبا بالعالم", "merhaba dünya"]
+    batch = run(get_embeddings(texts, provider="mock"))
+    assert len(batch) == len(texts)
+    for text, vec in zip(texts, batch):
+        single = run(get_embedding(text, provider="mock"))
+        assert max(abs(a - b) for a, b in zip(vec, single)) < 1e-6
+
+
+def test_openai_batches_are_chunked_and_reordered(monkeypatch):
+    from backend.services import embeddings
+
+    calls = []
+
+    class FakeResponse:
+        status_code = 200
+
+        def __init__(self, inputs):
+            # Return rows out of order; the client must sort by index
+            self._data = [
+                {"index": i, "embedding": [1.0 if j == i else 0.0 for j in range(3)]}
+                for i in range(len(inputs))
+            ][::-1]
+
+        def json(self):
+            return {"data": self._data}
+
+    class FakeClient:
+        async def post(self, url, headers=None, json=None):
+            calls.append(list(json["input"]))
+            return FakeResponse(json["input"])
+
+    monkeypatch.setattr(embeddings.http_clients, "get", lambda name: FakeClient())
+    monkeypatch.setattr(embeddings, "OPENAI_MAX_BATCH", 2)
+
+    vectors = run(embeddings.get_embeddings(["a", "b", "c"], provider="openai", api_key="sk-test"))
+    assert calls == [["a", "b"], ["c"]]
+    assert vectors == [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [1.0, 0.0, 0.0]]
+
+
+def test_embedding_cache_memory_and_disk_tiers(tmp_path):
+    from backend.services.embedding_cache import EmbeddingCache, cache_key
+
+    path = str(tmp_path / "embeddings.sqlite3")
+    key_a = cache_key("mock", "mock", 1024, "hello   world")
+    assert key_a == cache_key("mock", "mock", 1024, " hello world ")
+    assert key_a != cache_key("mock", "mock", 384, "hello world")
+
+    cache = EmbeddingCache(max_entries=1, disk_path=path, disk_max_bytes=0)
+    run(cache.put_many({key_a: np.array([0.5, 0.25], dtype=np.float32)}))
+    assert run(cache.get_many([key_a]))[key_a].tolist() == [0.5, 0.25]
+    cache.close()
+
+    # A fresh instance (new process) is warmed from disk
+    cache = EmbeddingCache(max_entries=1, disk_path=path, disk_max_bytes=0)
+    found = run(cache.get_many([key_a, "missing"]))
+    assert list(found) == [key_a] and found[key_a].tolist() == [0.5, 0.25]
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["disk"]["hits"] == 1
+    cache.close()
+
+
+def test_embedding_cache_disk_eviction_by_size(tmp_path):
+    from backend.services.embedding_cache import EmbeddingCache
+
+    # Each 4-float vector is 16 bytes; allow room for two
+    cache = EmbeddingCache(max_entries=0, disk_path=str(tmp_path / "e.sqlite3"), disk_max_bytes=40)
+    vector = np.array([1.0, 2.0, 3.0, 4.0], dtype=np.float32)
+    run(cache.put_many({"a": vector, "b": vector}))
+    # A disk hit makes "a" more recent than "b"
+    assert "a" in run(cache.get_many(["a"]))
+    run(cache.put_many({"c": vector}))
+    stats = cache.stats()
+    assert stats["disk"]["bytes"] <= 40
+    assert stats["disk"]["evictions"] == 1
+    assert stats["disk"]["entries"] == 2
+    assert sorted(run(cache.get_many(["a", "b", "c"]))) == ["a", "c"]
+    cache.close()
+
+
+def test_vector_ops_batch_normalize_fit_and_degenerate():
+    from backend.services.vector_ops import (
+        degenerate_rows,
+        fit_dimension,
+        l2_normalize,
+        mock_embeddings,
+    )
+
+    batch = l2_normalize(mock_embeddings(["a", "bb", "ccc"]))
+    assert batch.shape == (3, 1024) and batch.dtype == np.float32
+    assert np.allclose(np.linalg.norm(batch, axis=1), 1.0, atol=1e-5)
+
+    fitted = fit_dimension(batch, 384)
+    assert fitted.shape == (3, 384)
+    assert np.allclose(np.linalg.norm(fitted, axis=1), 1.0, atol=1e-5)
+    padded = fit_dimension(np.array([3.0, 4.0]), 4)
+    assert np.allclose(padded, [0.6, 0.8, 0.0, 0.0])
+
+    rows = np.array([[0.0, 0.0], [np.nan, 1.0], [1.0, 0.0]], dtype=np.float32)
+    assert degenerate_rows(rows).tolist() == [True, True, False]
+    assert l2_normalize(rows)[:2].tolist() == [[0.0, 0.0], [0.0, 0.0]]
+
+
+def test_local_embedder_mean_pool_respects_mask():
+    from backend.services.local_embedder import _mean_pool
+
+    hidden = np.array([[[1.0, 1.0], [3.0, 5.0], [100.0, 100.0]]], dtype=np.float32)
+    mask = np.array([[1, 1, 0]])
+    assert _mean_pool(hidden, mask).tolist() == [[2.0, 3.0]]
+
+
+def test_local_embedder_loads_model_once_under_concurrency(monkeypatch, tmp_path):
+    import threading
+    import time
+
+    from backend.services import local_embedder
+
+    (tmp_path / "model.onnx").write_bytes(b"")
+    (tmp_path / "tokenizer.json").write_text("{}")
+    sessions = []
+
+    class FakeTokenizer:
+        @staticmethod
+        def from_file(path):
+            return FakeTokenizer()
+
+        def enable_truncation(self, max_length):
+            pass
+
+        def enable_padding(self):
+            pass
+
+    class FakeInput:
+        name = "input_ids"
+
+    class FakeSession:
+        def __init__(self, path, sess_options, providers):
+            time.sleep(0.05)  # a slow model load widens the race
+            sessions.append(self)
+
+        def get_inputs(self):
+            return [FakeInput()]
+
+    class FakeOrt:
+        SessionOptions = type("SessionOptions", (), {})
+        InferenceSession = FakeSession
+
+    monkeypatch.setattr(local_embedder, "ort", FakeOrt)
+    monkeypatch.setattr(local_embedder, "Tokenizer", FakeTokenizer)
+    embedder = local_embedder.LocalEmbedder(str(tmp_path), threads=4)
+
+    threads = [threading.Thread(target=embedder._load) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(sessions) == 1
+    assert embedder._session is sessions[0] and embedder._input_names == ["input_ids"]
+
+
+def test_local_provider_without_model_dir_fails_over(monkeypatch):
+    monkeypatch.setenv("EMBED_PROVIDER", "local")
+    monkeypatch.delenv("LOCAL_EMBED_MODEL_DIR", raising=False)
+    monkeypatch.setenv("EMBED_FALLBACK_PROVIDERS", "mock")
+
+    from backend.services import embeddings, local_embedder
+    from backend.settings import get_settings
+
+    get_settings.cache_clear()
+    embeddings.get_provider_router.cache_clear()
+    monkeypatch.setattr(local_embedder, "_embedder", None)
+    try:
+        with pytest.raises(embeddings.EmbeddingError, match="LOCAL_EMBED_MODEL_DIR"):
+            run(embeddings._call_provider(["x"], "local", None))
+
+        batch = run(embeddings.embed_texts(["served by the next provider"]))
+        assert batch.provider == "mock" and batch.vectors.shape == (1, 1024)
+    finally:
+        get_settings.cache_clear()
+        embeddings.get_provider_router.cache_clear()
+
+
+def test_concurrent_misses_are_coalesced_and_deduplicated(monkeypatch):
+    from uuid import uuid4
+
+    from backend.services import embeddings
+
+    calls = []
+    original = embeddings._embed_uncached
+
+    async def recording(texts, provider, api_key):
+        calls.append(list(texts))
+        return await original(texts, provider, api_key)
+
+    monkeypatch.setattr(embeddings, "_embed_uncached", recording)
+    coalescer = embeddings.EmbeddingCoalescer(window_ms=20, max_items=64)
+    monkeypatch.setattr(embeddings, "get_embedding_coalescer", lambda: coalescer)
+
+    tag = uuid4().hex
+    texts = [f"{tag} {i % 3}" for i in range(9)]
+
+    async def burst():
+        return await asyncio.gather(
+            *(embeddings.get_embedding(text, provider="mock") for text in texts)
+        )
+
+    vectors = run(burst())
+    assert len(calls) == 1 and sorted(calls[0]) == sorted(set(texts))
+    assert vectors[0] == vectors[3] == vectors[6]
+    assert coalescer.shared == 6
+
+
+def test_cancelled_flush_releases_waiters(monkeypatch):
+    from backend.services import embeddings
+
+    started = asyncio.Event()
+
+    async def hang(pending, provider, api_key):
+        started.set()
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(embeddings, "_embed_and_cache", hang)
+    coalescer = embeddings.EmbeddingCoalescer(window_ms=0, max_items=64)
+
+    async def scenario():
+        waiters = [
+            asyncio.ensure_future(coalescer.embed("mock", None, {"k1": "same text"})) for _ in range(2)
+        ]
+        await started.wait()
+        for task in list(coalescer._tasks):
+            task.cancel()
+        results = await asyncio.wait_for(asyncio.gather(*waiters, return_exceptions=True), timeout=1.0)
+        assert all(isinstance(r, embeddings.EmbeddingError) for r in results)
+        assert coalescer.stats()["inflight"] == 0
+
+    run(scenario())
+
+
+def test_query_cache_normalizes_keys_and_expires(monkeypatch):
+    from backend.services import lru_cache
+    from backend.services.query_cache import QueryEmbeddingCache
+
+    now = [100.0]
+    monkeypatch.setattr(lru_cache.time, "monotonic", lambda: now[0])
+    cache = QueryEmbeddingCache(max_entries=2, ttl_seconds=60)
+    cache.put("Hello   World", "mock:mock", np.ones(4))
+
+    assert cache.get(" Hello World ", "mock:mock").tolist() == [1.0] * 4
+    # Case is significant ("US" vs "us")
+    assert cache.get("hello world", "mock:mock") is None
+    # Same text under another model is a different entry
+    assert cache.get("Hello World", "openai:text-embedding-3-small") is None
+
+    now[0] += 61
+    assert cache.get("Hello World", "mock:mock") is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["expirations"] == 1 and stats["size"] == 0
+
+
+def test_pca_projection_round_trip_and_registry():
+    from backend.services.projection import Projection, ProjectionRegistry, fit_pca
+
+    rng = np.random.default_rng(0)
+    # Data living in a 4-dim subspace of 32 dims: 4 components keep all of it
+    basis = rng.standard_normal((4, 32)).astype(np.float32)
+    data = rng.standard_normal((200, 4)).astype(np.float32) @ basis
+    mean, components = fit_pca(data, 4)
+    centered = data - mean
+    reconstructed = (centered @ components.T) @ components
+    assert np.allclose(reconstructed, centered, atol=1e-3)
+
+    row = {
+        "version": 3,
+        "method": "pca",
+        "source_model": "mock:mock",
+        "input_dim": 32,
+        "output_dim": 4,
+        "mean": mean.astype("<f4").tobytes(),
+        "components": components.astype("<f4").tobytes(),
+    }
+    registry = ProjectionRegistry()
+    registry.active = Projection.from_row(row)
+    projected, version = registry.compact(data[:5], "mock:mock")
+    assert version == 3 and projected.shape == (5, 4)
+    assert np.allclose(np.linalg.norm(projected, axis=1), 1.0, atol=1e-5)
+    # Vectors from another model (or dimension) are never projected
+    assert registry.compact(data[:5], "openai:text-embedding-3-small") is None
+    assert registry.compact(np.ones((1, 16)), "mock:mock") is None
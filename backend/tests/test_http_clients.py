@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import asyncio
+
+
+def test_pool_usage_reads_httpcore_pool():
+    import httpx
+
+    from backend.services.http_clients import pool_usage
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # Minimal keep-alive HTTP/1.1 server: answer every request on the connection
+        try:
+            while await reader.readuntil(b"\r\n\r\n"):
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def scenario():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        client = httpx.AsyncClient()
+        try:
+            assert pool_usage(client) == {"connections": 0, "idle": 0, "active": 0}
+            async with client.stream("GET", f"http://127.0.0.1:{port}/") as response:
+                assert pool_usage(client) == {"connections": 1, "idle": 0, "active": 1}
+                await response.aread()
+            # The connection went back to the pool for reuse
+            assert pool_usage(client) == {"connections": 1, "idle": 1, "active": 0}
+        finally:
+            await client.aclose()
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(scenario())
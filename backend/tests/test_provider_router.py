@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+
+def test_failover_and_circuit_breaker():
+    from backend.services.provider_router import ProviderRouter
+
+    router = ProviderRouter(failure_threshold=2, reset_after=60.0)
+    calls = []
+
+    async def flaky(name: str) -> str:
+        calls.append(name)
+        if name == "openai":
+            router.record_failure(name)
+            raise RuntimeError("upstream down")
+        router.record_success(name, 0.01)
+        return f"vec-from-{name}"
+
+    for _ in range(2):
+        name, result = asyncio.run(router.call(router.candidates(["openai", "hf"]), flaky))
+        assert (name, result) == ("hf", "vec-from-hf")
+    assert calls == ["openai", "hf", "openai", "hf"]
+    assert router.stats()["providers"]["openai"]["state"] == "open"
+
+    # Open circuit: the failing provider is skipped entirely
+    assert router.candidates(["openai", "hf"]) == ["hf"]
+    # ...unless nothing else is left, so the caller still sees a real error
+    assert router.candidates(["openai"]) == ["openai"]
+    with pytest.raises(RuntimeError):
+        asyncio.run(router.call(["openai"], flaky))
+
+
+def test_half_open_trial_is_taken_only_when_tried():
+    from backend.services.provider_router import ProviderRouter
+
+    router = ProviderRouter(failure_threshold=1, reset_after=0.0)
+    router.record_failure("hf")
+    calls = []
+
+    async def healthy(name: str) -> str:
+        calls.append(name)
+        router.record_success(name, 0.01)
+        return name
+
+    # The primary answers; the half-open fallback is never tried, so its trial stays free
+    candidates = router.candidates(["openai", "hf"])
+    assert candidates == ["openai", "hf"]
+    assert asyncio.run(router.call(candidates, healthy)) == ("openai", "openai")
+    assert not router.health("hf").trial_in_flight
+
+    # An attempt that records no outcome (e.g. a cache hit) releases the trial too
+    async def cached(name: str) -> str:
+        return name
+
+    assert asyncio.run(router.call(router.candidates(["hf"]), cached)) == ("hf", "hf")
+    assert not router.health("hf").trial_in_flight
+
+    # So the recovered provider still gets its trial
+    assert asyncio.run(router.call(router.candidates(["hf", "openai"]), healthy)) == ("hf", "hf")
+    assert calls == ["openai", "hf"]
+    assert router.stats()["providers"]["hf"]["state"] == "closed"
+
+
+def test_hedged_call_prefers_fast_secondary():
+    from backend.services.provider_router import ProviderRouter
+
+    router = ProviderRouter(hedge_default_delay=0.01, hedge_min_delay=0.0)
+
+    async def slow_primary(name: str) -> str:
+        await asyncio.sleep(0.5 if name == "primary" else 0.0)
+        return name
+
+    name, result = asyncio.run(router.call(["primary", "secondary"], slow_primary, hedge=True))
+    assert name == result == "secondary"
+    assert router.hedges_started == 1 and router.hedges_won == 1
+
+
+def test_hedge_delay_tracks_p95():
+    from backend.services.provider_router import ProviderRouter
+
+    router = ProviderRouter(hedge_default_delay=0.3, hedge_min_delay=0.0, hedge_max_delay=5.0)
+    assert router.hedge_delay("openai") == 0.3
+    for i in range(20):
+        router.record_success("openai", 0.1 if i < 18 else 1.0)
+    assert router.hedge_delay("openai") == 1.0
@@ -1,11 +1,18 @@
 from __future__ import annotations
 
 import asyncio
+import itertools
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from typing import Any, Dict, List, Optional
 
 import httpx
+import pytest
+
+
+# Index knobs applied by semantic_search and search queries run, for assertions
+EXECUTED_SETTINGS: List[str] = []
+SEARCH_QUERIES: List[str] = []
 
 
 def _now() -> datetime:
@@ -23,10 +30,35 @@ class _NoteRow:
     updated_at: datetime
 
 
+class _FakeTransaction:
+    async def __aenter__(self) -> None:
+        return None
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        return None
+
+
 class FakeConnection:
     def __init__(self, store: Dict[str, _NoteRow]) -> None:
         self.store = store
 
+    def transaction(self) -> _FakeTransaction:
+        return _FakeTransaction()
+
+    async def execute(self, sql: str, *params: Any) -> str:
+        s = sql.lower().strip()
+        if all(stmt.strip().startswith("set local ") for stmt in s.split(";")):
+            EXECUTED_SETTINGS.append(s)
+            return "SET"
+        raise AssertionError(f"Unhandled execute SQL: {sql}")
+
+    async def fetchval(self, sql: str, *params: Any) -> Any:
+        s = sql.lower().strip()
+        if s.startswith("explain (analyze, buffers, format json) select id, url"):
+            SEARCH_QUERIES.append(s)
+            return '[{"Plan": {"Node Type": "Limit"}, "Execution Time": 0.1}]'
+        raise AssertionError(f"Unhandled fetchval SQL: {sql}")
+
     async def fetch(self, sql: str, *params: Any) -> List[Dict[str, Any]]:
         s = sql.lower().strip()
         if (
@@ -36,6 +68,7 @@ class FakeConnection:
             and "order by score desc" in s
         ):
             # Semantic search emulation
+            SEARCH_QUERIES.append(s)
             rows = list(self.store.values())
             idx = 0
             # Optional tags AND filter
@@ -71,6 +104,36 @@ class FakeConnection:
                 }
                 for r in rows_page
             ]
+        if s.startswith("select b.ord, r.* from (values"):
+            # Batch search emulation: one BATCH_COLUMNS group per search, then the default
+            # model id (and the projection version when the compact index is used)
+            from backend.services.retrieval import BATCH_COLUMNS
+
+            SEARCH_QUERIES.append(s)
+            out: List[Dict[str, Any]] = []
+            width = len(BATCH_COLUMNS)
+            for i in range(0, len(params) - len(params) % width, width):
+                ord_, _vec, q, top_k, _cand, tag_list = params[i : i + 6]
+                rows = [r for r in self.store.values() if all(t in r.tags for t in tag_list)]
+
+                def _batch_score(note: _NoteRow) -> float:
+                    return 1.0 if str(q).lower() in (note.title + " " + note.description).lower() else 0.0
+
+                for r in sorted(rows, key=_batch_score, reverse=True)[: int(top_k)]:
+                    out.append(
+                        {
+                            "ord": ord_,
+                            "id": r.id,
+                            "url": r.url,
+                            "title": r.title,
+                            "description": r.description,
+                            "tags": r.tags,
+                            "created_at": r.created_at,
+                            "updated_at": r.updated_at,
+                            "score": _batch_score(r),
+                        }
+                    )
+            return out
         raise AssertionError(f"Unhandled fetch SQL: {sql}")
 
 
@@ -104,6 +167,9 @@ def setup_module(module):  # noqa: D401
     os.environ.setdefault("EMBED_PROVIDER", "mock")
 
 
+_CLIENT_HOSTS = itertools.count(1)
+
+
 async def _build_app_with_store() -> tuple[httpx.AsyncClient, Dict[str, _NoteRow]]:
     # Reset settings cache to pick up test env
     from backend.settings import get_settings
@@ -140,7 +206,8 @@ async def _build_app_with_store() -> tuple[httpx.AsyncClient, Dict[str, _NoteRow
 
     from backend.main import app
 
-    transport = httpx.ASGITransport(app=app)
+    # A fresh client address per test: the app's per-IP rate limiter outlives each test
+    transport = httpx.ASGITransport(app=app, client=(f"10.0.0.{next(_CLIENT_HOSTS)}", 123))
     client = httpx.AsyncClient(transport=transport, base_url="http://test")
     return client, store
 
@@ -179,6 +246,123 @@ def test_search_endpoint_basic():
     run(scenario())
 
 
+def test_search_index_knobs_per_request():
+    async def scenario():
+        client, _store = await _build_app_with_store()
+        async with client:
+            r = await client.post("/api/search", json={"query": "plain knobs", "topK": 5})
+            assert r.status_code == 200
+            assert "iterative_scan" not in EXECUTED_SETTINGS[-1]
+
+            # Per-request ef_search; tag filters turn on iterative index scans
+            r2 = await client.post(
+                "/api/search",
+                json={"query": "tagged knobs", "tags": ["tagA"], "efSearch": 200, "probes": 20},
+            )
+            assert r2.status_code == 200
+            knobs = EXECUTED_SETTINGS[-1]
+            assert "set local hnsw.ef_search = 200" in knobs
+            assert "set local ivfflat.probes = 20" in knobs
+            assert "set local hnsw.iterative_scan = relaxed_order" in knobs
+
+    run(scenario())
+
+
+def test_search_results_cached_until_notes_change():
+    async def scenario():
+        from backend.services.search_cache import notes_version
+
+        client, _store = await _build_app_with_store()
+        async with client:
+            body = {"query": "  Cached   NOTE ", "topK": 3}
+            r1 = await client.post("/api/search", json=body)
+            ran = len(SEARCH_QUERIES)
+            r2 = await client.post("/api/search", json={**body, "query": "Cached NOTE"})
+            assert r2.json() == r1.json()
+            assert len(SEARCH_QUERIES) == ran
+            # Case is significant: a different query
+            await client.post("/api/search", json={**body, "query": "cached note"})
+            assert len(SEARCH_QUERIES) == ran + 1
+            ran = len(SEARCH_QUERIES)
+
+            notes_version.bump()
+            r3 = await client.post("/api/search", json=body)
+            assert r3.status_code == 200
+            assert len(SEARCH_QUERIES) == ran + 1
+
+    run(scenario())
+
+
+def test_search_debug_timings_and_admin_explain(monkeypatch):
+    async def scenario():
+        client, _store = await _build_app_with_store()
+        async with client:
+            body = {"query": "debug timings note", "topK": 2}
+            r = await client.post("/api/search?debug=timings", json=body)
+            assert r.status_code == 200
+            data = r.json()
+            assert data["results"][0]["note"]["title"] == "Note One"
+            stages = data["timings"]["stages_ms"]
+            assert {"cache", "embed", "acquire", "sql", "serialize"} <= set(stages)
+            assert data["timings"]["cached"] is False
+            assert "sql;dur=" in r.headers["server-timing"]
+            assert "plan" not in data
+
+            # EXPLAIN needs the admin token
+            r2 = await client.post("/api/search?debug=explain", json=body)
+            assert r2.status_code == 403
+            monkeypatch.setenv("ADMIN_TOKEN", "s3cret")
+            from backend.settings import get_settings
+
+            get_settings.cache_clear()  # type: ignore[attr-defined]
+            r3 = await client.post(
+                "/api/search?debug=explain", json=body, headers={"X-Admin-Token": "s3cret"}
+            )
+            assert r3.status_code == 200
+            assert r3.json()["plan"][0]["Plan"]["Node Type"] == "Limit"
+            assert SEARCH_QUERIES[-1].startswith("explain (analyze, buffers")
+
+    try:
+        run(scenario())
+    finally:
+        from backend.settings import get_settings
+
+        get_settings.cache_clear()  # type: ignore[attr-defined]
+
+
+def test_batch_search_single_round_trip_in_request_order():
+    async def scenario():
+        client, _store = await _build_app_with_store()
+        async with client:
+            ran = len(SEARCH_QUERIES)
+            body = {
+                "searches": [
+                    {"query": "unrelated content", "topK": 1},
+                    {"query": "   "},
+                    {"query": "first note", "tags": ["tagA"], "fusion": "rrf"},
+                ]
+            }
+            r = await client.post("/api/search/batch", json=body)
+            assert r.status_code == 200
+            data = r.json()
+            assert len(data) == 3
+            assert [item["note"]["title"] for item in data[0]] == ["Another Entry"]
+            assert data[1] == []
+            assert [item["note"]["title"] for item in data[2]] == ["Note One"]
+            # Both non-empty searches ran as one statement
+            assert len(SEARCH_QUERIES) == ran + 1
+
+            # A lone search with the same parameters is now served from the cache
+            r2 = await client.post("/api/search", json={"query": "unrelated  content", "topK": 1})
+            assert r2.json() == data[0]
+            assert len(SEARCH_QUERIES) == ran + 1
+
+            r3 = await client.post("/api/search/batch", json={"searches": []})
+            assert r3.status_code == 422
+
+    run(scenario())
+
+
 def test_chat_sse_stream_and_citations():
     async def scenario():
         client, _store = await _build_app_with_store()
@@ -224,3 +408,220 @@ def test_chat_sse_stream_and_citations():
     run(scenario())
 
 
+async def _read_sse(client: httpx.AsyncClient, body: Dict[str, Any]) -> tuple[List[str], Dict[str, Any]]:
+    import json as _json
+
+    tokens: List[str] = []
+    event = None
+    async with client.stream("POST", "/api/chat", json=body) as resp:
+        assert resp.status_code == 200
+        async for line in resp.aiter_lines():
+            if line.startswith("event:"):
+                event = line[len("event:") :].strip()
+            elif line.startswith("data:"):
+                data = line[len("data:") :]
+                data = data[1:] if data.startswith(" ") else data
+                if event == "done":
+                    return tokens, _json.loads(data)
+                tokens.append(data)
+    raise AssertionError("stream ended without a done event")
+
+
+def test_chat_done_event_reports_prompt_usage():
+    async def scenario():
+        client, _store = await _build_app_with_store()
+        body = {"messages": [{"role": "user", "content": "usage of note one"}], "provider": "mock", "model": "dummy"}
+        async with client:
+            _tokens, done = await _read_sse(client, body)
+            usage = done["usage"]
+            assert 0 < usage["prompt_tokens"] <= usage["budget"]
+            assert usage["notes_used"] == len(done["citations"])
+
+    run(scenario())
+
+
+def test_chat_time_to_first_token_in_stats():
+    async def scenario():
+        from backend.services.chat_metrics import TTFT_WINDOW, chat_metrics
+
+        client, _store = await _build_app_with_store()
+        body = {"messages": [{"role": "user", "content": "ttft of note one"}], "provider": "mock", "model": "dummy"}
+        async with client:
+            before = chat_metrics.stats().get("mock", {}).get("samples", 0)
+            await _read_sse(client, body)
+            assert chat_metrics.stats()["mock"]["samples"] >= min(before + 1, TTFT_WINDOW)
+            stats = (await client.get("/api/stats")).json()
+            assert stats["chat"]["mock"]["ttft_p95_ms"] is not None
+
+    run(scenario())
+
+
+def test_chat_never_orphans_the_provider_warm_up(monkeypatch):
+    from backend.routers import search as search_router
+
+    started: List[str] = []
+
+    async def hanging_warm_up(provider, api_key):
+        started.append(provider)
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(search_router, "warm_up_chat_provider", hanging_warm_up)
+    body = {"messages": [{"role": "user", "content": "note one"}], "provider": "mock", "model": "dummy"}
+
+    async def pending_warm_ups() -> int:
+        await asyncio.sleep(0)
+        return sum(1 for t in asyncio.all_tasks() if getattr(t.get_coro(), "__name__", "") == "hanging_warm_up")
+
+    async def scenario():
+        client, _store = await _build_app_with_store()
+        async with client:
+            # The stream doesn't wait out a hanging warm-up, and cancels it
+            tokens, _done = await asyncio.wait_for(_read_sse(client, body), timeout=5.0)
+            assert "".join(tokens) == "Hello world!" and started == ["mock"]
+            assert await pending_warm_ups() == 0
+
+            # A failure while assembling the prompt cancels it too
+            def broken_pack(*args, **kwargs):
+                raise RuntimeError("packing failed")
+
+            monkeypatch.setattr(search_router, "pack_context", broken_pack)
+            with pytest.raises(RuntimeError, match="packing failed"):
+                await client.post("/api/chat", json=body)
+            assert await pending_warm_ups() == 0
+
+    run(scenario())
+
+
+def test_chat_completion_cache_replays_sse(monkeypatch):
+    monkeypatch.setenv("CHAT_CACHE_ENABLED", "true")
+    from backend.routers import search as search_router
+    from backend.services.completion_cache import get_completion_cache
+    from backend.services.search_cache import notes_version
+
+    get_completion_cache.cache_clear()
+    provider_calls: List[str] = []
+    real_stream = search_router.stream_chat_tokens
+
+    def counting_stream(**kwargs):
+        provider_calls.append(kwargs["provider"])
+        return real_stream(**kwargs)
+
+    monkeypatch.setattr(search_router, "stream_chat_tokens", counting_stream)
+
+    async def scenario():
+        client, store = await _build_app_with_store()
+        body = {
+            "messages": [{"role": "user", "content": "What is in  Note One?"}],
+            "provider": "mock",
+            "model": "dummy",
+        }
+        async with client:
+            tokens, done = await _read_sse(client, body)
+            assert "".join(tokens) == "Hello world!" and done["cached"] is False
+
+            # Whitespace differences normalize to the same prompt
+            replay_body = {**body, "messages": [{"role": "user", "content": " What is in Note One? "}]}
+            tokens2, done2 = await _read_sse(client, replay_body)
+            assert tokens2 == tokens and done2["cached"] is True
+            assert done2["citations"] == done["citations"]
+            assert len(provider_calls) == 1
+
+            # Case differences don't: they can change the meaning of a question
+            lower_body = {**body, "messages": [{"role": "user", "content": "what is in note one?"}]}
+            _, done_lower = await _read_sse(client, lower_body)
+            assert done_lower["cached"] is False and len(provider_calls) == 2
+
+            # Editing a cited note changes the key
+            store["11111111-1111-1111-1111-111111111111"].updated_at = _now()
+            notes_version.bump()
+            _, done3 = await _read_sse(client, body)
+            assert done3["cached"] is False and len(provider_calls) == 3
+
+    try:
+        run(scenario())
+    finally:
+        from backend.settings import get_settings
+
+        get_completion_cache.cache_clear()
+        get_settings.cache_clear()  # type: ignore[attr-defined]
+
+
+def test_context_packer_respects_budget_and_drops_low_scores_first():
+    from backend.services.chat_providers import ChatMessage
+    from backend.services.context_packer import estimate_tokens, pack_context, trim_to_tokens
+
+    assert estimate_tokens("abcd" * 10) == 10
+    assert estimate_tokens("مرحبا") == 3
+    trimmed = trim_to_tokens("First sentence here. " * 50, 20)
+    assert estimate_tokens(trimmed) <= 21 and trimmed.endswith(".…")
+
+    rows = [
+        {"id": i, "title": f"Note {i}", "url": f"https://example.com/{i}",
+         "description": "word " * 600, "score": score}
+        for i, score in enumerate([0.2, 0.9, 0.5])
+    ]
+    history = [ChatMessage(role="user", content="old question " * 200)] * 3 + [
+        ChatMessage(role="user", content="latest?")
+    ]
+    packed = pack_context(rows, history, budget=1000, reserved_tokens=50, max_note_tokens=300)
+    usage = packed.usage
+    assert usage["prompt_tokens"] <= 1000
+    # Highest score first; the weakest note is the one dropped
+    assert [c["title"] for c in packed.citations] == ["Note 1", "Note 2"]
+    assert usage["notes_dropped"] == 1
+    # Oldest turns go first and the latest message always stays
+    assert packed.history[-1].content == "latest?"
+    assert usage["messages_dropped"] >= 1 and len(packed.history) == 4 - usage["messages_dropped"]
+
+
+def test_conversation_cache_reuses_and_carries_candidates():
+    from backend.services.conversation_cache import CARRY_DECAY, ConversationCache
+    from backend.services.search_cache import notes_version
+
+    sessions = ConversationCache(max_entries=2, ttl_seconds=60)
+    version = notes_version.value
+    first = [{"id": "a", "title": "A", "url": "u", "description": "", "score": 0.8}]
+    second = [{"id": "b", "title": "B", "url": "u", "description": "", "score": 0.9}]
+    assert sessions.lookup("conv", "q1") is None
+    sessions.extend("conv", "q1", first, version=version, limit=4)
+    merged = sessions.extend("conv", "q2", second, version=version, limit=4)
+    # The follow-up keeps the earlier note, ranked below the fresh one at a decayed score
+    assert [r["id"] for r in merged] == ["b", "a"]
+    assert merged[1]["score"] == 0.8 * CARRY_DECAY
+    assert [r["id"] for r in sessions.lookup("conv", "q1")] == ["a"]
+    # A note write invalidates the session
+    notes_version.bump()
+    assert sessions.lookup("conv", "q1") is None
+
+
+def test_hybrid_sql_uses_index_friendly_branches():
+    from backend.services.retrieval import hybrid_search_sql
+
+    sql = hybrid_search_sql(
+        vec="$1", query="$2", limit="$3", candidates="$4", model="$5", default_model="$6",
+        tags="$7", weight=0.7, fusion="rrf",
+    )
+    s = sql.lower()
+    # Each branch is a bounded, index-orderable scan; only candidates are fused
+    assert "embedding <=> $1::vector as dist" in s and "order by dist limit $4" in s
+    assert "search_tsv @@ (websearch_to_tsquery('simple', $2) ||" in s
+    assert "websearch_to_tsquery('arabic', $2)" in s and "order by kscore desc limit $4" in s
+    assert s.count("tags @> $7::text[]") == 2
+    assert "1.0 / (60 + c.vrank)" in s
+    assert s.endswith("order by score desc limit $3")
+
+    # Quantized: over-fetch from the compact expression index, rescore on full vectors
+    qsql = hybrid_search_sql(
+        vec="$1", query="$2", limit="$3", candidates="$4", model="$5", default_model="$6",
+        quantization="binary", rescore_factor=8, dimension=1024,
+    ).lower()
+    assert "order by binary_quantize(embedding)::bit(1024) <~> binary_quantize($1::vector)" in qsql
+    assert "limit ($4) * 8) q order by dist limit $4" in qsql
+
+    # Projected: candidates from the compact column of the matching version
+    psql = hybrid_search_sql(
+        vec="$1", query="$2", limit="$3", candidates="$4", model="$5", default_model="$6",
+        compact_vec="$7", compact_version="$8",
+    ).lower()
+    assert "embedding_compact_version = $8 order by embedding_compact <=> $7::vector" in psql
+    assert "order by dist limit $4" in psql
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import struct
+
+import numpy as np
+
+
+def test_vector_codec_round_trip_matches_pgvector_layout():
+    from backend.vector_codec import decode_vector, encode_vector
+
+    vec = np.array([0.5, -1.25, 3.0], dtype=np.float32)
+    data = encode_vector(vec)
+    assert struct.unpack(">HH", data[:4]) == (3, 0)
+    assert struct.unpack(">3f", data[4:]) == (0.5, -1.25, 3.0)
+
+    out = decode_vector(data)
+    assert out.dtype == np.float32
+    assert out.tolist() == [0.5, -1.25, 3.0]
+
+    # Plain sequences and text literals encode identically
+    assert encode_vector([0.5, -1.25, 3.0]) == data
+    assert encode_vector("[0.5,-1.25,3]") == data
+
+
+def test_register_vector_codec_uses_extension_schema():
+    import asyncio
+
+    from backend.vector_codec import register_vector_codec
+
+    class FakeConn:
+        def __init__(self, schema):
+            self.schema = schema
+            self.registered = None
+
+        async def fetchval(self, sql):
+            return self.schema
+
+        async def set_type_codec(self, name, **kwargs):
+            self.registered = (name, kwargs["schema"], kwargs["format"])
+
+    conn = FakeConn("extensions")
+    assert asyncio.run(register_vector_codec(conn)) is True
+    assert conn.registered == ("vector", "extensions", "binary")
+
+    missing = FakeConn(None)
+    assert asyncio.run(register_vector_codec(missing)) is False
+    assert missing.registered is None
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import struct
+from typing import Any
+
+import numpy as np
+
+
+# pgvector binary wire format: uint16 dim, uint16 unused, then dim big-endian float32
+_HEADER = struct.Struct(">HH")
+_WIRE_DTYPE = np.dtype(">f4")
+
+
+def encode_vector(value: Any) -> bytes:
+    """asyncpg binary encoder for pgvector `vector`.
+
+    Accepts a float32 array (no per-element formatting), any float sequence, or a
+    '[1,2,3]' text literal for callers that still build those.
+    """
+    if isinstance(value, str):
+        value = [float(x) for x in value.strip().strip("[]").split(",") if x.strip()]
+    arr = np.asarray(value, dtype=_WIRE_DTYPE)
+    if arr.ndim != 1:
+        raise ValueError(f"vector must be 1-D, got shape {arr.shape}")
+    return _HEADER.pack(arr.shape[0], 0) + arr.tobytes()
+
+
+def decode_vector(data: bytes) -> np.ndarray:
+    """asyncpg binary decoder for pgvector `vector`, returning a native float32 array."""
+    dim, _unused = _HEADER.unpack_from(data)
+    return np.frombuffer(data, dtype=_WIRE_DTYPE, count=dim, offset=_HEADER.size).astype(np.float32)
+
+
+async def register_vector_codec(conn: Any) -> bool:
+    """Register the binary `vector` codec on an asyncpg connection.
+
+    The extension may live in `public` or `extensions` (Supabase), so look the schema up.
+    Returns False when pgvector isn't installed.
+    """
+    schema = await conn.fetchval(
+        "select n.nspname from pg_type t join pg_namespace n on n.oid = t.typnamespace "
+        "where t.typname = 'vector' limit 1"
+    )
+    if schema is None:
+        return False
+    await conn.set_type_codec(
+        "vector",
+        schema=schema,
+        encoder=encode_vector,
+        decoder=decode_vector,
+        format="binary",
+    )
+    return True
+
+
+__all__ = ["decode_vector", "encode_vector", "register_vector_codec"]
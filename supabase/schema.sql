@@ -18,9 +18,80 @@ create table if not exists public.notes (
   updated_at timestamptz not null default now()
 );
 
+-- Async embedding pipeline (EMBED_ASYNC=true): notes are inserted with status 'pending'
+-- and embedding = null; the backend worker fills them in. Safe to re-run on existing tables.
+alter table public.notes
+  add column if not exists embedding_status text not null default 'ready'
+    check (embedding_status in ('pending', 'ready', 'failed'));
+alter table public.notes
+  add column if not exists embedding_attempts smallint not null default 0;
+-- Worker lease and claim token: stamped when a worker claims a pending row, cleared when it
+-- writes the row back or an edit re-queues it. Rows claimed longer ago than the worker's
+-- CLAIM_LEASE_SECONDS can be claimed again.
+alter table public.notes
+  add column if not exists embedding_claimed_at timestamptz;
+
+-- Which provider:model produced each embedding (e.g. 'openai:text-embedding-3-small').
+-- Search only compares a query vector with rows from the same model; NULL means the
+-- backend's configured default model (rows written before this column existed).
+alter table public.notes
+  add column if not exists embedding_model text;
+
+-- Dedupe key: the shared URL canonicalized by backend/services/url_canonical.py (host case,
+-- default port, trailing slash, tracking parameters). Saving a link that's already stored
+-- updates that row. Existing rows stay NULL (not deduped) until
+-- `python -m backend.scripts.backfill_url_canonical` fills them.
+alter table public.notes
+  add column if not exists url_canonical text;
+
+-- Reduced-dimension ANN index (backend.scripts.fit_projection): the job fits a projection,
+-- stores it here, adds notes.embedding_compact vector(<dim>) with its own HNSW index and
+-- backfills it. embedding_compact_version records which projection produced each row.
+create table if not exists public.embedding_projections (
+  version serial primary key,
+  method text not null check (method in ('pca', 'truncate')),
+  source_model text not null,
+  input_dim int not null,
+  output_dim int not null,
+  mean bytea not null,        -- float32 little-endian, input_dim values
+  components bytea not null,  -- float32 little-endian, output_dim x input_dim row-major
+  active boolean not null default false,
+  created_at timestamptz not null default now()
+);
+alter table public.embedding_projections enable row level security;
+
+alter table public.notes
+  add column if not exists embedding_compact_version int;
+
+-- Full-text search over title, description and URL for EN/AR/TR, plus unstemmed 'simple'
+-- tokens so names and words in other languages still match. Keep the configs in sync with
+-- TEXT_SEARCH_CONFIGS in backend/services/retrieval.py. Adding it rewrites the table once.
+alter table public.notes
+  add column if not exists search_tsv tsvector generated always as (
+    setweight(to_tsvector('simple'::regconfig, coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('simple'::regconfig, coalesce(description, '')), 'B') ||
+    setweight(to_tsvector('simple'::regconfig, coalesce(url, '')), 'C') ||
+    setweight(to_tsvector('english'::regconfig, coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'B') ||
+    setweight(to_tsvector('arabic'::regconfig, coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('arabic'::regconfig, coalesce(description, '')), 'B') ||
+    setweight(to_tsvector('turkish'::regconfig, coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('turkish'::regconfig, coalesce(description, '')), 'B')
+  ) stored;
+
 -- updated_at trigger
+-- Embedding-only writes (background worker, projection and url_canonical backfills) are not
+-- user edits: keep updated_at.
 create or replace function public.set_updated_at() returns trigger as $$
 begin
+  if (new.url, new.title, new.description, new.tags)
+       is not distinct from (old.url, old.title, old.description, old.tags)
+     and (new.embedding_status, new.embedding_attempts, new.embedding_claimed_at,
+          new.embedding_compact_version, new.url_canonical)
+       is distinct from (old.embedding_status, old.embedding_attempts, old.embedding_claimed_at,
+          old.embedding_compact_version, old.url_canonical) then
+    return new;
+  end if;
   new.updated_at = now();
   return new;
 end;
@@ -32,14 +103,37 @@ before update on public.notes
 for each row execute function public.set_updated_at();
 
 -- Indexes
--- For ivfflat, consider running ANALYZE after populating the table to optimize lists.
-create index if not exists notes_embedding_ivfflat
-  on public.notes using ivfflat (embedding vector_cosine_ops) with (lists = 100);
+-- HNSW keeps recall as the table grows and needs no training data, unlike ivfflat.
+-- m/ef_construction below are the HNSW_M/HNSW_EF_CONSTRUCTION defaults; existing databases
+-- with notes_embedding_ivfflat migrate with `python -m backend.scripts.migrate_hnsw`.
+create index if not exists notes_embedding_hnsw
+  on public.notes using hnsw (embedding vector_cosine_ops) with (m = 16, ef_construction = 64);
+
+-- Optional compact ANN index (VECTOR_QUANTIZATION=halfvec|binary): search over-fetches from it
+-- and rescores against the full-precision column. Build one instead of notes_embedding_hnsw,
+-- preferably via `python -m backend.scripts.migrate_hnsw --quantization <mode>`:
+-- create index if not exists notes_embedding_hnsw_halfvec
+--   on public.notes using hnsw ((embedding::halfvec(1024)) halfvec_cosine_ops);
+-- create index if not exists notes_embedding_hnsw_binary
+--   on public.notes using hnsw ((binary_quantize(embedding)::bit(1024)) bit_hamming_ops);
+
+-- Worker queue scan: only pending rows are indexed
+create index if not exists notes_embedding_pending
+  on public.notes (created_at) where embedding_status = 'pending';
+
+-- Upsert target for create_note (ON CONFLICT (url_canonical)); NULLs don't conflict
+create unique index if not exists notes_url_canonical_key on public.notes (url_canonical);
+
+-- Note listing order and keyset pagination cursor: (updated_at, id) descending
+create index if not exists notes_updated_at_id on public.notes (updated_at desc, id desc);
 
 create index if not exists notes_tags_gin on public.notes using gin (tags);
 
-create index if not exists notes_text_trgm
-  on public.notes using gin ((coalesce(title,'') || ' ' || coalesce(description,'')) gin_trgm_ops);
+-- Keyword search (list_notes?q= and the hybrid keyword branch)
+create index if not exists notes_search_tsv_gin on public.notes using gin (search_tsv);
+
+-- Superseded by notes_search_tsv_gin; nothing queries the trigram expression any more
+drop index if exists public.notes_text_trgm;
 
 -- RLS (enabled; no policies so only service role can access)
 alter table public.notes enable row level security;